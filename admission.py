@@ -0,0 +1,174 @@
+from config import *
+import logging
+import math
+from typing import Any, Dict, Optional
+import metrics
+import workers
+from redis_store import get_redis, key
+from routing import LANES
+
+logger = logging.getLogger(__name__)
+
+PENDING_PAGES_KEY = key('admission', 'pending_pages')
+SAMPLES_KEY = key('admission', 'seconds_per_page')
+TASK_RECORD_TTL = 24 * 3600  # Sekunden, schützt vor verwaisten Einträgen
+INFLIGHT_TTL = 3600
+
+
+def _inflight_key(client_id: str) -> str:
+    return key('admission', 'inflight', client_id)
+
+
+def _task_key(task_id: str) -> str:
+    return key('admission', 'task', task_id)
+
+
+def seconds_per_page() -> float:
+    """Average processing time per page over the most recent tasks."""
+    samples = [float(sample) for sample in get_redis().lrange(SAMPLES_KEY, 0, -1)]
+    if not samples:
+        return ADMISSION_DEFAULT_SECONDS_PER_PAGE
+    return sum(samples) / len(samples)
+
+
+def pending_pages() -> int:
+    return max(int(get_redis().get(PENDING_PAGES_KEY) or 0), 0)
+
+
+def worker_slots() -> int:
+    """Documents processed in parallel: ADMISSION_WORKER_SLOTS or the live workers' concurrency."""
+    if ADMISSION_WORKER_SLOTS:
+        return ADMISSION_WORKER_SLOTS
+    return max(workers.capacity(LANES.values()), 1)
+
+
+def estimate_wait(pages: int = 0) -> float:
+    """Estimated seconds until a new document with the given page count is finished."""
+    return (pending_pages() + pages) * seconds_per_page() / worker_slots()
+
+
+def check(client_id: str, pages: int) -> Dict[str, Any]:
+    """
+    Decides whether a new upload may be enqueued.
+
+    Uploads are rejected when the estimated wait (queued pages times recent
+    per-page processing time) exceeds ADMISSION_MAX_WAIT_SECONDS, or when the
+    client already has its quota of documents in flight (CLIENT_MAX_INFLIGHT,
+    falling back to MAX_INFLIGHT_PER_CLIENT).
+
+    Returns:
+        dict: admitted, reason, estimated_wait and retry_after (seconds)
+    """
+    if not ADMISSION_CONTROL_ENABLED:
+        return {"admitted": True, "reason": None, "estimated_wait": None, "retry_after": None}
+
+    try:
+        per_page = seconds_per_page()
+        estimated_wait = estimate_wait(pages)
+        metrics.set_gauge('admission.estimated_wait_seconds', round(estimated_wait, 2))
+
+        max_inflight = CLIENT_MAX_INFLIGHT.get(client_id, MAX_INFLIGHT_PER_CLIENT)
+        if max_inflight > 0:
+            inflight = int(get_redis().get(_inflight_key(client_id)) or 0)
+            if inflight >= max_inflight:
+                logger.warning(f"Rejecting upload from {client_id}: {inflight} documents in flight")
+                metrics.incr('admission.rejected_quota')
+                return {
+                    "admitted": False,
+                    "reason": "quota",
+                    "estimated_wait": estimated_wait,
+                    "retry_after": max(1, math.ceil(per_page * pages))
+                }
+
+        # An idle system always accepts, even documents slower than the SLO
+        if estimated_wait > ADMISSION_MAX_WAIT_SECONDS and pending_pages() > 0:
+            logger.warning(f"Rejecting upload: estimated wait {estimated_wait:.0f}s exceeds "
+                           f"{ADMISSION_MAX_WAIT_SECONDS:.0f}s")
+            metrics.incr('admission.rejected_slo')
+            return {
+                "admitted": False,
+                "reason": "overloaded",
+                "estimated_wait": estimated_wait,
+                "retry_after": max(1, math.ceil(estimated_wait - ADMISSION_MAX_WAIT_SECONDS))
+            }
+
+    except Exception as e:
+        # Admission control must never take the API down with Redis
+        logger.error(f"Error in admission check, admitting upload: {e}")
+        metrics.incr('admission.errors')
+        return {"admitted": True, "reason": None, "estimated_wait": None, "retry_after": None}
+
+    metrics.incr('admission.admitted')
+    return {"admitted": True, "reason": None, "estimated_wait": estimated_wait, "retry_after": None}
+
+
+def register(task_id: str, client_id: str, pages: int) -> None:
+    """Accounts an enqueued document against the queue and the client's quota."""
+    try:
+        pipe = get_redis().pipeline()
+        pipe.incrby(PENDING_PAGES_KEY, pages)
+        pipe.incr(_inflight_key(client_id))
+        pipe.expire(_inflight_key(client_id), INFLIGHT_TTL)
+        pipe.hset(_task_key(task_id), mapping={"client_id": client_id, "pages": pages})
+        pipe.expire(_task_key(task_id), TASK_RECORD_TTL)
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"Error registering task {task_id} for admission control: {e}")
+
+
+def release(task_id: str, elapsed: Optional[float] = None) -> None:
+    """
+    Releases a finished document and records its per-page processing time.
+
+    Args:
+        task_id: ID of the finished task
+        elapsed: Wall time of the task in seconds, None if unknown
+    """
+    try:
+        client = get_redis()
+        record = client.hgetall(_task_key(task_id))
+        if not record:
+            return
+        client_id = record[b'client_id'].decode()
+        pages = int(record[b'pages'])
+
+        pipe = client.pipeline()
+        pipe.decrby(PENDING_PAGES_KEY, pages)
+        pipe.decr(_inflight_key(client_id))
+        pipe.delete(_task_key(task_id))
+        if elapsed is not None and pages > 0:
+            pipe.lpush(SAMPLES_KEY, elapsed / pages)
+            pipe.ltrim(SAMPLES_KEY, 0, ADMISSION_SAMPLE_SIZE - 1)
+        pending_pages, *_ = pipe.execute()
+
+        # Counter can drift below zero after a queue purge
+        if pending_pages < 0:
+            client.set(PENDING_PAGES_KEY, 0)
+        metrics.set_gauge('admission.pending_pages', max(pending_pages, 0))
+    except Exception as e:
+        logger.error(f"Error releasing task {task_id} from admission control: {e}")
+
+
+def reset() -> None:
+    """Clears the queued page count and all per-client quotas, e.g. after the queues were purged."""
+    try:
+        client = get_redis()
+        client.set(PENDING_PAGES_KEY, 0)
+        for name in client.scan_iter(match=key('admission', 'inflight', '*')):
+            client.delete(name)
+        for name in client.scan_iter(match=key('admission', 'task', '*')):
+            client.delete(name)
+        metrics.set_gauge('admission.pending_pages', 0)
+    except Exception as e:
+        logger.error(f"Error resetting admission control: {e}")
+
+
+def state() -> Dict[str, Any]:
+    """Current inputs of the admission decision, for the metrics endpoint."""
+    return {
+        "pending_pages": pending_pages(),
+        "seconds_per_page": round(seconds_per_page(), 3),
+        "worker_slots": worker_slots(),
+        "estimated_wait_seconds": round(estimate_wait(), 2),
+        "max_wait_seconds": ADMISSION_MAX_WAIT_SECONDS
+    }
@@ -0,0 +1,489 @@
+from config import *
+import json
+import logging
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+import fitz  # PyMuPDF
+from routing import classify_document
+import admission
+import coalescing
+import fair_queue
+import results
+import tracing
+import webhooks
+from auth import is_admin
+
+logger = logging.getLogger(__name__)
+
+PDF_MAGIC = b'%PDF-'
+# PDF readers accept leading bytes before the header within the first KiB
+PDF_HEADER_WINDOW = 1024
+
+
+def has_pdf_header(head: bytes) -> bool:
+    """Checks the first bytes of an upload for the PDF header."""
+    return PDF_MAGIC in head[:PDF_HEADER_WINDOW]
+
+
+def missing_file_error() -> Dict[str, Any]:
+    return {
+        "error": "No file provided",
+        "message": "Please select a PDF file to upload.",
+        "details": {
+            "suggestion": "Make sure you have selected a PDF file before clicking upload."
+        }
+    }
+
+
+def invalid_file_type_error(filename: str) -> Dict[str, Any]:
+    return {
+        "error": "Invalid file type",
+        "message": "The uploaded file must be a PDF document.",
+        "details": {
+            "filename": filename,
+            "suggestion": "Please select a file with .pdf extension."
+        }
+    }
+
+
+def file_too_large_error(size: int) -> Dict[str, Any]:
+    return {
+        "error": "PDF exceeds maximum file size",
+        "message": f"The uploaded file exceeds the maximum allowed size of {MAX_UPLOAD_BYTES} bytes.",
+        "details": {
+            "received_bytes": size,
+            "max_bytes": MAX_UPLOAD_BYTES,
+            "suggestion": "Please compress or split the document and try again."
+        }
+    }
+
+
+def invalid_pdf_error(technical_error: str) -> Dict[str, Any]:
+    return {
+        "error": "Invalid PDF file",
+        "message": "The uploaded file appears to be corrupted or is not a valid PDF.",
+        "details": {
+            "technical_error": technical_error,
+            "suggestion": "Please ensure the file is a valid PDF document and try again."
+        }
+    }
+
+
+@tracing.traced('upload.validate')
+def check_pdf_file(path: str) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    Checks that a spooled upload is a readable PDF within the page limit
+    and classifies it for queue routing.
+
+    Returns:
+        Tuple of (document_profile, error). Exactly one of them is None.
+    """
+    try:
+        with open(path, 'rb') as f:
+            if not has_pdf_header(f.read(PDF_HEADER_WINDOW)):
+                logger.error("Upload has no PDF header")
+                return None, invalid_pdf_error("File does not contain a PDF header")
+        doc = fitz.open(path)
+        page_count = len(doc)
+        profile = classify_document(doc) if page_count <= MAX_PDF_PAGES else None
+        doc.close()
+    except Exception as e:
+        logger.error(f"Error checking PDF page count: {str(e)}")
+        return None, invalid_pdf_error(str(e))
+
+    if page_count > MAX_PDF_PAGES:
+        logger.error(f"PDF has too many pages: {page_count}")
+        return None, {
+            "error": "PDF exceeds maximum page limit",
+            "message": f"The PDF file contains {page_count} pages, but the maximum allowed is {MAX_PDF_PAGES} pages.",
+            "details": {
+                "current_pages": page_count,
+                "max_pages": MAX_PDF_PAGES,
+                "suggestion": "Please split the document into smaller parts or contact support if you need to process larger documents."
+            }
+        }
+
+    return profile, None
+
+
+def parse_preferences(raw: Optional[str]) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    Parses the anonymization preferences form field and fills in defaults.
+
+    Returns:
+        Tuple of (preferences, error). Exactly one of them is None.
+    """
+    try:
+        preferences = json.loads(raw or '{}')
+    except json.JSONDecodeError:
+        logger.error("Invalid JSON in preferences")
+        return None, {
+            "error": "Invalid preferences data",
+            "message": "The anonymization preferences contain invalid data.",
+            "details": {
+                "suggestion": "Please try again or contact support if the problem persists."
+            }
+        }
+
+    if not isinstance(preferences, dict):
+        logger.error("Preferences must be a JSON object")
+        return None, {
+            "error": "Invalid preferences format",
+            "message": "The anonymization preferences are not in the correct format.",
+            "details": {
+                "suggestion": "Please try again or contact support if the problem persists."
+            }
+        }
+
+    # Log frontend selection
+    logger.info("Frontend selection for anonymization:")
+    logger.info("-" * 80)
+    logger.info("Selected options:")
+    for option_id, is_enabled in preferences.items():
+        if option_id in ANONYMIZATION_OPTIONS:
+            status = "ENABLED" if is_enabled else "disabled"
+            logger.info(f"  - {ANONYMIZATION_OPTIONS[option_id]['label']}: {status}")
+        else:
+            logger.warning(f"  - Unknown option received: {option_id}")
+
+    # Log options using defaults
+    missing_options = set(ANONYMIZATION_OPTIONS.keys()) - set(preferences.keys())
+    if missing_options:
+        logger.info("\nOptions using default values:")
+        for option_id in missing_options:
+            default_value = ANONYMIZATION_OPTIONS[option_id]['default']
+            status = "ENABLED" if default_value else "disabled"
+            logger.info(f"  - {ANONYMIZATION_OPTIONS[option_id]['label']}: {status} (default)")
+            preferences[option_id] = default_value
+    logger.info("-" * 80)
+
+    return preferences, None
+
+
+def parse_anonymization_job(form, pdf_data: bytes, profile: Dict[str, Any]):
+    """
+    Builds the task arguments for process_pdf and analyze_pdf.
+
+    Returns:
+        Tuple of (task_args, profile, error). task_args is None on error.
+    """
+    preferences, error = parse_preferences(form.get('preferences'))
+    if error:
+        return None, profile, error
+    return (pdf_data, preferences), profile, None
+
+
+def invalid_redaction_targets_error(message: str) -> Dict[str, Any]:
+    return {
+        "error": "Invalid redaction targets",
+        "message": message,
+        "details": {
+            "suggestion": "Send 'terms' as a JSON list of strings and/or 'rectangles' as a JSON object "
+                          "mapping page numbers (starting at 1) to lists of [x0, y0, x1, y1]."
+        }
+    }
+
+
+def parse_redaction_job(form, pdf_data: bytes, profile: Dict[str, Any]):
+    """
+    Builds the task arguments for redact_pdf from the 'terms' and 'rectangles' fields.
+
+    Caller-supplied redactions need no LLM calls, so the job always runs on
+    the fast lane and is not counted as queued LLM pages by admission control.
+
+    Returns:
+        Tuple of (task_args, profile, error). task_args is None on error.
+    """
+    try:
+        terms = json.loads(form.get('terms') or '[]')
+        rectangles = json.loads(form.get('rectangles') or '{}')
+    except json.JSONDecodeError as e:
+        logger.error(f"Invalid JSON in redaction targets: {e}")
+        return None, profile, invalid_redaction_targets_error("The redaction targets contain invalid JSON.")
+
+    if not isinstance(terms, list) or not all(isinstance(term, str) for term in terms):
+        return None, profile, invalid_redaction_targets_error("'terms' must be a list of strings.")
+    terms = [term.strip() for term in terms if term.strip()]
+
+    if not isinstance(rectangles, dict):
+        return None, profile, invalid_redaction_targets_error("'rectangles' must be a JSON object.")
+    page_rectangles = {}
+    for page_number, rects in rectangles.items():
+        try:
+            page_index = int(page_number) - 1
+        except ValueError:
+            return None, profile, invalid_redaction_targets_error(f"Invalid page number: {page_number}")
+        if not 0 <= page_index < profile['page_count']:
+            return None, profile, invalid_redaction_targets_error(
+                f"Page {page_number} does not exist, the document has {profile['page_count']} pages."
+            )
+        if not isinstance(rects, list) or not all(
+            isinstance(rect, list) and len(rect) == 4 and all(isinstance(c, (int, float)) for c in rect)
+            for rect in rects
+        ):
+            return None, profile, invalid_redaction_targets_error(
+                f"Rectangles for page {page_number} must be lists of [x0, y0, x1, y1]."
+            )
+        # Keys become strings in JSON anyway, keep them as 0-based page indices
+        page_rectangles[str(page_index)] = rects
+
+    if not terms and not page_rectangles:
+        return None, profile, invalid_redaction_targets_error("Please provide 'terms' and/or 'rectangles'.")
+
+    profile = {**profile, 'lane': 'fast', 'queue': FAST_QUEUE, 'admission_pages': 0}
+    return (pdf_data, terms, page_rectangles), profile, None
+
+
+def parse_options(form) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    Reads the optional processing options from the upload form fields.
+
+    Returns:
+        Tuple of (options, error). Exactly one of them is None.
+    """
+    options = {}
+
+    save_profile = form.get('save_profile')
+    if save_profile:
+        if save_profile not in PDF_SAVE_PROFILES:
+            logger.error(f"Unknown save profile: {save_profile}")
+            return None, {
+                "error": "Invalid save profile",
+                "message": f"The save profile '{save_profile}' does not exist.",
+                "details": {
+                    "available_profiles": sorted(PDF_SAVE_PROFILES),
+                    "suggestion": "Please choose one of the available save profiles."
+                }
+            }
+        options['save_profile'] = save_profile
+
+    callback_url = form.get('callback_url')
+    if callback_url:
+        error = webhooks.check_callback_url(callback_url)
+        if error:
+            logger.error(f"Rejected callback URL {callback_url}: {error}")
+            return None, {
+                "error": "Invalid callback URL",
+                "message": error,
+                "details": {
+                    "callback_url": callback_url,
+                    "suggestion": "Please provide an absolute http(s) URL that accepts POST requests."
+                }
+            }
+        options['callback_url'] = callback_url
+
+    # Profiled run, see profiling.py; only honoured for admin clients
+    if form.get('profile', '').lower() in ('1', 'true', 'yes'):
+        options['profile'] = True
+
+    return options, None
+
+
+def admin_required_error() -> Dict[str, Any]:
+    return {
+        "error": "Forbidden",
+        "message": "This operation is restricted to admin clients.",
+        "details": {
+            "suggestion": "Use a token of a client listed in ADMIN_CLIENTS."
+        }
+    }
+
+
+def coalesced_response(job: Dict[str, Any]) -> Dict[str, Any]:
+    coalescing.record_coalesced(job)
+    return {
+        "task_id": job['task_id'],
+        "lane": job['lane'],
+        "coalesced": True,
+        "message": "An identical upload is already being processed. Returning its task."
+    }
+
+
+@tracing.traced('upload.enqueue')
+def submit_upload(task, task_args: tuple, options: Dict[str, Any], profile: Dict[str, Any],
+                  client_id: str) -> Tuple[Dict[str, Any], int, Dict[str, str]]:
+    """
+    Runs admission control and enqueues a validated upload on its lane.
+
+    Re-uploads of a job that is still queued or running (same PDF, arguments,
+    options and client) get the existing task ID instead of a second run.
+    With FAIR_QUEUING_ENABLED the job goes through the per-client fair queue
+    instead of straight to Celery.
+
+    Args:
+        task: Celery task to start
+        task_args: Positional task arguments, starting with the PDF bytes
+        options: Parsed processing options
+        profile: Document profile from check_pdf_file
+        client_id: Identity resolved by security.authenticate
+
+    Returns:
+        Tuple of (response_payload, http_status, extra_headers)
+    """
+    if options.get('profile') and not is_admin(client_id):
+        logger.error(f"Rejected profiled upload from non-admin client {client_id}")
+        return admin_required_error(), 403, {}
+
+    # An identical job that is still queued or running answers this upload
+    job_fingerprint = None
+    if COALESCING_ENABLED:
+        job_fingerprint = coalescing.fingerprint(task.name, task_args, options, client_id)
+        job = coalescing.find(job_fingerprint)
+        if job:
+            return coalesced_response(job), 200, {}
+
+    admission_pages = profile.get('admission_pages', profile['page_count'])
+    decision = admission.check(client_id, admission_pages)
+    if not decision['admitted']:
+        return {
+            "error": "Too many requests",
+            "message": "The service is currently at capacity. Please retry later.",
+            "details": {
+                "reason": decision['reason'],
+                "estimated_wait_seconds": round(decision['estimated_wait'], 1),
+                "retry_after_seconds": decision['retry_after'],
+                "suggestion": "Retry after the time given in the Retry-After header."
+            }
+        }, 429, {"Retry-After": str(decision['retry_after'])}
+
+    # Account the document before it is enqueued, so a fast worker cannot
+    # release it before it was registered.
+    task_id = str(uuid.uuid4())
+    if job_fingerprint:
+        job = coalescing.claim(job_fingerprint, task_id, profile['lane'])
+        if job:
+            return coalesced_response(job), 200, {}
+    admission.register(task_id, client_id, admission_pages)
+    try:
+        fair_queued = FAIR_QUEUING_ENABLED and fair_queue.enqueue(
+            task_id, task.name, task_args, {'options': options}, client_id,
+            profile['lane'], profile['queue'], max(profile.get('estimated_cost', profile['page_count']), 1)
+        ) is not None
+        if fair_queued:
+            fair_queue.dispatch(profile['lane'])
+        else:
+            task.apply_async(args=task_args, kwargs={'options': options},
+                             queue=profile['queue'], task_id=task_id)
+    except Exception:
+        admission.release(task_id)
+        coalescing.release(task_id)
+        raise
+    tracing.annotate(task_id=task_id, lane=profile['lane'], client_id=client_id, pages=profile['page_count'])
+    logger.info(f"Started task with ID: {task_id} on {profile['lane']} lane")
+
+    return {
+        "task_id": task_id,
+        "lane": profile['lane'],
+        "message": "PDF upload successful. Processing started."
+    }, 200, {}
+
+
+def lookup_task_status(task) -> Tuple[Dict[str, Any], Optional[bytes]]:
+    """
+    Resolves the state of a processing task.
+
+    Finished tasks are answered from the small metadata record in the result
+    store; the document itself is only loaded when it is handed out, which
+    also marks it as consumed.
+
+    Args:
+        task: Celery AsyncResult of the processing task
+
+    Returns:
+        Tuple of (status_payload, result_bytes). result_bytes is only set when
+        the result is ready for download; status_payload then names its
+        content_type (the anonymized PDF, or JSON findings for analyze jobs).
+    """
+    metadata = results.get_metadata(task.id)
+    if metadata is not None:
+        if metadata['status'] == 'Failed':
+            return {
+                "status": "Failed",
+                "error": metadata.get('message', 'Unknown error occurred')
+            }, None
+
+        pdf_data = results.load_payload(task.id, metadata)
+        if pdf_data is None:
+            return {
+                "status": "Expired",
+                "message": "The result has expired or was already downloaded.",
+                "total_pages": metadata.get('total_pages', 0)
+            }, None
+        results.mark_consumed(task.id)
+        return {
+            "status": "Completed",
+            "sha256": metadata['sha256'],
+            "content_type": metadata.get('content_type', 'application/pdf')
+        }, pdf_data
+
+    # If task is not ready yet
+    if not task.ready():
+        # Get progress information if available
+        if task.state == 'PROGRESS':
+            progress = task.info
+            return {
+                "status": "Processing",
+                "current_page": progress.get('current_page', 0),
+                "total_pages": progress.get('total_pages', 0)
+            }, None
+        return {"status": "Processing"}, None
+
+    # Finished without a metadata record: the task raised, or its record was
+    # never written (result store unavailable) or has expired since
+    result = task.result if task.successful() else None
+    if not task.successful() or (isinstance(result, dict) and result.get('status') == 'Failed'):
+        error = result.get('message') if isinstance(result, dict) else str(task.result)
+        return {
+            "status": "Failed",
+            "error": error or 'Unknown error occurred'
+        }, None
+
+    return {
+        "status": "Expired",
+        "message": "The result has expired or was already downloaded.",
+        "total_pages": result.get('total_pages', 0) if isinstance(result, dict) else 0
+    }, None
+
+
+def lookup_task_metadata(task) -> Dict[str, Any]:
+    """Returns status and result metadata of a task without loading the document."""
+    metadata = results.get_metadata(task.id)
+    if metadata is not None:
+        return metadata
+    if task.state == 'PROGRESS':
+        progress = task.info
+        return {
+            "status": "Processing",
+            "current_page": progress.get('current_page', 0),
+            "total_pages": progress.get('total_pages', 0)
+        }
+    if task.state == 'SUCCESS':
+        return {"status": "Completed"}
+    if task.state == 'FAILURE':
+        return {"status": "Failed"}
+    return {"status": "Processing"}
+
+
+def lookup_profile(task_id: str) -> Tuple[Dict[str, Any], int]:
+    """
+    Loads the profiling report of a task for the admin endpoint.
+
+    Returns:
+        Tuple of (report or error payload, http_status)
+    """
+    report = results.get_profile(task_id)
+    if report is None:
+        return {
+            "error": "Profile not found",
+            "message": f"No profile is stored for task {task_id}.",
+            "details": {
+                "suggestion": "Upload with profile=true as an admin client, or raise PROFILE_SAMPLE_RATE. "
+                              "Profiles expire together with the task result."
+            }
+        }, 404
+    return report, 200
+
+
+def download_name() -> str:
+    return f'anonymized_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
@@ -2,7 +2,7 @@ from config import *
 import io
 from datetime import datetime
 import logging
-from flask import Flask, request, send_file, jsonify
+from flask import Flask, request, send_file, jsonify, g
 from flask_cors import CORS
 import json
 from datetime import datetime
@@ -10,8 +10,19 @@ from typing import List, Dict, Any, Tuple
 import fitz  # PyMuPDF
 import tempfile
 from celery_app import celery
-from tasks import process_pdf
-from security import require_token
+from task_client import process_pdf, analyze_pdf, redact_pdf, get_result
+from security import require_token, is_admin
+from routing import queue_depths
+import admission
+import fair_queue
+import metrics
+import profiling
+import tracing
+from api_helpers import (
+    check_pdf_file, parse_anonymization_job, parse_redaction_job, parse_options, submit_upload, lookup_task_status, lookup_task_metadata,
+    download_name, lookup_profile, admin_required_error,
+    missing_file_error, invalid_file_type_error, file_too_large_error
+)
 # Configure logging
 logging.basicConfig(
     level=LOG_LEVEL,
@@ -21,34 +32,45 @@ logger = logging.getLogger(__name__)
 
 # Initialize Flask app
 app = Flask(__name__)
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
 CORS(app, expose_headers=['Content-Type', 'Authorization'])
 
+@app.errorhandler(413)
+def request_too_large(e):
+    """Reject oversized uploads based on Content-Length before reading the body."""
+    logger.error(f"Upload rejected, body exceeds {MAX_UPLOAD_BYTES} bytes")
+    return jsonify(file_too_large_error(request.content_length or 0)), 413
+
 @app.route('/upload', methods=['POST'])
 @require_token
 def upload_pdf():
     """Handle PDF upload and start processing."""
+    return handle_upload(process_pdf)
+
+@app.route('/analyze', methods=['POST'])
+@require_token
+def analyze_pdf_upload():
+    """Handle PDF upload and start an analysis that only returns findings as JSON."""
+    return handle_upload(analyze_pdf)
+
+@app.route('/redact', methods=['POST'])
+@require_token
+def redact_pdf_upload():
+    """Handle PDF upload and redact caller-supplied terms and rectangles without LLM calls."""
+    return handle_upload(redact_pdf, parse_redaction_job)
+
+@tracing.traced('upload')
+def handle_upload(task, parse_job=parse_anonymization_job):
+    """Validate an uploaded PDF and start the given Celery task for it."""
     try:
         if 'file' not in request.files:
             logger.error("No file provided in request")
-            return jsonify({
-                "error": "No file provided",
-                "message": "Please select a PDF file to upload.",
-                "details": {
-                    "suggestion": "Make sure you have selected a PDF file before clicking upload."
-                }
-            }), 400
+            return jsonify(missing_file_error()), 400
         
         file = request.files['file']
         if not file.filename.endswith('.pdf'):
             logger.error(f"Invalid file type: {file.filename}")
-            return jsonify({
-                "error": "Invalid file type",
-                "message": "The uploaded file must be a PDF document.",
-                "details": {
-                    "filename": file.filename,
-                    "suggestion": "Please select a file with .pdf extension."
-                }
-            }), 400
+            return jsonify(invalid_file_type_error(file.filename)), 400
         
         # Read the PDF file once
         pdf_data = file.read()
@@ -59,87 +81,22 @@ def upload_pdf():
             temp_file.write(pdf_data)
             temp_file.flush()
             
-            try:
-                doc = fitz.open(temp_file.name)
-                page_count = len(doc)
-                doc.close()
-                
-                if page_count > MAX_PDF_PAGES:
-                    logger.error(f"PDF has too many pages: {page_count}")
-                    return jsonify({
-                        "error": "PDF exceeds maximum page limit",
-                        "message": f"The PDF file contains {page_count} pages, but the maximum allowed is {MAX_PDF_PAGES} pages.",
-                        "details": {
-                            "current_pages": page_count,
-                            "max_pages": MAX_PDF_PAGES,
-                            "suggestion": "Please split the document into smaller parts or contact support if you need to process larger documents."
-                        }
-                    }), 400
-                    
-            except Exception as e:
-                logger.error(f"Error checking PDF page count: {str(e)}")
-                return jsonify({
-                    "error": "Invalid PDF file",
-                    "message": "The uploaded file appears to be corrupted or is not a valid PDF.",
-                    "details": {
-                        "technical_error": str(e),
-                        "suggestion": "Please ensure the file is a valid PDF document and try again."
-                    }
-                }), 400
+            profile, error = check_pdf_file(temp_file.name)
+            if error:
+                return jsonify(error), 400
         
-        # Get preferences from the request
-        try:
-            preferences = json.loads(request.form.get('preferences', '{}'))
-            if not isinstance(preferences, dict):
-                logger.error("Preferences must be a JSON object")
-                return jsonify({
-                    "error": "Invalid preferences format",
-                    "message": "The anonymization preferences are not in the correct format.",
-                    "details": {
-                        "suggestion": "Please try again or contact support if the problem persists."
-                    }
-                }), 400
-            
-            # Log frontend selection
-            logger.info("Frontend selection for anonymization:")
-            logger.info("-" * 80)
-            logger.info("Selected options:")
-            for option_id, is_enabled in preferences.items():
-                if option_id in ANONYMIZATION_OPTIONS:
-                    status = "ENABLED" if is_enabled else "disabled"
-                    logger.info(f"  - {ANONYMIZATION_OPTIONS[option_id]['label']}: {status}")
-                else:
-                    logger.warning(f"  - Unknown option received: {option_id}")
-            
-            # Log options using defaults
-            missing_options = set(ANONYMIZATION_OPTIONS.keys()) - set(preferences.keys())
-            if missing_options:
-                logger.info("\nOptions using default values:")
-                for option_id in missing_options:
-                    default_value = ANONYMIZATION_OPTIONS[option_id]['default']
-                    status = "ENABLED" if default_value else "disabled"
-                    logger.info(f"  - {ANONYMIZATION_OPTIONS[option_id]['label']}: {status} (default)")
-                    preferences[option_id] = default_value
-            logger.info("-" * 80)
-            
-        except json.JSONDecodeError:
-            logger.error("Invalid JSON in preferences")
-            return jsonify({
-                "error": "Invalid preferences data",
-                "message": "The anonymization preferences contain invalid data.",
-                "details": {
-                    "suggestion": "Please try again or contact support if the problem persists."
-                }
-            }), 400
+        # Get preferences or redaction targets from the request
+        task_args, profile, error = parse_job(request.form, pdf_data, profile)
+        if error:
+            return jsonify(error), 400
         
-        # Start Celery task
-        task = process_pdf.delay(pdf_data, preferences)
-        logger.info(f"Started task with ID: {task.id}")
+        options, error = parse_options(request.form)
+        if error:
+            return jsonify(error), 400
         
-        return jsonify({
-            "task_id": task.id,
-            "message": "PDF upload successful. Processing started."
-        })
+        # Start Celery task
+        payload, status_code, headers = submit_upload(task, task_args, options, profile, g.client_id)
+        return jsonify(payload), status_code, headers
     
     except Exception as e:
         logger.error(f"Error in upload_pdf: {str(e)}")
@@ -158,49 +115,28 @@ def upload_pdf():
 def get_status(task_id):
     """Get the status of a processing task."""
     try:
-        task = process_pdf.AsyncResult(task_id)
+        status, result_data = lookup_task_status(get_result(task_id))
         
-        # If task is not ready yet
-        if not task.ready():
-            # Get progress information if available
-            if task.state == 'PROGRESS':
-                progress = task.info
-                return jsonify({
-                    "status": "Processing",
-                    "current_page": progress.get('current_page', 0),
-                    "total_pages": progress.get('total_pages', 0)
-                })
-            return jsonify({"status": "Processing"})
-        
-        # Get the result
-        result = task.get()
-        
-        # If task failed
-        if result.get('status') == 'Failed':
-            return jsonify({
-                "status": "Failed",
-                "error": result.get('message', 'Unknown error occurred')
-            })
+        # Findings of an analyze job are returned as they are
+        if result_data is not None and status.get('content_type') == 'application/json':
+            return app.response_class(result_data, mimetype='application/json')
         
         # If task completed successfully and has PDF data
-        if result.get('status') == 'Completed' and 'pdf_data' in result:
-            pdf_buffer = io.BytesIO(result['pdf_data'])
+        if result_data is not None:
+            pdf_buffer = io.BytesIO(result_data)
             response = send_file(
                 pdf_buffer,
                 mimetype='application/pdf',
                 as_attachment=True,
-                download_name=f'anonymized_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
+                download_name=download_name()
             )
             # Add CORS headers for file streaming
-            response.headers['Access-Control-Expose-Headers'] = 'Content-Disposition'
+            response.headers['Access-Control-Expose-Headers'] = 'Content-Disposition, X-Content-SHA256'
+            if 'sha256' in status:
+                response.headers['X-Content-SHA256'] = status['sha256']
             return response
         
-        # If task completed but no PDF data (shouldn't happen normally)
-        return jsonify({
-            "status": "Completed",
-            "message": result.get('message', 'Processing completed but no PDF data found'),
-            "total_pages": result.get('total_pages', 0)
-        })
+        return jsonify(status)
         
     except Exception as e:
         logger.error(f"Error in get_status: {str(e)}")
@@ -210,6 +146,49 @@ def get_status(task_id):
             "error": str(e)
         }), 500
 
+@app.route('/metadata/<task_id>')
+@require_token
+def get_metadata(task_id):
+    """Get status, page count, size and checksum of a task without downloading the result."""
+    try:
+        return jsonify(lookup_task_metadata(get_result(task_id)))
+    except Exception as e:
+        logger.error(f"Error in get_metadata: {str(e)}")
+        return jsonify({
+            "status": "Failed",
+            "error": str(e)
+        }), 500
+
+@app.route('/admin/profiles/<task_id>')
+@require_token
+def get_profile(task_id):
+    """Return the profile of a profiled task run; ?format=collapsed for flame graph tools."""
+    if not is_admin(g.client_id):
+        return jsonify(admin_required_error()), 403
+    try:
+        report, status_code = lookup_profile(task_id)
+        if status_code == 200 and request.args.get('format') == 'collapsed':
+            return profiling.collapsed_stacks(report), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+        return jsonify(report), status_code
+    except Exception as e:
+        logger.error(f"Error in get_profile: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/metrics')
+@require_token
+def get_metrics():
+    """Report queue depth per lane, admission and fair-queue state and shared counters."""
+    try:
+        return jsonify({
+            "queues": queue_depths(celery),
+            "admission": admission.state(),
+            "fair_queue": fair_queue.state(),
+            "counters": metrics.snapshot()
+        })
+    except Exception as e:
+        logger.error(f"Error in get_metrics: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 if __name__ == '__main__':
     app.run(
         host=FLASK_HOST,
@@ -0,0 +1,288 @@
+from config import *
+import asyncio
+import logging
+import tempfile
+from aiohttp import web
+from celery_app import celery
+from task_client import process_pdf, analyze_pdf, redact_pdf, get_result
+from routing import queue_depths
+import admission
+import fair_queue
+import metrics
+import profiling
+import tracing
+from auth import authenticate, is_admin
+from api_helpers import (
+    PDF_HEADER_WINDOW, has_pdf_header, check_pdf_file, parse_anonymization_job, parse_redaction_job, parse_options, submit_upload, lookup_task_status, lookup_task_metadata,
+    download_name, lookup_profile, admin_required_error,
+    missing_file_error, invalid_file_type_error, file_too_large_error, invalid_pdf_error
+)
+
+# Configure logging
+logging.basicConfig(
+    level=LOG_LEVEL,
+    format=LOG_FORMAT
+)
+logger = logging.getLogger(__name__)
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+    'Access-Control-Expose-Headers': 'Content-Type, Authorization, Content-Disposition, X-Content-SHA256'
+}
+
+# Small text fields accepted next to the file
+FORM_FIELDS = ('preferences', 'save_profile', 'terms', 'rectangles', 'callback_url', 'profile')
+
+
+class UploadError(Exception):
+    """Raised while streaming an upload; carries the JSON error response."""
+
+    def __init__(self, payload, status=400):
+        super().__init__(payload.get('error'))
+        self.payload = payload
+        self.status = status
+
+
+def json_response(payload, status=200):
+    return web.json_response(payload, status=status, headers=CORS_HEADERS)
+
+
+@web.middleware
+async def auth_middleware(request, handler):
+    if request.method == 'OPTIONS':
+        return web.Response(headers=CORS_HEADERS)
+    client_id, error = authenticate(request.headers.get('Authorization'))
+    if error:
+        return json_response({"error": error}, status=401)
+    request['client_id'] = client_id
+    return await handler(request)
+
+
+async def spool_file_part(part, temp_file):
+    """
+    Streams a multipart file part to disk chunk by chunk.
+
+    The size limit and the PDF header are checked while the body is still
+    arriving, so oversized or non-PDF uploads are rejected without reading
+    the rest of the request. Like check_pdf_file, the header may appear
+    anywhere in the first PDF_HEADER_WINDOW bytes.
+    """
+    size = 0
+    # The first PDF_HEADER_WINDOW bytes, until the header has been checked
+    head = b''
+    while True:
+        chunk = await part.read_chunk(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        if head is not None:
+            head += chunk[:PDF_HEADER_WINDOW]
+            if len(head) >= PDF_HEADER_WINDOW:
+                if not has_pdf_header(head):
+                    raise UploadError(invalid_pdf_error("File does not contain a PDF header"))
+                head = None
+        size += len(chunk)
+        if size > MAX_UPLOAD_BYTES:
+            raise UploadError(file_too_large_error(size), status=413)
+        await asyncio.to_thread(temp_file.write, chunk)
+    if head is not None and not has_pdf_header(head):
+        raise UploadError(invalid_pdf_error("File does not contain a PDF header"))
+    await asyncio.to_thread(temp_file.flush)
+    return size
+
+
+async def read_upload(request, temp_file):
+    """Reads the multipart body and returns (filename, size, form fields)."""
+    filename = None
+    size = 0
+    fields = {}
+
+    reader = await request.multipart()
+    while True:
+        part = await reader.next()
+        if part is None:
+            break
+        if part.name == 'file':
+            filename = part.filename or ''
+            if not filename.endswith('.pdf'):
+                logger.error(f"Invalid file type: {filename}")
+                raise UploadError(invalid_file_type_error(filename))
+            size = await spool_file_part(part, temp_file)
+        elif part.name in FORM_FIELDS:
+            fields[part.name] = await part.text()
+        else:
+            # Skip unknown fields without buffering them
+            while await part.read_chunk(UPLOAD_CHUNK_SIZE):
+                pass
+
+    if filename is None:
+        logger.error("No file provided in request")
+        raise UploadError(missing_file_error())
+
+    return filename, size, fields
+
+
+async def upload_pdf(request):
+    """Handle PDF upload and start processing."""
+    return await handle_upload(request, process_pdf)
+
+
+async def analyze_pdf_upload(request):
+    """Handle PDF upload and start an analysis that only returns findings as JSON."""
+    return await handle_upload(request, analyze_pdf)
+
+
+async def redact_pdf_upload(request):
+    """Handle PDF upload and redact caller-supplied terms and rectangles without LLM calls."""
+    return await handle_upload(request, redact_pdf, parse_redaction_job)
+
+
+@tracing.traced('upload')
+async def handle_upload(request, task, parse_job=parse_anonymization_job):
+    """Stream an uploaded PDF to disk, validate it and start the given Celery task."""
+    if request.content_length and request.content_length > MAX_UPLOAD_BYTES:
+        logger.error(f"Upload rejected, body exceeds {MAX_UPLOAD_BYTES} bytes")
+        return json_response(file_too_large_error(request.content_length), status=413)
+
+    try:
+        # Limit the number of uploads spooled at the same time; excess clients
+        # wait here instead of exhausting disk and file descriptors.
+        async with request.app['upload_slots']:
+            with tempfile.NamedTemporaryFile(suffix='.pdf', dir=UPLOAD_TMP_DIR, delete=True) as temp_file:
+                try:
+                    filename, size, fields = await read_upload(request, temp_file)
+                except UploadError as e:
+                    return json_response(e.payload, status=e.status)
+                logger.info(f"Spooled PDF file {filename} of size: {size} bytes")
+
+                profile, error = await asyncio.to_thread(check_pdf_file, temp_file.name)
+                if error:
+                    return json_response(error, status=400)
+
+                with open(temp_file.name, 'rb') as spooled:
+                    pdf_data = await asyncio.to_thread(spooled.read)
+
+        task_args, profile, error = parse_job(fields, pdf_data, profile)
+        if error:
+            return json_response(error, status=400)
+
+        # The callback URL check resolves the host; keep DNS off the event loop
+        options, error = await asyncio.to_thread(parse_options, fields)
+        if error:
+            return json_response(error, status=400)
+
+        # Start Celery task
+        payload, status_code, headers = await asyncio.to_thread(
+            submit_upload, task, task_args, options, profile, request['client_id']
+        )
+        return web.json_response(payload, status=status_code, headers={**CORS_HEADERS, **headers})
+
+    except Exception as e:
+        logger.error(f"Error in upload_pdf: {str(e)}")
+        logger.exception("Full traceback:")
+        return json_response({
+            "error": "Internal server error",
+            "message": "An unexpected error occurred while processing your request.",
+            "details": {
+                "technical_error": str(e),
+                "suggestion": "Please try again later or contact support if the problem persists."
+            }
+        }, status=500)
+
+
+async def get_status(request):
+    """Get the status of a processing task without blocking the event loop on Redis."""
+    task_id = request.match_info['task_id']
+    try:
+        status, result_data = await asyncio.to_thread(
+            lookup_task_status, get_result(task_id)
+        )
+
+        if result_data is not None and status.get('content_type') == 'application/json':
+            return web.Response(body=result_data, content_type='application/json', headers=CORS_HEADERS)
+
+        if result_data is not None:
+            headers = dict(CORS_HEADERS)
+            headers['Content-Disposition'] = f'attachment; filename={download_name()}'
+            if 'sha256' in status:
+                headers['X-Content-SHA256'] = status['sha256']
+            return web.Response(body=result_data, content_type='application/pdf', headers=headers)
+
+        return json_response(status)
+
+    except Exception as e:
+        logger.error(f"Error in get_status: {str(e)}")
+        logger.exception("Full traceback:")
+        return json_response({
+            "status": "Failed",
+            "error": str(e)
+        }, status=500)
+
+
+async def get_metadata(request):
+    """Get status, page count, size and checksum of a task without downloading the result."""
+    task_id = request.match_info['task_id']
+    try:
+        return json_response(await asyncio.to_thread(
+            lookup_task_metadata, get_result(task_id)
+        ))
+    except Exception as e:
+        logger.error(f"Error in get_metadata: {str(e)}")
+        return json_response({
+            "status": "Failed",
+            "error": str(e)
+        }, status=500)
+
+
+async def get_profile(request):
+    """Return the profile of a profiled task run; ?format=collapsed for flame graph tools."""
+    if not is_admin(request['client_id']):
+        return json_response(admin_required_error(), status=403)
+    task_id = request.match_info['task_id']
+    try:
+        report, status_code = await asyncio.to_thread(lookup_profile, task_id)
+        if status_code == 200 and request.query.get('format') == 'collapsed':
+            return web.Response(text=profiling.collapsed_stacks(report), headers=CORS_HEADERS)
+        return json_response(report, status=status_code)
+    except Exception as e:
+        logger.error(f"Error in get_profile: {str(e)}")
+        return json_response({"error": str(e)}, status=500)
+
+
+def collect_metrics():
+    return {
+        "queues": queue_depths(celery),
+        "admission": admission.state(),
+        "fair_queue": fair_queue.state(),
+        "counters": metrics.snapshot()
+    }
+
+
+async def get_metrics(request):
+    """Report queue depth per lane, admission and fair-queue state and shared counters."""
+    try:
+        return json_response(await asyncio.to_thread(collect_metrics))
+    except Exception as e:
+        logger.error(f"Error in get_metrics: {str(e)}")
+        return json_response({"error": str(e)}, status=500)
+
+
+def create_app():
+    app = web.Application(middlewares=[auth_middleware])
+    app['upload_slots'] = asyncio.Semaphore(MAX_CONCURRENT_UPLOADS)
+    app.router.add_post('/upload', upload_pdf)
+    app.router.add_post('/analyze', analyze_pdf_upload)
+    app.router.add_post('/redact', redact_pdf_upload)
+    app.router.add_get('/status/{task_id}', get_status)
+    app.router.add_get('/metadata/{task_id}', get_metadata)
+    app.router.add_get('/metrics', get_metrics)
+    app.router.add_get('/admin/profiles/{task_id}', get_profile)
+    return app
+
+
+if __name__ == '__main__':
+    web.run_app(
+        create_app(),
+        host=ASYNC_HOST,
+        port=ASYNC_PORT
+    )
@@ -0,0 +1,38 @@
+import hmac
+from config import API_TOKEN, API_TOKENS, ADMIN_CLIENTS
+
+# Token checks shared by the Flask app (security.py) and the async server;
+# nothing here depends on a web framework.
+
+DEFAULT_CLIENT_ID = 'default'
+
+def authenticate(token):
+    """
+    Resolves an Authorization header to a client identity.
+
+    Tokens from API_TOKENS identify their client; the legacy API_TOKEN
+    identifies the 'default' client.
+
+    Returns:
+        Tuple of (client_id, error). Exactly one of them is None.
+    """
+    if not token:
+        return None, "Authentication required."
+
+    scheme, _, presented = token.partition(' ')
+    if scheme != 'Bearer' or not presented:
+        return None, "Invalid token."
+
+    client_id = None
+    # Compare against every token, so the response time does not reveal a match
+    for candidate, candidate_client in [(API_TOKEN, DEFAULT_CLIENT_ID), *API_TOKENS.items()]:
+        if hmac.compare_digest(presented.encode(), candidate.encode()):
+            client_id = candidate_client
+    if client_id is None:
+        return None, "Invalid token."
+
+    return client_id, None
+
+def is_admin(client_id):
+    """Admin clients (ADMIN_CLIENTS) may fetch profiles and request profiled runs."""
+    return client_id in ADMIN_CLIENTS
@@ -0,0 +1,415 @@
+"""
+Bulk mode: anonymizes local PDF files and directory trees without Redis,
+Celery or the API.
+
+Every document goes through the same pipeline as process_pdf (pipeline.py:
+page analysis with dedup, redaction, save profile), so the output matches
+the API's. Directories are walked lazily and mirrored below --output; only
+a bounded number of documents is queued for the worker processes at any
+time. Each finished document is appended to a checkpoint journal in the
+output directory, so an interrupted run continues where it stopped when it
+is started again with the same arguments. At the end manifest.json lists
+the findings (without their text unless --include-text is given) and
+timings of every document.
+
+Example:
+    python bulk.py scans/ --output redacted/ --workers 4
+    python bulk.py a.pdf b.pdf --output out/ --preferences '{"dates": true}'
+    python bulk.py scans/ --output redacted/ --retry-failed
+"""
+from config import *
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_NAME = '.bulk_checkpoint.jsonl'
+MANIFEST_NAME = 'manifest.json'
+
+
+def iter_pdfs(paths, exclude: Optional[str] = None) -> Iterator[Tuple[str, str]]:
+    """
+    Yields (input path, path relative to the output directory) of all PDFs.
+
+    Directories are walked depth-first with os.scandir, one sorted listing
+    at a time, so the order is stable between runs and memory does not grow
+    with the size of the tree. The directory exclude (the output) is skipped.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            yield from _walk(path, '', exclude)
+        elif os.path.isfile(path):
+            yield path, os.path.basename(path)
+        else:
+            logger.warning(f"Skipping {path}: no such file or directory")
+
+
+def _walk(directory: str, relative: str, exclude: Optional[str]) -> Iterator[Tuple[str, str]]:
+    try:
+        with os.scandir(directory) as entries:
+            entries = sorted(entries, key=lambda entry: entry.name)
+    except OSError as e:
+        logger.warning(f"Skipping {directory}: {e}")
+        return
+    for entry in entries:
+        entry_relative = os.path.join(relative, entry.name)
+        if entry.is_dir(follow_symlinks=False):
+            if os.path.abspath(entry.path) != exclude:
+                yield from _walk(entry.path, entry_relative, exclude)
+        elif entry.is_file() and entry.name.lower().endswith('.pdf'):
+            yield entry.path, entry_relative
+
+
+def settings_digest(preferences: Dict[str, Any], save_profile: Optional[str]) -> str:
+    """Short hash of everything besides the input that determines the output."""
+    settings = json.dumps({"preferences": preferences, "save_profile": save_profile or PDF_SAVE_PROFILE,
+                           "detector_backend": DETECTOR_BACKEND}, sort_keys=True)
+    return hashlib.sha256(settings.encode('utf-8')).hexdigest()[:16]
+
+
+def checkpoint_key(path: str, settings: str) -> str:
+    """
+    Identifies an input file version processed with given settings: changed
+    files and runs with other preferences or save profile are processed again.
+    """
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}:{settings}"
+
+
+def load_checkpoint(path: str) -> Dict[str, str]:
+    """Returns input key -> status of the last record per document."""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Last line of a run that was killed while writing it
+                continue
+            done[record['key']] = record['status']
+    return done
+
+
+def _init_worker(log_level: str) -> None:
+    logging.basicConfig(level=log_level, format=LOG_FORMAT)
+    import metrics
+    metrics.use_local()
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = f"{path}.part"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def job_record(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Start of a document's journal record; each record names the settings it was produced with."""
+    return {
+        "key": job['key'],
+        "input": job['input'],
+        "output": job['output'],
+        "preferences": job['preferences'],
+        "save_profile": job['save_profile'] or PDF_SAVE_PROFILE
+    }
+
+
+def process_file(job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Anonymizes one document in a worker process and returns its record.
+
+    Errors are returned as a failed record; only the document is lost.
+    """
+    import fitz
+    import metrics
+    from pipeline import analyze_document, redact_findings
+    from utils import save_pdf
+
+    metrics.use_local()
+    record = job_record(job)
+    timings = {}
+    started = time.perf_counter()
+    try:
+        doc = fitz.open(job['input'])
+        try:
+            total_pages = len(doc)
+            timings['open'] = time.perf_counter() - started
+
+            mark = time.perf_counter()
+            page_findings, dedup_stats = analyze_document(doc, job['preferences'])
+            timings['analyze'] = time.perf_counter() - mark
+
+            mark = time.perf_counter()
+            redactions = redact_findings(doc, page_findings)
+            timings['redact'] = time.perf_counter() - mark
+
+            mark = time.perf_counter()
+            pdf_bytes = save_pdf(doc, job['save_profile'])
+            timings['save'] = time.perf_counter() - mark
+        finally:
+            doc.close()
+        _write_atomic(job['output'], pdf_bytes)
+
+        findings = [
+            {
+                "page": page_num + 1,
+                "type": item.get('type'),
+                "confidence": item.get('confidence'),
+                "rects": item['rects'],
+                **({"text": item.get('text')} if job['include_text'] else {})
+            }
+            for page_num in sorted(page_findings)
+            for item in page_findings[page_num]
+        ]
+        record.update({
+            "status": "completed",
+            "total_pages": total_pages,
+            # Pages whose analysis raised are left unredacted, as in process_pdf
+            "unanalyzed_pages": [page_num + 1 for page_num in range(total_pages) if page_num not in page_findings],
+            "findings": findings,
+            "redactions": redactions,
+            "size": len(pdf_bytes),
+            "dedup": dedup_stats
+        })
+    except Exception as e:
+        logger.error(f"Error processing {job['input']}: {e}")
+        record.update({"status": "failed", "error": f"{type(e).__name__}: {e}"})
+
+    timings['total'] = time.perf_counter() - started
+    record['timings'] = {name: round(seconds, 3) for name, seconds in timings.items()}
+    record['metrics'] = metrics.snapshot()
+    record['finished_at'] = time.time()
+    return record
+
+
+class Journal:
+    """Append-only checkpoint: one JSON line per finished document."""
+
+    def __init__(self, path: str):
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def append(self, record: Dict[str, Any]) -> None:
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def build_jobs(args, preferences, previous, counts) -> Iterator[Dict[str, Any]]:
+    """Yields the jobs still to do, skipping what the checkpoint has already."""
+    settings = settings_digest(preferences, args.save_profile)
+    for input_path, relative in iter_pdfs(args.inputs, exclude=args.output):
+        try:
+            key = checkpoint_key(input_path, settings)
+        except OSError as e:
+            logger.warning(f"Skipping {input_path}: {e}")
+            continue
+        status = previous.get(key)
+        if status == 'completed' or (status == 'failed' and not args.retry_failed):
+            counts['skipped'] += 1
+            continue
+        yield {
+            "key": key,
+            "input": input_path,
+            "output": os.path.join(args.output, relative),
+            "preferences": preferences,
+            "save_profile": args.save_profile,
+            "include_text": args.include_text,
+            "attempt": 1
+        }
+
+
+def _executor(args):
+    options = {"max_workers": args.workers, "initializer": _init_worker, "initargs": (args.log_level,)}
+    if args.recycle_after:
+        # max_tasks_per_child cannot be combined with the fork start method
+        options.update(max_tasks_per_child=args.recycle_after, mp_context=multiprocessing.get_context('spawn'))
+    return concurrent.futures.ProcessPoolExecutor(**options)
+
+
+def run(args, jobs, journal, counts) -> bool:
+    """
+    Processes the jobs with at most workers + queue_depth documents in flight.
+
+    Returns:
+        bool: False if the run was interrupted
+    """
+    window = args.workers + args.queue_depth
+    executor = _executor(args)
+    pending = {}
+
+    def finish(done):
+        nonlocal executor
+        crashed = []
+        for future in done:
+            job = pending.pop(future)
+            try:
+                record = future.result()
+            except BrokenProcessPool:
+                crashed.append(job)
+                continue
+            journal.append(record)
+            counts[record['status']] += 1
+            if not args.quiet:
+                print(f"[{counts['completed'] + counts['failed']}] {record['status']:<9} "
+                      f"{record['timings']['total']:>7.1f}s  {record['input']}", flush=True)
+        if crashed:
+            # A worker died (usually out of memory); every document it may
+            # have held is retried once in a fresh pool
+            executor.shutdown(wait=False, cancel_futures=True)
+            executor = _executor(args)
+            crashed += [pending.pop(future) for future in list(pending)]
+            for job in crashed:
+                if job['attempt'] > 1:
+                    record = {**job_record(job), "status": "failed", "error": "Worker process died",
+                              "timings": {}, "finished_at": time.time()}
+                    journal.append(record)
+                    counts['failed'] += 1
+                else:
+                    pending[executor.submit(process_file, {**job, "attempt": 2})] = job
+
+    try:
+        for job in jobs:
+            while len(pending) >= window:
+                finish(concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED).done)
+            pending[executor.submit(process_file, job)] = job
+        while pending:
+            finish(concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED).done)
+        return True
+    except KeyboardInterrupt:
+        print("Interrupted, keeping finished documents in the checkpoint", file=sys.stderr)
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True, cancel_futures=True)
+        for future, job in pending.items():
+            # Documents cut off by Ctrl-C are not recorded and run again on resume
+            if future.done() and not future.cancelled() and future.exception() is None:
+                record = future.result()
+                journal.append(record)
+                counts[record['status']] += 1
+        return False
+    finally:
+        executor.shutdown(wait=True)
+
+
+def write_manifest(args, checkpoint_path: str, started_at: float, complete: bool) -> Dict[str, Any]:
+    """
+    Writes manifest.json from the checkpoint, the last record per input file.
+
+    The journal is read twice (offsets first, then the records), so only the
+    offsets are held in memory, not the findings of all documents.
+    """
+    offsets = {}
+    with open(checkpoint_path, 'rb') as f:
+        offset = f.tell()
+        for line in iter(f.readline, b''):
+            try:
+                offsets[json.loads(line)['input']] = offset
+            except (json.JSONDecodeError, KeyError):
+                pass
+            offset = f.tell()
+
+    totals = {"documents": 0, "completed": 0, "failed": 0, "pages": 0, "findings": 0, "redactions": 0,
+              "seconds": 0.0, "findings_by_type": {}}
+    manifest_path = os.path.join(args.output, MANIFEST_NAME)
+    with open(checkpoint_path, 'rb') as journal, open(f"{manifest_path}.part", 'w', encoding='utf-8') as out:
+        out.write('{"documents": [\n')
+        for n, offset in enumerate(sorted(offsets.values())):
+            journal.seek(offset)
+            record = json.loads(journal.readline())
+            out.write((',\n' if n else '') + json.dumps(record, ensure_ascii=False))
+            totals['documents'] += 1
+            totals[record['status']] += 1
+            totals['pages'] += record.get('total_pages', 0)
+            totals['findings'] += len(record.get('findings', []))
+            totals['redactions'] += record.get('redactions', 0)
+            totals['seconds'] += record['timings'].get('total', 0.0)
+            for finding in record.get('findings', []):
+                by_type = totals['findings_by_type']
+                by_type[finding['type']] = by_type.get(finding['type'], 0) + 1
+        totals['seconds'] = round(totals['seconds'], 3)
+        summary = {
+            "inputs": args.inputs,
+            "preferences": args.preferences_value,
+            "save_profile": args.save_profile or PDF_SAVE_PROFILE,
+            "detector_backend": DETECTOR_BACKEND,
+            "complete": complete,
+            "started_at": started_at,
+            "finished_at": time.time(),
+            "totals": totals
+        }
+        out.write('\n],\n' + json.dumps(summary, ensure_ascii=False, indent=2)[1:] + '\n')
+    os.replace(f"{manifest_path}.part", manifest_path)
+    return totals
+
+
+def parse_preferences_argument(value: Optional[str]) -> Dict[str, Any]:
+    from api_helpers import parse_preferences
+    if value and value.startswith('@'):
+        with open(value[1:], encoding='utf-8') as f:
+            value = f.read()
+    preferences, error = parse_preferences(value)
+    if error:
+        raise SystemExit(f"{error['message']} ({error['error']})")
+    return preferences
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inputs', nargs='+', help='PDF files and directories (searched recursively)')
+    parser.add_argument('--output', required=True, help='Output directory; mirrors the input directories')
+    parser.add_argument('--preferences', help='Anonymization preferences as JSON, or @file with the JSON')
+    parser.add_argument('--save-profile', choices=sorted(PDF_SAVE_PROFILES), help='Save profile, default PDF_SAVE_PROFILE')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes')
+    parser.add_argument('--queue-depth', type=int, default=2,
+                        help='Documents queued per run in addition to the running ones')
+    parser.add_argument('--recycle-after', type=int, default=0,
+                        help='Replace a worker process after this many documents (bounds leaked memory)')
+    parser.add_argument('--include-text', action='store_true', help='Include the found text in the manifest')
+    parser.add_argument('--retry-failed', action='store_true', help='Process documents again that failed before')
+    parser.add_argument('--log-level', default='WARNING', help='Log level of the worker processes')
+    parser.add_argument('--quiet', action='store_true', help='Do not print a line per document')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level, format=LOG_FORMAT)
+    args.output = os.path.abspath(args.output)
+    preferences = parse_preferences_argument(args.preferences)
+    args.preferences_value = preferences
+    os.makedirs(args.output, exist_ok=True)
+
+    checkpoint_path = os.path.join(args.output, CHECKPOINT_NAME)
+    previous = load_checkpoint(checkpoint_path)
+    counts = {"completed": 0, "failed": 0, "skipped": 0}
+    started_at = time.time()
+    journal = Journal(checkpoint_path)
+    try:
+        complete = run(args, build_jobs(args, preferences, previous, counts), journal, counts)
+    finally:
+        journal.close()
+
+    totals = write_manifest(args, checkpoint_path, started_at, complete)
+    print(f"{counts['completed']} completed, {counts['failed']} failed, {counts['skipped']} skipped "
+          f"(from checkpoint) in {time.time() - started_at:.1f}s; {totals['documents']} documents, "
+          f"{totals['findings']} findings in {os.path.join(args.output, MANIFEST_NAME)}")
+    if not complete:
+        sys.exit(130)
+    if counts['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
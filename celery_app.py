@@ -1,11 +1,23 @@
 from celery import Celery, signals
+from kombu import Queue
 from config import *
 import logging
 import os
+import threading
+import admission
+import coalescing
+import fair_queue
+import tracing
+import workers
+from routing import LANES
+from serialization import SERIALIZER_NAME, register_serializer
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Register the binary-safe msgpack serializer before any message is sent
+register_serializer()
+
 # Initialize Celery
 celery = Celery(
     'pdf_api',
@@ -28,30 +40,110 @@ celery.conf.update(
     worker_max_tasks_per_child=1,
     worker_prefetch_multiplier=1,
     worker_pool='solo',
-    task_serializer='pickle',
-    accept_content=['pickle', 'json'],
-    result_serializer='pickle',
+    task_serializer=SERIALIZER_NAME,
+    accept_content=[SERIALIZER_NAME, 'json'],
+    result_serializer=SERIALIZER_NAME,
+    result_expires=RESULT_TTL_SECONDS,
     task_default_queue='pdf_tasks',
+    task_queues=(
+        Queue('pdf_tasks'),
+        Queue(FAST_QUEUE),
+        Queue(HEAVY_QUEUE)
+    ),
+    # Uploads pick their lane explicitly; anything sent without one is
+    # treated as heavy so it never blocks the fast lane.
     task_routes={
-        'pdf_api.tasks.process_pdf': {'queue': 'pdf_tasks'}
+        'pdf_api.tasks.process_pdf': {'queue': HEAVY_QUEUE},
+        'pdf_api.tasks.analyze_pdf': {'queue': HEAVY_QUEUE},
+        'pdf_api.tasks.redact_pdf': {'queue': FAST_QUEUE},
+        'pdf_api.tasks.deliver_webhook': {'queue': FAST_QUEUE}
     },
     worker_reset_tasks_at_start=True,
     task_reject_on_worker_lost=True,
     task_acks_late=True
 )
 
+# Continue the publisher's trace in the worker; jobs released by the fair
+# queue already carry the headers of the upload that queued them
+@signals.before_task_publish.connect
+def propagate_trace(headers=None, **kwargs):
+    for name, value in tracing.inject().items():
+        headers.setdefault(name, value)
+
+def release_tasks(task_ids):
+    """Releases tasks that will not finish normally from admission control, coalescing and the fair queue."""
+    for task_id in task_ids:
+        admission.release(task_id)
+        coalescing.release(task_id)
+        fair_queue.complete(task_id)
+
 # Queue purging function
 @celery.task(name='pdf_api.tasks.purge_queue')
-def purge_queue():
-    """Purges the Celery queue on worker start."""
+def purge_queue(hostname, queues):
+    """
+    Cleans up after a worker start, limited to what that worker owned.
+
+    Tasks the worker was still running when it stopped are released. Its
+    queues are purged (and the fair queue's slots on their lanes freed) only
+    if no other live worker consumes them; admission control and coalescing
+    start over only if no other worker is live at all.
+    """
     try:
-        celery.control.purge()
-        logger.info("Successfully purged Celery queue")
+        release_tasks(workers.take_tasks(hostname))
+        others = [worker for name, worker in workers.live().items() if name != hostname]
+        orphaned = [queue for queue in queues if not any(queue in worker['queues'] for worker in others)]
+        if orphaned:
+            with celery.connection_for_write() as connection:
+                for queue in orphaned:
+                    connection.default_channel.queue_purge(queue)
+            logger.info(f"Successfully purged Celery queues {', '.join(orphaned)}")
+
+        for lane, queue in LANES.items():
+            if queue in orphaned:
+                release_tasks(fair_queue.restart(lane))
+            elif queue in queues:
+                # The worker's slots widen the lane's dispatch window
+                fair_queue.dispatch(lane)
+        if not others:
+            admission.reset()
+            coalescing.reset()
     except Exception as e:
         logger.error(f"Error purging Celery queue: {e}")
 
-# Worker startup signal
+# Worker registry (workers.py): the heartbeat keeps the worker's slots in
+# the fair queue's dispatch window and reaps workers that were killed
+_heartbeat_stop = threading.Event()
+
+def _worker_concurrency(worker):
+    # The solo pool runs one task at a time whatever --concurrency says
+    return 1 if worker.pool_cls.__module__ == 'celery.concurrency.solo' else worker.concurrency
+
+def _heartbeat(hostname, queues, concurrency):
+    while not _heartbeat_stop.wait(WORKER_HEARTBEAT_TTL / 3):
+        if workers.register(hostname, queues, concurrency):
+            # The registration had expired, e.g. while Redis was unreachable
+            for lane, queue in LANES.items():
+                if queue in queues:
+                    fair_queue.dispatch(lane)
+        try:
+            for task_ids in workers.reap().values():
+                release_tasks(task_ids)
+        except Exception as e:
+            logger.error(f"Error reaping stopped workers: {e}")
+
 @signals.worker_ready.connect
-def clean_at_start(sender=None, conf=None, **kwargs):
-    """Executes when the worker starts."""
-    purge_queue.delay() 
\ No newline at end of file
+def start_worker(sender=None, **kwargs):
+    """Registers the worker, cleans up after its previous run and starts its heartbeat."""
+    hostname = sender.hostname
+    queues = list(sender.app.amqp.queues.consume_from)
+    concurrency = _worker_concurrency(sender.controller)
+    workers.register(hostname, queues, concurrency)
+    purge_queue(hostname, queues)
+    _heartbeat_stop.clear()
+    threading.Thread(target=_heartbeat, args=(hostname, queues, concurrency),
+                     name='worker-heartbeat', daemon=True).start()
+
+@signals.worker_shutdown.connect
+def stop_worker(sender=None, **kwargs):
+    _heartbeat_stop.set()
+    workers.unregister(sender.hostname)
@@ -0,0 +1,93 @@
+from config import *
+import hashlib
+import json
+import logging
+from typing import Any, Dict, Optional
+import metrics
+from redis_store import get_redis, key
+
+logger = logging.getLogger(__name__)
+
+
+def _job_key(fingerprint: str) -> str:
+    return key('inflight', 'job', fingerprint)
+
+
+def _task_key(task_id: str) -> str:
+    return key('inflight', 'task', task_id)
+
+
+def fingerprint(task_name: str, task_args: tuple, options: Dict[str, Any], client_id: str) -> str:
+    """
+    Identifies the work an upload asks for.
+
+    Covers the task, the PDF bytes, the remaining arguments (preferences or
+    redaction targets) and options in canonical JSON, and the client, so a
+    result is never shared across API clients.
+    """
+    pdf_data, *other_args = task_args
+    digest = hashlib.sha256()
+    digest.update(hashlib.sha256(pdf_data).digest())
+    digest.update(json.dumps([task_name, other_args, options, client_id], sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def find(job_fingerprint: str) -> Optional[Dict[str, Any]]:
+    """Returns {task_id, lane} of an identical job that is queued or running."""
+    try:
+        value = get_redis().get(_job_key(job_fingerprint))
+    except Exception as e:
+        logger.error(f"Error looking up in-flight job: {e}")
+        return None
+    return json.loads(value) if value else None
+
+
+def claim(job_fingerprint: str, task_id: str, lane: str) -> Optional[Dict[str, Any]]:
+    """
+    Registers task_id as the job for this fingerprint.
+
+    Returns:
+        None if the claim succeeded, otherwise the job that won the race
+    """
+    job = {"task_id": task_id, "lane": lane}
+    try:
+        client = get_redis()
+        if client.set(_job_key(job_fingerprint), json.dumps(job), nx=True, ex=COALESCE_TTL_SECONDS):
+            client.set(_task_key(task_id), job_fingerprint, ex=COALESCE_TTL_SECONDS)
+            return None
+    except Exception as e:
+        # Fails open: the upload is processed on its own
+        logger.error(f"Error registering in-flight job: {e}")
+        return None
+    return find(job_fingerprint)
+
+
+def record_coalesced(job: Dict[str, Any]) -> None:
+    metrics.incr('uploads.coalesced')
+    logger.info(f"Coalesced identical upload into running task {job['task_id']}")
+
+
+def release(task_id: str) -> None:
+    """Forgets the in-flight job of a finished (or never enqueued) task."""
+    try:
+        client = get_redis()
+        job_fingerprint = client.get(_task_key(task_id))
+        if job_fingerprint is None:
+            return
+        job_key = _job_key(job_fingerprint.decode())
+        job = client.get(job_key)
+        if job and json.loads(job)['task_id'] == task_id:
+            client.delete(job_key)
+        client.delete(_task_key(task_id))
+    except Exception as e:
+        logger.error(f"Error releasing in-flight job of task {task_id}: {e}")
+
+
+def reset() -> None:
+    """Forgets all in-flight jobs, e.g. after the queue has been purged."""
+    try:
+        client = get_redis()
+        for name in client.scan_iter(match=key('inflight', '*')):
+            client.delete(name)
+    except Exception as e:
+        logger.error(f"Error resetting in-flight jobs: {e}")
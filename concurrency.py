@@ -0,0 +1,133 @@
+from config import *
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from billiard.process import current_process
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LIMIT_GAUGE = 'concurrency.limit'
+
+
+def limit_gauge() -> str:
+    """
+    Gauge of the limit of this process, concurrency.limit.<host>.<child>.
+
+    Prefork children are numbered by their pool slot, which a recycled child
+    takes over from the one it replaces; other processes use their pid.
+    """
+    child = getattr(current_process(), 'index', None)
+    return f"{LIMIT_GAUGE}.{socket.gethostname()}.{os.getpid() if child is None else child}"
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """True for HTTP 429 errors from the Mistral SDK or httpx."""
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status == 429
+
+
+class AdaptiveLimiter:
+    """
+    AIMD limit on concurrent LLM calls, shared by the threads of one process.
+
+    Each prefork child of a worker has its own limiter.
+
+    The limit grows by one per round of calls (1/limit per success) while the
+    latency stays within CONCURRENCY_LATENCY_TOLERANCE of the baseline, the
+    10th percentile of the last CONCURRENCY_WINDOW calls of the same kind
+    (robust against single short prompts). Slower calls shrink it by 10%,
+    rate-limit errors by CONCURRENCY_BACKOFF.
+    """
+
+    def __init__(self, initial: float = CONCURRENCY_INITIAL):
+        self.limit = min(max(initial, CONCURRENCY_MIN), CONCURRENCY_MAX)
+        self.inflight = 0
+        self.windows = {}
+        self.condition = threading.Condition()
+        self.reported_limit = None
+
+    def acquire(self) -> None:
+        with self.condition:
+            while self.inflight >= int(self.limit):
+                self.condition.wait()
+            self.inflight += 1
+
+    def try_acquire(self) -> bool:
+        """Takes a slot only if one is free right now."""
+        with self.condition:
+            if self.inflight >= int(self.limit):
+                return False
+            self.inflight += 1
+            return True
+
+    def discard(self) -> None:
+        """Frees a slot whose call was cancelled, without feeding back a latency."""
+        with self.condition:
+            self.inflight -= 1
+            self.condition.notify_all()
+
+    def release(self, kind: str, latency: float, rate_limited: bool = False) -> None:
+        with self.condition:
+            self.inflight -= 1
+            window = self.windows.setdefault(kind, deque(maxlen=CONCURRENCY_WINDOW))
+            baseline = sorted(window)[len(window) // 10] if window else latency
+
+            if rate_limited:
+                self.limit *= CONCURRENCY_BACKOFF
+            elif latency > baseline * CONCURRENCY_LATENCY_TOLERANCE:
+                self.limit *= 0.9
+            else:
+                self.limit += 1 / self.limit
+            self.limit = min(max(self.limit, CONCURRENCY_MIN), CONCURRENCY_MAX)
+
+            if not rate_limited:
+                window.append(latency)
+            self.condition.notify_all()
+            limit = int(self.limit)
+
+        if limit != self.reported_limit:
+            self.reported_limit = limit
+            logger.info(f"Adaptive concurrency limit is now {limit}")
+            metrics.set_gauge(limit_gauge(), limit)
+
+    @contextmanager
+    def slot(self, kind: str):
+        """Holds a slot for one call and feeds its latency and outcome back."""
+        self.acquire()
+        started = time.monotonic()
+        rate_limited = False
+        try:
+            yield
+        except Exception as e:
+            rate_limited = is_rate_limited(e)
+            if rate_limited:
+                metrics.incr('concurrency.rate_limited')
+            raise
+        finally:
+            self.release(kind, time.monotonic() - started, rate_limited)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> AdaptiveLimiter:
+    """
+    Returns the limiter of this process.
+
+    Workers are recycled after every task (worker_max_tasks_per_child), so
+    a new limiter starts from the limit its predecessor in the same pool
+    slot published instead of CONCURRENCY_INITIAL.
+    """
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = AdaptiveLimiter(metrics.get_value(limit_gauge(), CONCURRENCY_INITIAL))
+        return _limiter
@@ -71,9 +71,96 @@ REDIS_URL = f"redis://:{REDIS_PASSWORD}@{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}"
 MISTRAL_API_KEY = os.getenv('MISTRAL_API_KEY')
 MISTRAL_MODEL = os.getenv('MISTRAL_MODEL', 'mistral-large-latest')
 
+# Hedged Requests (zweite Anfrage, wenn ein Mistral-Aufruf ungewöhnlich lange dauert)
+HEDGING_ENABLED = os.getenv('HEDGING_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', 95))  # Perzentil der letzten Latenzen als Wartezeit
+HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY', 2))  # Sekunden, frühestens dann wird dupliziert
+HEDGE_BUDGET = float(os.getenv('HEDGE_BUDGET', 0.1))  # Höchstens dieser Anteil der Aufrufe wird dupliziert
+HEDGE_MIN_SAMPLES = int(os.getenv('HEDGE_MIN_SAMPLES', 20))  # Messwerte, bevor gehedgt wird
+HEDGE_WINDOW = int(os.getenv('HEDGE_WINDOW', 200))  # Anzahl berücksichtigter Latenzen
+
+# Adaptive Concurrency (gleichzeitige LLM-Aufrufe pro Worker-Prozess, AIMD)
+CONCURRENCY_INITIAL = float(os.getenv('CONCURRENCY_INITIAL', 4))  # Startwert ohne gespeicherten Messwert
+CONCURRENCY_MIN = int(os.getenv('CONCURRENCY_MIN', 1))
+CONCURRENCY_MAX = int(os.getenv('CONCURRENCY_MAX', 32))  # Obergrenze, zugleich Threads pro Dokument
+CONCURRENCY_BACKOFF = float(os.getenv('CONCURRENCY_BACKOFF', 0.5))  # Faktor bei 429-Antworten
+CONCURRENCY_LATENCY_TOLERANCE = float(os.getenv('CONCURRENCY_LATENCY_TOLERANCE', 2.0))  # Latenz / Basislatenz, ab der gedrosselt wird
+CONCURRENCY_WINDOW = int(os.getenv('CONCURRENCY_WINDOW', 50))  # Messwerte für die Basislatenz
+
+# Detector Backend Configuration
+DETECTOR_BACKEND = os.getenv('DETECTOR_BACKEND', 'mistral')  # mistral, rules oder openai
+LOCAL_LLM_BASE_URL = os.getenv('LOCAL_LLM_BASE_URL', 'http://localhost:8000/v1')  # OpenAI-kompatibler Server (vLLM, llama.cpp, Ollama)
+LOCAL_LLM_API_KEY = os.getenv('LOCAL_LLM_API_KEY', '')
+LOCAL_LLM_MODEL = os.getenv('LOCAL_LLM_MODEL', 'mistral-7b-instruct')
+LOCAL_LLM_VISION_MODEL = os.getenv('LOCAL_LLM_VISION_MODEL') or None  # None = keine Bildanalyse
+LOCAL_LLM_TIMEOUT = float(os.getenv('LOCAL_LLM_TIMEOUT', 120))  # Sekunden
+LOCAL_LLM_MAX_BATCH = int(os.getenv('LOCAL_LLM_MAX_BATCH', 8))  # Gleichzeitige Anfragen pro Batch
+DETECTOR_BATCH_PAGES = int(os.getenv('DETECTOR_BATCH_PAGES', 32))  # Seitentexte pro analyze_texts-Aufruf
+DETECTOR_BATCH_LINGER = float(os.getenv('DETECTOR_BATCH_LINGER', 0.5))  # Sekunden, die fertige Seitentexte auf einen vollen Batch warten
+RULES_CONFIDENCE = float(os.getenv('RULES_CONFIDENCE', 0.9))  # Konfidenz der Regex-Treffer
+
 # PDF Processing Configuration
 MAX_PDF_PAGES = int(os.getenv('MAX_PDF_PAGES', 10))
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', 50 * 1024 * 1024))  # 50 MB
+
+# Queue Routing Configuration
+FAST_QUEUE = os.getenv('FAST_QUEUE', 'pdf_fast')  # Kurze Textdokumente
+HEAVY_QUEUE = os.getenv('HEAVY_QUEUE', 'pdf_heavy')  # Große oder gescannte Dokumente
+FAST_LANE_MAX_COST = float(os.getenv('FAST_LANE_MAX_COST', 3))  # Kostenpunkte, Textseite = 1
+OCR_PAGE_COST = float(os.getenv('OCR_PAGE_COST', 4))  # Kostenpunkte pro Seite mit OCR-Bedarf
+
+# OCR Cache Configuration (Tesseract-Ergebnisse für wiederkehrende Scans)
+OCR_CACHE_ENABLED = os.getenv('OCR_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+OCR_CACHE_DIR = Path(os.getenv('OCR_CACHE_DIR', CACHE_DIR / 'ocr'))
+OCR_CACHE_MAX_BYTES = int(os.getenv('OCR_CACHE_MAX_BYTES', 256 * 1024 * 1024))  # Älteste Einträge werden darüber entfernt
+
+# Admission Control Configuration
+ADMISSION_CONTROL_ENABLED = os.getenv('ADMISSION_CONTROL_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv('ADMISSION_MAX_WAIT_SECONDS', 300))  # Warte-SLO für neue Uploads
+ADMISSION_WORKER_SLOTS = int(os.getenv('ADMISSION_WORKER_SLOTS', 0))  # Parallel laufende Tasks, 0 = Concurrency der laufenden Worker
+ADMISSION_DEFAULT_SECONDS_PER_PAGE = float(os.getenv('ADMISSION_DEFAULT_SECONDS_PER_PAGE', 10))  # Ohne Messwerte
+ADMISSION_SAMPLE_SIZE = int(os.getenv('ADMISSION_SAMPLE_SIZE', 50))  # Anzahl berücksichtigter Tasks
+MAX_INFLIGHT_PER_CLIENT = int(os.getenv('MAX_INFLIGHT_PER_CLIENT', 0))  # 0 = unbegrenzt
+
+# Upload Coalescing (identische Uploads, deren Task noch läuft, teilen sich einen Task)
+COALESCING_ENABLED = os.getenv('COALESCING_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+COALESCE_TTL_SECONDS = int(os.getenv('COALESCE_TTL_SECONDS', 3600))  # Schutz vor verwaisten Einträgen
+
+# Result Storage Configuration
+RESULT_TTL_SECONDS = int(os.getenv('RESULT_TTL_SECONDS', 24 * 3600))  # Aufbewahrung fertiger Ergebnisse
+RESULT_CONSUMED_TTL_SECONDS = int(os.getenv('RESULT_CONSUMED_TTL_SECONDS', 300))  # Nach dem ersten Download
+RESULT_COMPRESSION = os.getenv('RESULT_COMPRESSION', 'deflate')  # deflate, zstd oder none
+RESULT_COMPRESSION_LEVEL = int(os.getenv('RESULT_COMPRESSION_LEVEL', 6))
+
+# Deduplication Configuration (wiederholte Kopf-/Fußzeilen und identische Seiten)
+DEDUP_ENABLED = os.getenv('DEDUP_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+DEDUP_MIN_BLOCK_CHARS = int(os.getenv('DEDUP_MIN_BLOCK_CHARS', 20))  # Kürzere Blöcke lohnen nicht
+DEDUP_MIN_BLOCK_PAGES = int(os.getenv('DEDUP_MIN_BLOCK_PAGES', 2))  # Ab so vielen Seiten gilt ein Block als wiederholt
+CHARS_PER_TOKEN = 4  # Grobe Schätzung für die Token-Statistik
+
+# Async Server Configuration
+ASYNC_HOST = os.getenv('ASYNC_HOST', FLASK_HOST)
+ASYNC_PORT = int(os.getenv('ASYNC_PORT', FLASK_PORT))
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 64 * 1024))  # Bytes pro Lesevorgang
+UPLOAD_TMP_DIR = os.getenv('UPLOAD_TMP_DIR') or None  # None = System-Temp-Verzeichnis
+MAX_CONCURRENT_UPLOADS = int(os.getenv('MAX_CONCURRENT_UPLOADS', 32))
 REDACTION_FILL_COLOR = tuple(map(int, os.getenv('REDACTION_FILL_COLOR', '0,0,0').split(',')))
+REDACTION_MERGE_GAP = float(os.getenv('REDACTION_MERGE_GAP', 1.0))  # Punkte, bis zu denen Rechtecke als benachbart gelten
+REDACTION_MERGE_MAX_EXTRA = float(os.getenv('REDACTION_MERGE_MAX_EXTRA', 0.05))  # Zusätzlich geschwärzte Fläche beim Vereinigen, relativ
+
+# PDF Save Profiles (Optionen für fitz.Document.save)
+PDF_SAVE_PROFILES = {
+    # Schnellstes Speichern, verwaiste Objekte und unkomprimierte Streams bleiben erhalten
+    'fast': {},
+    # Entfernt verwaiste und doppelte Objekte, komprimiert alle Streams
+    'compact': {'garbage': 4, 'deflate': True, 'deflate_images': True, 'deflate_fonts': True},
+    # Wie compact, zusätzlich linearisiert für seitenweises Laden im Browser
+    'web': {'garbage': 4, 'deflate': True, 'deflate_images': True, 'deflate_fonts': True, 'linear': True},
+}
+PDF_SAVE_PROFILE = os.getenv('PDF_SAVE_PROFILE', 'fast')  # compact/web verkleinern die Ausgabe
+if PDF_SAVE_PROFILE not in PDF_SAVE_PROFILES:
+    raise ValueError(f"Unknown PDF_SAVE_PROFILE '{PDF_SAVE_PROFILE}', "
+                     f"expected one of {', '.join(PDF_SAVE_PROFILES)}")
 
 # Schema Configuration
 FINDING_SCHEMA = {
@@ -147,20 +234,80 @@ CELERY_CONFIG = {
     'worker_max_tasks_per_child': 1,
     'worker_prefetch_multiplier': 1,
     'worker_pool': 'solo',
-    'task_serializer': 'pickle',
-    'accept_content': ['pickle', 'json'],
-    'result_serializer': 'pickle',
+    'task_serializer': 'msgpack-bin',
+    'accept_content': ['msgpack-bin', 'json'],
+    'result_serializer': 'msgpack-bin',
     'task_default_queue': 'pdf_tasks',
     'task_routes': {
         'app.process_pdf': {'queue': 'pdf_tasks'}
     }
 }
 
+# Spielraum in Zeichen um den vom Modell gelieferten start_index bei der Validierung
+VERIFY_OFFSET_SLACK = int(os.getenv('VERIFY_OFFSET_SLACK', 32))
+
 # Confidence threshold for findings
 CONFIDENCE_THRESHOLD = 0.8  # 90% minimum confidence
 
 API_TOKEN = os.getenv('API_TOKEN', 'your-default-secure-token-here')  # Make sure to change this in production
 
+# Multi-Client Configuration, jeweils als kommagetrennte client=wert-Paare
+# Token pro Client, z.B. "acme=tok1,backfill=tok2"; API_TOKEN gilt weiter für den Client 'default'
+API_TOKENS = {
+    token.strip(): client_id.strip()
+    for client_id, _, token in (item.partition('=') for item in os.getenv('API_TOKENS', '').split(','))
+    if client_id.strip() and token.strip()
+}
+CLIENT_WEIGHTS = {  # Anteil an der Worker-Kapazität, Standard 1, z.B. "acme=3"
+    client_id.strip(): float(value)
+    for client_id, _, value in (item.partition('=') for item in os.getenv('CLIENT_WEIGHTS', '').split(','))
+    if client_id.strip() and value.strip()
+}
+CLIENT_MAX_INFLIGHT = {  # Überschreibt MAX_INFLIGHT_PER_CLIENT je Client
+    client_id.strip(): int(value)
+    for client_id, _, value in (item.partition('=') for item in os.getenv('CLIENT_MAX_INFLIGHT', '').split(','))
+    if client_id.strip() and value.strip()
+}
+# Clients mit Zugriff auf /admin-Endpunkte und profilierte Uploads
+ADMIN_CLIENTS = {client_id.strip() for client_id in os.getenv('ADMIN_CLIENTS', 'default').split(',') if client_id.strip()}
+
+# Tracing (Upload -> Celery -> Seiten -> LLM-Aufrufe)
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 1.0))  # Anteil aufgezeichneter Traces
+TRACE_EXPORTER = os.getenv('TRACE_EXPORTER', 'file')  # 'file' (JSON Lines) oder 'otlp' (Collector)
+TRACE_FILE = Path(os.getenv('TRACE_FILE', 'traces/spans.jsonl'))
+TRACE_COLLECTOR_URL = os.getenv('TRACE_COLLECTOR_URL', 'http://localhost:4318/v1/traces')  # OTLP/HTTP JSON
+TRACE_EXPORT_TIMEOUT = float(os.getenv('TRACE_EXPORT_TIMEOUT', 2))  # Sekunden
+TRACE_EXPORT_QUEUE = int(os.getenv('TRACE_EXPORT_QUEUE', 100))  # Wartende Span-Batches, darüber wird verworfen
+TRACE_SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'pdf_api')
+
+# Profiling einzelner Worker-Tasks (Upload-Feld profile=true oder Stichprobe)
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))  # Anteil automatisch profilierter Tasks
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', 0.005))  # Sekunden zwischen zwei Stack-Samples
+PROFILE_TRACEMALLOC_FRAMES = int(os.getenv('PROFILE_TRACEMALLOC_FRAMES', 10))
+PROFILE_TOP = int(os.getenv('PROFILE_TOP', 30))  # Einträge pro Liste im Report
+
+# Worker-Registry (Kapazität der Lanes, Aufräumen nach abgestürzten Workern)
+WORKER_HEARTBEAT_TTL = int(os.getenv('WORKER_HEARTBEAT_TTL', 30))  # Sekunden; alle TTL/3 erneuert, danach gilt der Worker als beendet
+
+# Fair Queuing vor den Celery-Workern (gewichtet nach CLIENT_WEIGHTS)
+FAIR_QUEUING_ENABLED = os.getenv('FAIR_QUEUING_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+FAIR_DISPATCH_WINDOW = int(os.getenv('FAIR_DISPATCH_WINDOW', 0))  # Gleichzeitig an Celery übergebene Jobs pro Lane, 0 = Summe der Worker-Concurrency
+FAIR_MAX_RUNNING_PER_CLIENT = int(os.getenv('FAIR_MAX_RUNNING_PER_CLIENT', 0))  # 0 = nur durch das Fenster begrenzt
+FAIR_SCAN_DEPTH = int(os.getenv('FAIR_SCAN_DEPTH', 50))  # Geprüfte Jobs, wenn Clients ihr Limit erreicht haben
+FAIR_JOB_TTL_SECONDS = int(os.getenv('FAIR_JOB_TTL_SECONDS', 24 * 3600))
+
+# Webhook Configuration (Benachrichtigung statt /status-Polling)
+PUBLIC_BASE_URL = os.getenv('PUBLIC_BASE_URL', f"http://localhost:{FLASK_PORT}").rstrip('/')  # Für Download-Links
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')  # HMAC-Schlüssel für X-Webhook-Signature, ohne sind Callbacks abgeschaltet
+WEBHOOK_TIMEOUT = float(os.getenv('WEBHOOK_TIMEOUT', 10))  # Sekunden pro Zustellversuch
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv('WEBHOOK_MAX_ATTEMPTS', 6))
+WEBHOOK_BACKOFF_BASE = float(os.getenv('WEBHOOK_BACKOFF_BASE', 10))  # Sekunden, verdoppelt sich pro Versuch
+WEBHOOK_BACKOFF_MAX = float(os.getenv('WEBHOOK_BACKOFF_MAX', 600))
+WEBHOOK_DEAD_LETTER_MAX = int(os.getenv('WEBHOOK_DEAD_LETTER_MAX', 1000))  # Aufbewahrte fehlgeschlagene Zustellungen
+WEBHOOK_ALLOWED_HOSTS = [h.strip() for h in os.getenv('WEBHOOK_ALLOWED_HOSTS', '').split(',') if h.strip()]  # Leer = alle öffentlichen Hosts
+WEBHOOK_ALLOW_PRIVATE = os.getenv('WEBHOOK_ALLOW_PRIVATE', 'false').lower() in ('1', 'true', 'yes')  # Auch private, Loopback- und Link-Local-Adressen
+
 
 DEFAULT_MINIMUM_OPTIONS = {
     'names': True,
@@ -0,0 +1,149 @@
+from config import *
+import hashlib
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List
+from detectors import get_detector
+from routing import page_needs_ocr
+from utils import consolidate_findings, normalize_text, validate_findings
+
+logger = logging.getLogger(__name__)
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def _page_fingerprint(page, text: str) -> str:
+    """Hash of the page text plus the images placed on it."""
+    images = sorted(
+        (image['xref'], tuple(round(c, 1) for c in image['bbox']))
+        for image in page.get_image_info(xrefs=True)
+    )
+    return _digest(normalize_text(text) + repr(images))
+
+
+def plan_document(doc) -> Dict[str, Any]:
+    """
+    Finds identical pages and text blocks repeated across pages.
+
+    Only pages with a text layer take part; scanned pages are always analyzed
+    on their own.
+
+    Returns:
+        dict with
+            duplicate_of: page_num -> page_num of the first identical page
+            repeated_blocks: block hash -> block text
+            page_blocks: page_num -> list of (index in page.get_text("blocks"),
+                block text) of the repeated blocks on that page
+    """
+    duplicate_of = {}
+    first_page_by_fingerprint = {}
+    block_text = {}
+    block_pages = defaultdict(set)
+    page_block_hashes = defaultdict(list)
+
+    for page_num, page in enumerate(doc):
+        if page_needs_ocr(page):
+            continue
+        text = page.get_text("text").strip()
+
+        fingerprint = _page_fingerprint(page, text)
+        if fingerprint in first_page_by_fingerprint:
+            duplicate_of[page_num] = first_page_by_fingerprint[fingerprint]
+            continue
+        first_page_by_fingerprint[fingerprint] = page_num
+
+        for index, block in enumerate(page.get_text("blocks")):
+            # Nur Textblöcke (block_type 0)
+            if block[6] != 0:
+                continue
+            text = block[4].strip()
+            if len(text) < DEDUP_MIN_BLOCK_CHARS:
+                continue
+            block_hash = _digest(normalize_text(text))
+            block_text.setdefault(block_hash, text)
+            block_pages[block_hash].add(page_num)
+            page_block_hashes[page_num].append((block_hash, index, text))
+
+    repeated_blocks = {
+        block_hash: text
+        for block_hash, text in block_text.items()
+        if len(block_pages[block_hash]) >= DEDUP_MIN_BLOCK_PAGES
+    }
+    page_blocks = {
+        page_num: [(index, text) for block_hash, index, text in blocks if block_hash in repeated_blocks]
+        for page_num, blocks in page_block_hashes.items()
+    }
+    page_blocks = {page_num: blocks for page_num, blocks in page_blocks.items() if blocks}
+
+    logger.info(f"Dedup plan: {len(duplicate_of)} duplicate pages, {len(repeated_blocks)} repeated blocks")
+    return {
+        "duplicate_of": duplicate_of,
+        "repeated_blocks": repeated_blocks,
+        "page_blocks": page_blocks
+    }
+
+
+def analyze_repeated_blocks(plan: Dict[str, Any], preferences: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Analyzes all repeated blocks of a document in a single detector call."""
+    if not plan['repeated_blocks']:
+        return []
+    boilerplate = "\n\n".join(plan['repeated_blocks'].values())
+    findings = consolidate_findings(get_detector().analyze_text(boilerplate, preferences))
+    findings = validate_findings(findings, boilerplate)
+    logger.info(f"Found {len(findings)} sensitive items in {len(plan['repeated_blocks'])} repeated blocks")
+    return findings
+
+
+def attach_page_contexts(doc, plan: Dict[str, Any], shared_findings: List[Dict[str, Any]]) -> None:
+    """
+    Stores a context for every page with repeated blocks in doc.dedup_contexts.
+
+    PyMuPDF hands out a new page object on every doc[i], so the contexts live
+    on the document. format_page_text leaves the blocks out of the text sent
+    to the detector, selecting them by their index in the same "blocks"
+    extraction the plan was made from, and finish_page_analysis adds the
+    shared findings that occur in them.
+    """
+    doc.dedup_contexts = {}
+    for page_num, blocks in plan['page_blocks'].items():
+        removed_text = "\n".join(text for index, text in blocks)
+        normalized_removed = normalize_text(removed_text)
+        doc.dedup_contexts[page_num] = {
+            "block_indexes": {index for index, text in blocks},
+            "removed_text": removed_text,
+            # start_index bezieht sich auf den Boilerplate-Text, nicht auf die Seite
+            "shared_findings": [
+                {k: v for k, v in finding.items() if k != 'start_index'}
+                for finding in shared_findings
+                if normalize_text(finding['text']) in normalized_removed
+            ]
+        }
+
+
+def savings(doc, plan: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Counts the detector calls the plan skips and estimates the tokens.
+
+    A duplicate page skips the requests its text and, for backends with
+    vision, its image would have cost; the request for the repeated blocks
+    is subtracted again. Backends without model requests (rules) save
+    neither calls nor tokens. Tokens are estimated from characters
+    (CHARS_PER_TOKEN).
+    """
+    detector = get_detector()
+    calls_per_page = detector.requests_per_text + (1 if detector.supports_vision else 0)
+    boilerplate_calls = detector.requests_per_text if plan['repeated_blocks'] else 0
+
+    duplicate_chars = sum(len(doc[page_num].get_text("text")) for page_num in plan['duplicate_of'])
+    stripped_chars = sum(len(text) for blocks in plan['page_blocks'].values() for index, text in blocks)
+    boilerplate_chars = sum(len(text) for text in plan['repeated_blocks'].values())
+    tokens_saved = max(0, duplicate_chars + stripped_chars - boilerplate_chars) // CHARS_PER_TOKEN
+
+    return {
+        "duplicate_pages": len(plan['duplicate_of']),
+        "repeated_blocks": len(plan['repeated_blocks']),
+        "calls_saved": max(0, calls_per_page * len(plan['duplicate_of']) - boilerplate_calls),
+        "tokens_saved": tokens_saved if detector.requests_per_text else 0
+    }
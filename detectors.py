@@ -0,0 +1,210 @@
+from config import *
+import concurrent.futures
+import logging
+import re
+from typing import Any, Dict, List, Optional
+import httpx
+from concurrency import get_limiter
+from encoding_utils import encode_page_as_base64
+import tracing
+from mistral import (
+    analyze_text_with_mistral, analyze_page_with_pixtral, build_messages, enabled_types_from, parse_findings
+)
+
+logger = logging.getLogger(__name__)
+
+
+class DetectorBackend:
+    """
+    Finds sensitive information in page texts and optionally describes page images.
+
+    The batch methods are the primitive: backends that can process several
+    texts or pages per call override them, everything else goes through the
+    single-item helpers. pipeline.analyze_pages passes the page texts of a
+    document in batches of DETECTOR_BATCH_PAGES; page images are described
+    one by one while the page is rendered for OCR anyway, so the rendering
+    is shared and not held for a whole batch.
+    """
+    name = None
+    supports_vision = False
+    # Items of a batch processed concurrently by _map
+    max_batch = 1
+    # Model requests per analyzed text, for the dedup savings
+    requests_per_text = 1
+
+    def analyze_texts(self, texts: List[str], preferences: Dict[str, Any]) -> List[List[Dict[str, Any]]]:
+        """Returns the findings (text, type, confidence) for every text, in order."""
+        raise NotImplementedError
+
+    def describe_pages(self, pages) -> List[Optional[str]]:
+        """Returns a textual description of every page image, None where unavailable."""
+        return [None] * len(pages)
+
+    def analyze_text(self, text: str, preferences: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return self.analyze_texts([text], preferences)[0]
+
+    def describe_page(self, page) -> Optional[str]:
+        if not self.supports_vision:
+            return None
+        return self.describe_pages([page])[0]
+
+    def _map(self, function, items):
+        if self.max_batch <= 1 or len(items) <= 1:
+            return [function(item) for item in items]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.max_batch, len(items))) as executor:
+            return list(executor.map(tracing.bind(function), items))
+
+
+class MistralBackend(DetectorBackend):
+    """Mistral chat model for texts and Pixtral for page images."""
+    name = 'mistral'
+    supports_vision = True
+    # The adaptive limiter decides how many of these calls actually run at once
+    max_batch = CONCURRENCY_MAX
+
+    def analyze_texts(self, texts, preferences):
+        return self._map(lambda text: analyze_text_with_mistral(text, preferences), texts)
+
+    def describe_pages(self, pages):
+        return self._map(analyze_page_with_pixtral, pages)
+
+
+class RulesBackend(DetectorBackend):
+    """
+    Regular expressions only, no model calls.
+
+    Meant for offline runs and tests of the whole pipeline. Names cannot be
+    detected by rules and are never reported.
+    """
+    name = 'rules'
+    requests_per_text = 0
+
+    PATTERNS = {
+        'emails': [r'[\w.+-]+@[\w-]+(?:\.[\w-]+)*\.[A-Za-z]{2,}'],
+        'phone_numbers': [r'(?<!\w)(?:\+\d{2}[\s/-]?|0)\d{2,5}[\s/-]?\d[\d\s/-]{4,12}\d(?!\w)'],
+        'dates': [
+            r'\b\d{1,2}\.\s?\d{1,2}\.\s?(?:\d{4}|\d{2})\b',
+            r'\b\d{4}-\d{2}-\d{2}\b',
+            r'\b\d{1,2}\.\s(?:Januar|Februar|März|April|Mai|Juni|Juli|August|September|Oktober|November|Dezember)\s\d{4}\b'
+        ],
+        'ids': [
+            r'\b[A-Z]{2}\d{2}(?:\s?[A-Z0-9]{4}){3,7}(?:\s?[A-Z0-9]{1,3})?\b',  # IBAN
+            r'\bHR[AB]\s?\d{3,6}\b',  # Handelsregister
+            r'\b\d{2}\s?\d{3}\s?\d{3}\s?\d{3}\b'  # Steuer-ID
+        ],
+        'addresses': [
+            r'[A-ZÄÖÜ][\wäöüß.-]+(?:\s[\wäöüß.-]+)*\s\d+\s?[a-z]?,?\s+\d{5}\s[A-ZÄÖÜ][\wäöüß-]+'
+        ]
+    }
+
+    def __init__(self):
+        self.patterns = {
+            type_id: [re.compile(pattern) for pattern in patterns]
+            for type_id, patterns in self.PATTERNS.items()
+        }
+
+    def analyze_texts(self, texts, preferences):
+        enabled_types = [t for t in enabled_types_from(preferences) if t in self.patterns]
+        return [self._analyze(text, enabled_types) for text in texts]
+
+    def _analyze(self, text, enabled_types):
+        findings = []
+        for type_id in enabled_types:
+            for pattern in self.patterns[type_id]:
+                for match in pattern.finditer(text):
+                    findings.append({
+                        'text': match.group().strip(),
+                        'type': type_id,
+                        'confidence': RULES_CONFIDENCE,
+                        'start_index': match.start()
+                    })
+        return findings
+
+
+class OpenAICompatibleBackend(DetectorBackend):
+    """
+    Any server exposing the OpenAI chat completions API, e.g. a self-hosted
+    vLLM, llama.cpp or Ollama instance.
+
+    A batch is sent as up to LOCAL_LLM_MAX_BATCH concurrent requests, which
+    these servers schedule together on the GPU (continuous batching); the
+    adaptive limiter still caps the requests of the whole worker.
+    """
+    name = 'openai'
+    max_batch = LOCAL_LLM_MAX_BATCH
+
+    def __init__(self, base_url=LOCAL_LLM_BASE_URL, model=LOCAL_LLM_MODEL,
+                 vision_model=LOCAL_LLM_VISION_MODEL, api_key=LOCAL_LLM_API_KEY):
+        self.model = model
+        self.vision_model = vision_model
+        self.supports_vision = bool(vision_model)
+        headers = {'Authorization': f'Bearer {api_key}'} if api_key else {}
+        self.client = httpx.Client(base_url=base_url, headers=headers, timeout=LOCAL_LLM_TIMEOUT)
+
+    def _complete(self, model, messages, json_mode=False):
+        body = {'model': model, 'messages': messages, 'temperature': 0.1}
+        if json_mode:
+            body['response_format'] = {'type': 'json_object'}
+        kind = 'vision' if model == self.vision_model else 'text'
+        with tracing.span('llm.chat', backend=self.name, kind=kind, model=model) as span:
+            with get_limiter().slot(kind):
+                response = self.client.post('/chat/completions', json=body)
+                response.raise_for_status()
+            data = response.json()
+            usage = data.get('usage') or {}
+            span.set(prompt_tokens=usage.get('prompt_tokens'), completion_tokens=usage.get('completion_tokens'))
+        return data['choices'][0]['message']['content']
+
+    def analyze_texts(self, texts, preferences):
+        def analyze(text):
+            try:
+                messages = build_messages(text, preferences)
+                if messages is None:
+                    return []
+                return parse_findings(self._complete(self.model, messages, json_mode=True))
+            except Exception as e:
+                logger.error(f"Error in text analysis with {self.model}: {e}")
+                return []
+        return self._map(analyze, texts)
+
+    def describe_pages(self, pages):
+        if not self.supports_vision:
+            return [None] * len(pages)
+
+        def describe(page):
+            try:
+                base64_image = encode_page_as_base64(page)
+                if not base64_image:
+                    return None
+                messages = [{
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": "Change this image to a json object."},
+                        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_image}"}}
+                    ]
+                }]
+                return self._complete(self.vision_model, messages)
+            except Exception as e:
+                logger.error(f"Error in page analysis with {self.vision_model}: {e}")
+                return None
+        return self._map(describe, pages)
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (MistralBackend, RulesBackend, OpenAICompatibleBackend)
+}
+
+_detector = None
+
+
+def get_detector() -> DetectorBackend:
+    """Returns the process-wide backend selected by DETECTOR_BACKEND."""
+    global _detector
+    if _detector is None:
+        if DETECTOR_BACKEND not in BACKENDS:
+            raise ValueError(f"Unknown DETECTOR_BACKEND '{DETECTOR_BACKEND}', "
+                             f"expected one of {', '.join(BACKENDS)}")
+        _detector = BACKENDS[DETECTOR_BACKEND]()
+        logger.info(f"Using detector backend '{DETECTOR_BACKEND}' (vision: {_detector.supports_vision})")
+    return _detector
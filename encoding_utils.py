@@ -1,35 +1,68 @@
-import os
-import tempfile
 import base64
+import fitz
 import logging
 
 logger = logging.getLogger(__name__)
 
+def get_page_pixmap(page, zoom=1):
+    """Rendert eine PDF-Seite höchstens einmal pro Auflösung.
+
+    Gerenderte Pixmaps werden an der Seite zwischengespeichert (page.render_cache,
+    analog zu page.ocr_data). Liegt bereits ein Rendering mit einer um eine
+    Zweierpotenz höheren Auflösung vor, wird das angeforderte Bild daraus durch
+    Verkleinern im Speicher abgeleitet statt die Seite erneut zu rastern.
+
+    Args:
+        page: Eine PyMuPDF-Seite
+        zoom (int): Zoomfaktor relativ zu 72 dpi
+
+    Returns:
+        fitz.Pixmap: RGB-Pixmap ohne Alphakanal
+    """
+    if not hasattr(page, 'render_cache'):
+        page.render_cache = {}
+    cache = page.render_cache
+
+    if zoom in cache:
+        return cache[zoom]
+
+    # Suche ein höher aufgelöstes Rendering, aus dem sich das Bild ableiten lässt
+    for cached_zoom in sorted(cache, reverse=True):
+        factor = cached_zoom / zoom
+        shrink = int(factor).bit_length() - 1
+        if factor > 1 and factor == 2 ** shrink:
+            # Die Kopie ohne Alphakanal anlegen (Pixmap(src) allein fügt einen hinzu)
+            pix = fitz.Pixmap(cache[cached_zoom], 0)
+            pix.shrink(shrink)
+            logger.debug(f"Pixmap für Zoom {zoom} aus Zoom {cached_zoom} abgeleitet")
+            break
+    else:
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+
+    cache[zoom] = pix
+    return pix
+
+def clear_render_cache(page):
+    """Gibt die zwischengespeicherten Pixmaps einer Seite frei."""
+    if hasattr(page, 'render_cache'):
+        page.render_cache.clear()
+
 def encode_page_as_base64(page):
     """Konvertiert eine PDF-Seite in ein base64-kodiertes Bild.
-    
+
     Args:
         page: Eine PyMuPDF-Seite
-        
+
     Returns:
         str: Base64-kodiertes Bild oder None bei Fehler
     """
     try:
-        # Konvertiere PDF-Seite zu Bild
-        pix = page.get_pixmap()
-        
-        # Erstelle temporäre Bilddatei
-        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_img:
-            pix.save(temp_img.name)
-            
-            # Konvertiere zu Base64
-            with open(temp_img.name, "rb") as image_file:
-                base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-            
-        # Lösche temporäre Datei
-        os.unlink(temp_img.name)
-        return base64_image
-        
+        # Konvertiere PDF-Seite zu Bild (ggf. aus dem OCR-Rendering abgeleitet)
+        pix = get_page_pixmap(page, zoom=1)
+
+        # PNG direkt im Speicher kodieren, ohne temporäre Datei
+        return base64.b64encode(pix.tobytes("png")).decode('utf-8')
+
     except Exception as e:
         logger.error(f"Fehler bei der Base64-Kodierung: {e}")
-        return None
\ No newline at end of file
+        return None
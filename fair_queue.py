@@ -0,0 +1,302 @@
+from config import *
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+import redis
+import metrics
+import serialization
+import tracing
+import workers
+from redis_store import get_redis, key
+from routing import LANES
+
+logger = logging.getLogger(__name__)
+
+RUNNING_CLIENTS_KEY = key('fair', 'running_clients')
+DISPATCH_RECORD_TTL = 24 * 3600
+
+
+def _queue_key(lane: str) -> str:
+    return key('fair', 'queue', lane)
+
+
+def _vtime_key(lane: str) -> str:
+    return key('fair', 'vtime', lane)
+
+
+def _last_finish_key(lane: str) -> str:
+    return key('fair', 'last_finish', lane)
+
+
+def _running_key(lane: str) -> str:
+    return key('fair', 'running', lane)
+
+
+def _job_key(task_id: str) -> str:
+    return key('fair', 'job', task_id)
+
+
+def _dispatched_key(task_id: str) -> str:
+    return key('fair', 'dispatched', task_id)
+
+
+def weight(client_id: str) -> float:
+    return max(CLIENT_WEIGHTS.get(client_id, 1.0), 0.001)
+
+
+def window(lane: str, client=None) -> int:
+    """
+    Jobs of a lane that may be queued or running in Celery at a time.
+
+    FAIR_DISPATCH_WINDOW if set, otherwise the summed concurrency of the
+    live workers consuming the lane's queue (workers.py). Without a live
+    worker nothing is dispatched; the jobs wait in the fair queue until one
+    starts.
+    """
+    if FAIR_DISPATCH_WINDOW:
+        return FAIR_DISPATCH_WINDOW
+    return workers.capacity([LANES[lane]], client or get_redis())
+
+
+def send_to_celery(job: Dict[str, Any]) -> None:
+    """Hands a dispatched job to its Celery queue by task name."""
+    from celery_app import celery
+    celery.send_task(job['task'], args=job['args'], kwargs=job['kwargs'],
+                     queue=job['queue'], task_id=job['task_id'], headers=job.get('headers'))
+
+
+def enqueue(task_id: str, task_name: str, args: tuple, kwargs: Dict[str, Any],
+            client_id: str, lane: str, queue: str, cost: float) -> Optional[float]:
+    """
+    Adds a job to the weighted fair queue of its lane.
+
+    Self-clocked fair queuing: the job's tag is
+    max(lane virtual time, client's last tag) + cost / weight, and jobs are
+    dispatched in tag order. A client that submits thousands of pages only
+    pushes its own tags into the future; another client's next job is tagged
+    near the current virtual time and goes out first.
+
+    Returns:
+        float: The finish tag of the job, None if Redis failed and the caller
+        should enqueue the job directly
+    """
+    try:
+        finish = _tag(task_id, task_name, args, kwargs, client_id, lane, queue, cost)
+    except redis.RedisError as e:
+        # Fails open: the job bypasses the fair queue
+        logger.error(f"Error fair-queuing task {task_id}: {e}")
+        return None
+    metrics.incr(f"fair.{client_id}.enqueued")
+    logger.info(f"Fair-queued task {task_id} of {client_id} on {lane} lane with tag {finish:.2f}")
+    return finish
+
+
+def _tag(task_id: str, task_name: str, args: tuple, kwargs: Dict[str, Any],
+         client_id: str, lane: str, queue: str, cost: float) -> float:
+    client = get_redis()
+    client.set(_job_key(task_id), serialization.dumps({
+        "task_id": task_id,
+        "task": task_name,
+        "args": list(args),
+        "kwargs": kwargs,
+        "client_id": client_id,
+        "lane": lane,
+        "queue": queue,
+        "cost": cost,
+        "enqueued_at": time.time(),
+        "headers": tracing.inject()
+    }), ex=FAIR_JOB_TTL_SECONDS)
+
+    def tag_job(pipe):
+        vtime = float(pipe.get(_vtime_key(lane)) or 0)
+        last_finish = float(pipe.hget(_last_finish_key(lane), client_id) or 0)
+        finish = max(vtime, last_finish) + cost / weight(client_id)
+        pipe.multi()
+        pipe.hset(_last_finish_key(lane), client_id, finish)
+        pipe.zadd(_queue_key(lane), {task_id: finish})
+        return finish
+
+    return client.transaction(tag_job, _vtime_key(lane), _last_finish_key(lane), value_from_callable=True)
+
+
+def _claim_next(lane: str) -> Optional[Dict[str, Any]]:
+    """
+    Atomically takes the job with the smallest tag whose client is below its
+    running limit, if the lane still has room in its dispatch window.
+    """
+    client = get_redis()
+    chosen = {}
+
+    def claim(pipe):
+        chosen.clear()
+        if int(pipe.get(_running_key(lane)) or 0) >= window(lane, pipe):
+            return
+        for task_id, finish in pipe.zrange(_queue_key(lane), 0, FAIR_SCAN_DEPTH - 1, withscores=True):
+            task_id = task_id.decode()
+            data = pipe.get(_job_key(task_id))
+            if data is None:
+                # Payload expired; drop the orphaned queue entry
+                pipe.multi()
+                pipe.zrem(_queue_key(lane), task_id)
+                chosen['expired'] = task_id
+                return
+            job = serialization.loads(data)
+            if (FAIR_MAX_RUNNING_PER_CLIENT and
+                    int(pipe.hget(RUNNING_CLIENTS_KEY, job['client_id']) or 0) >= FAIR_MAX_RUNNING_PER_CLIENT):
+                continue
+            pipe.multi()
+            pipe.zrem(_queue_key(lane), task_id)
+            pipe.set(_vtime_key(lane), finish)
+            pipe.incr(_running_key(lane))
+            pipe.hincrby(RUNNING_CLIENTS_KEY, job['client_id'], 1)
+            pipe.set(_dispatched_key(task_id), f"{lane}|{job['client_id']}", ex=DISPATCH_RECORD_TTL)
+            pipe.delete(_job_key(task_id))
+            chosen['job'] = job
+            return
+
+    client.transaction(claim, _running_key(lane), _queue_key(lane), RUNNING_CLIENTS_KEY)
+    if 'expired' in chosen:
+        logger.warning(f"Dropped fair-queued task {chosen['expired']} whose payload expired")
+        return _claim_next(lane)
+    return chosen.get('job')
+
+
+def dispatch(lane: str, send: Callable[[Dict[str, Any]], None] = send_to_celery) -> List[str]:
+    """
+    Moves jobs from the fair queue to Celery until the lane's dispatch window
+    (window() jobs queued or running in Celery) is full.
+
+    Called after every enqueue and after every finished task. Keeping the
+    window small leaves the ordering decision to the fair queue instead of
+    Celery's FIFO queues.
+
+    Returns:
+        list: IDs of the dispatched tasks
+    """
+    dispatched = []
+    try:
+        while True:
+            job = _claim_next(lane)
+            if job is None:
+                break
+            try:
+                send(job)
+            except Exception as e:
+                # Give the slot back; the job goes out with the next dispatch
+                logger.error(f"Error sending fair-queued task {job['task_id']} to Celery: {e}")
+                _requeue(job)
+                break
+            dispatched.append(job['task_id'])
+
+            client_id = job['client_id']
+            metrics.incr(f"fair.{client_id}.dispatched")
+            metrics.incr(f"fair.{client_id}.cost_dispatched", job['cost'])
+            metrics.incr(f"fair.{client_id}.wait_seconds", time.time() - job['enqueued_at'])
+    except redis.RedisError as e:
+        logger.error(f"Error dispatching fair-queued jobs on {lane} lane: {e}")
+    return dispatched
+
+
+def _requeue(job: Dict[str, Any]) -> None:
+    client = get_redis()
+    lane = job['lane']
+    vtime = float(client.get(_vtime_key(lane)) or 0)
+    pipe = client.pipeline()
+    pipe.set(_job_key(job['task_id']), serialization.dumps(job), ex=FAIR_JOB_TTL_SECONDS)
+    pipe.zadd(_queue_key(lane), {job['task_id']: vtime})
+    pipe.decr(_running_key(lane))
+    pipe.hincrby(RUNNING_CLIENTS_KEY, job['client_id'], -1)
+    pipe.delete(_dispatched_key(job['task_id']))
+    pipe.execute()
+
+
+def complete(task_id: str, send: Callable[[Dict[str, Any]], None] = send_to_celery) -> None:
+    """Frees the dispatch slot of a finished task and dispatches the next jobs."""
+    try:
+        client = get_redis()
+        record = client.get(_dispatched_key(task_id))
+        if record is None:
+            return
+        lane, client_id = record.decode().split('|', 1)
+        pipe = client.pipeline()
+        pipe.decr(_running_key(lane))
+        pipe.hincrby(RUNNING_CLIENTS_KEY, client_id, -1)
+        pipe.delete(_dispatched_key(task_id))
+        running, *_ = pipe.execute()
+        if running < 0:
+            client.set(_running_key(lane), 0)
+    except redis.RedisError as e:
+        logger.error(f"Error completing fair-queued task {task_id}: {e}")
+        return
+    dispatch(lane, send)
+
+
+def restart(lane: str, send: Callable[[Dict[str, Any]], None] = send_to_celery) -> List[str]:
+    """
+    Frees all dispatch slots of a lane after its Celery queue was purged,
+    then dispatches again.
+
+    Only valid while no other live worker consumes the lane: every job
+    dispatched on it is then either gone with the purge or was lost with its
+    worker. Queued jobs, virtual times and client tags are kept, so uploads
+    waiting in the fair queue survive worker starts, restarts and scaling.
+
+    Returns:
+        list: IDs of the dropped tasks, to be released elsewhere as well
+    """
+    dropped = []
+    try:
+        client = get_redis()
+        for name in client.scan_iter(match=key('fair', 'dispatched', '*')):
+            record = client.get(name)
+            if record is None or record.decode().split('|', 1)[0] != lane:
+                continue
+            task_id = name.decode().rsplit(':', 1)[1]
+            client_id = record.decode().split('|', 1)[1]
+            pipe = client.pipeline()
+            pipe.hincrby(RUNNING_CLIENTS_KEY, client_id, -1)
+            pipe.delete(name)
+            pipe.execute()
+            dropped.append(task_id)
+        client.set(_running_key(lane), 0)
+    except redis.RedisError as e:
+        logger.error(f"Error restarting {lane} lane of the fair queue: {e}")
+        return dropped
+    if dropped:
+        logger.info(f"Freed {len(dropped)} dispatch slots of the {lane} lane")
+    dispatch(lane, send)
+    return dropped
+
+
+def reset() -> None:
+    """Forgets dispatch slots and queued jobs (benchmarks)."""
+    try:
+        client = get_redis()
+        for name in client.scan_iter(match=key('fair', '*')):
+            client.delete(name)
+    except Exception as e:
+        logger.error(f"Error resetting fair queue: {e}")
+
+
+def state() -> Dict[str, Any]:
+    """Queue lengths and running jobs per lane and client, for the metrics endpoint."""
+    client = get_redis()
+    lanes = {}
+    for lane in LANES:
+        lanes[lane] = {
+            "window": window(lane, client),
+            "queued": client.zcard(_queue_key(lane)),
+            "running": int(client.get(_running_key(lane)) or 0),
+            "virtual_time": round(float(client.get(_vtime_key(lane)) or 0), 2)
+        }
+    running_clients = {
+        name.decode(): int(count)
+        for name, count in client.hgetall(RUNNING_CLIENTS_KEY).items()
+        if int(count) > 0
+    }
+    return {
+        "enabled": FAIR_QUEUING_ENABLED,
+        "lanes": lanes,
+        "running_per_client": running_clients,
+        "weights": CLIENT_WEIGHTS
+    }
@@ -0,0 +1,202 @@
+from config import *
+import asyncio
+import bisect
+import logging
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict
+from concurrency import get_limiter, is_rate_limited
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyTracker:
+    """Recent call latencies of one call kind, kept sorted for percentiles."""
+
+    def __init__(self, window: int = HEDGE_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.sorted = []
+        self.lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self.lock:
+            if len(self.samples) == self.samples.maxlen:
+                self.sorted.pop(bisect.bisect_left(self.sorted, self.samples[0]))
+            self.samples.append(seconds)
+            bisect.insort(self.sorted, seconds)
+
+    def count(self) -> int:
+        return len(self.samples)
+
+    def percentile(self, percent: float) -> float:
+        with self.lock:
+            if not self.sorted:
+                return 0.0
+            index = min(len(self.sorted) - 1, int(len(self.sorted) * percent / 100))
+            return self.sorted[index]
+
+    def expected_remaining(self, elapsed: float) -> float:
+        """Mean remaining time of recorded calls that took longer than elapsed."""
+        with self.lock:
+            longer = self.sorted[bisect.bisect_right(self.sorted, elapsed):]
+        if not longer:
+            return 0.0
+        return sum(longer) / len(longer) - elapsed
+
+
+class HedgeBudget:
+    """Allows a duplicate request for at most HEDGE_BUDGET of all calls."""
+
+    def __init__(self, ratio: float = HEDGE_BUDGET):
+        self.ratio = ratio
+        self.calls = 0
+        self.hedges = 0
+        self.lock = threading.Lock()
+
+    def count_call(self) -> None:
+        with self.lock:
+            self.calls += 1
+
+    def try_acquire(self) -> bool:
+        with self.lock:
+            if self.hedges + 1 > self.ratio * self.calls:
+                return False
+            self.hedges += 1
+            return True
+
+
+_trackers: Dict[str, LatencyTracker] = {}
+_budget = HedgeBudget()
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_tracker(kind: str) -> LatencyTracker:
+    with _loop_lock:
+        if kind not in _trackers:
+            _trackers[kind] = LatencyTracker()
+        return _trackers[kind]
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """Event loop in a daemon thread that runs the hedged calls of this process."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='hedging-loop', daemon=True).start()
+        return _loop
+
+
+def hedge_delay(kind: str) -> float:
+    return max(HEDGE_MIN_DELAY, get_tracker(kind).percentile(HEDGE_PERCENTILE))
+
+
+async def _timed(call: Callable[[], Awaitable]):
+    started = time.monotonic()
+    result = await call()
+    return result, time.monotonic() - started
+
+
+def _reserve_hedge(kind: str) -> bool:
+    """Takes a limiter slot and hedge budget for a backup request, or neither."""
+    limiter = get_limiter()
+    if not limiter.try_acquire():
+        metrics.incr(f"hedge.{kind}.no_slot")
+        return False
+    if not _budget.try_acquire():
+        limiter.discard()
+        return False
+    return True
+
+
+async def _timed_in_slot(kind: str, call: Callable[[], Awaitable]):
+    """Like _timed for a call whose limiter slot was taken with try_acquire."""
+    limiter = get_limiter()
+    started = time.monotonic()
+    try:
+        result = await call()
+    except asyncio.CancelledError:
+        limiter.discard()
+        raise
+    except Exception as e:
+        limiter.release(kind, time.monotonic() - started, is_rate_limited(e))
+        raise
+    elapsed = time.monotonic() - started
+    limiter.release(kind, elapsed)
+    return result, elapsed
+
+
+async def _race(kind: str, call: Callable[[], Awaitable]):
+    tracker = get_tracker(kind)
+    started = time.monotonic()
+    primary = asyncio.ensure_future(_timed(call))
+
+    # Ohne genügend Messwerte oder Budget wird nicht dupliziert
+    if tracker.count() < HEDGE_MIN_SAMPLES:
+        result, elapsed = await primary
+        tracker.record(elapsed)
+        return result
+
+    delay = hedge_delay(kind)
+    done, _ = await asyncio.wait({primary}, timeout=delay)
+    if done or not _reserve_hedge(kind):
+        result, elapsed = await primary
+        tracker.record(elapsed)
+        return result
+
+    metrics.incr(f"hedge.{kind}.issued")
+    logger.info(f"{kind} call still running after {delay:.1f}s, issuing a hedged request")
+    backup = asyncio.ensure_future(_timed_in_slot(kind, call))
+    pending = {primary, backup}
+    error = None
+
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is not None:
+                error = future.exception()
+                continue
+
+            # Erste erfolgreiche Antwort gewinnt, die andere Anfrage wird abgebrochen
+            for loser in pending:
+                loser.cancel()
+            result, elapsed = future.result()
+            tracker.record(elapsed)
+            if future is backup:
+                metrics.incr(f"hedge.{kind}.backup_won")
+            if future is backup and primary in pending:
+                # Der Primäraufruf lief noch: Er geht mit seiner bisherigen Dauer als
+                # Untergrenze (zensierter Messwert) in die Statistik ein, sonst sänke das
+                # Perzentil mit jedem gewonnenen Hedge. Seine Restdauer wird geschätzt.
+                primary_elapsed = time.monotonic() - started
+                tracker.record(primary_elapsed)
+                metrics.incr(f"hedge.{kind}.seconds_saved", tracker.expected_remaining(primary_elapsed))
+            return result
+
+    raise error
+
+
+def hedged_call(kind: str, call: Callable[[], Awaitable]):
+    """
+    Runs an async API call and hedges it against tail latency.
+
+    If the call has not finished after the HEDGE_PERCENTILE of recent
+    latencies of this kind (at least HEDGE_MIN_DELAY), an identical second
+    request is started, as long as the process-wide hedge budget allows it
+    and the adaptive limiter (concurrency.py) has a free slot for it; the
+    caller holds the slot of the first request.
+    The first successful response wins and the other request is cancelled.
+
+    Args:
+        kind: Call category with its own latency statistics, e.g. 'text'
+        call: Creates the coroutine for one request; called once per attempt
+
+    Returns:
+        The result of the winning request
+    """
+    _budget.count_call()
+    metrics.incr(f"hedge.{kind}.calls")
+    return asyncio.run_coroutine_threadsafe(_race(kind, call), _get_loop()).result()
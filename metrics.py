@@ -0,0 +1,69 @@
+import logging
+import threading
+from typing import Dict, Optional
+from redis_store import get_redis, key
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = key('metrics')
+
+# In-process counters instead of Redis, see use_local()
+_local: Optional[Dict[str, float]] = None
+_local_lock = threading.Lock()
+
+
+def use_local() -> None:
+    """
+    Keeps all metrics of this process in memory instead of Redis.
+
+    Used by the bulk CLI (bulk.py), which runs the pipeline without any
+    Redis; snapshot() then returns the counters of this process only.
+    """
+    global _local
+    _local = {}
+
+
+def incr(name: str, amount: float = 1) -> None:
+    """Increments a counter shared by the API and all workers."""
+    if _local is not None:
+        with _local_lock:
+            _local[name] = _local.get(name, 0.0) + amount
+        return
+    try:
+        get_redis().hincrbyfloat(METRICS_KEY, name, amount)
+    except Exception as e:
+        logger.error(f"Error updating metric {name}: {e}")
+
+
+def set_gauge(name: str, value: float) -> None:
+    """Sets a gauge to its latest value."""
+    if _local is not None:
+        _local[name] = float(value)
+        return
+    try:
+        get_redis().hset(METRICS_KEY, name, value)
+    except Exception as e:
+        logger.error(f"Error updating metric {name}: {e}")
+
+
+def get_value(name: str, default: float = 0.0) -> float:
+    if _local is not None:
+        return _local.get(name, default)
+    try:
+        value = get_redis().hget(METRICS_KEY, name)
+        return float(value) if value is not None else default
+    except Exception as e:
+        logger.error(f"Error reading metric {name}: {e}")
+        return default
+
+
+def snapshot() -> Dict[str, float]:
+    """Returns all counters and gauges, sorted by name."""
+    if _local is not None:
+        with _local_lock:
+            return dict(sorted(_local.items()))
+    values = get_redis().hgetall(METRICS_KEY)
+    return {
+        name.decode(): float(value)
+        for name, value in sorted(values.items())
+    }
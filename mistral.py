@@ -4,98 +4,204 @@
 
 import json
 import logging
+from jsonschema import Draft7Validator
 from mistralai import Mistral
 from encoding_utils import encode_page_as_base64
+from concurrency import get_limiter
+from hedging import hedged_call
+import metrics
 import os
+import tracing
 from config import *
 
 
 logger = logging.getLogger(__name__)
 
-mistral_client = Mistral(api_key=MISTRAL_API_KEY)
+mistral_client = None
 
-def analyze_text_with_mistral(text, preferences):
-    """Analyze text using Mistral API with improved error handling."""
-    logger.info("Analyzing text with Mistral API")
+# Einmal kompiliert, wird für jede Modellantwort wiederverwendet
+finding_validator = Draft7Validator(FINDING_SCHEMA)
+
+# Ohne diese Felder ist ein Finding unbrauchbar; fehlen nur reason oder
+# start_index, wird es ohne Offset weiterverwendet
+ESSENTIAL_FINDING_FIELDS = {'text', 'type', 'confidence'}
+
+def get_mistral_client():
+    """Erzeugt den Mistral-Client erst beim ersten Aufruf (nicht beim Import)."""
+    global mistral_client
+    if mistral_client is None:
+        mistral_client = Mistral(api_key=MISTRAL_API_KEY)
+    return mistral_client
+
+def enabled_types_from(preferences):
+    """Liefert die in den Nutzereinstellungen aktivierten Typen."""
+    return [
+        option_id for option_id, is_enabled in preferences.items() 
+        if is_enabled and is_enabled is True
+    ]
+
+def build_messages(text, preferences):
+    """
+    Erstellt System- und User-Prompt für die Textanalyse.
     
-    try:
-        prompt_parts = []
-        # Erstelle dynamischen Prompt basierend auf den Nutzereinstellungen
-        enabled_types = [
-            option_id for option_id, is_enabled in preferences.items() 
-            if is_enabled and is_enabled is True
-        ]
-        
-        if not enabled_types:
-            logger.info("Keine Anonymisierungsoptionen aktiviert")
-            return []
-            
-        logger.info("Aktivierte Anonymisierungsoptionen:")
-        for type_id in enabled_types:
-            logger.info(f"  - {type_id}")
+    Wird auch von anderen Chat-Backends (detectors.py) verwendet.
+    
+    Returns:
+        list: Chat-Nachrichten oder None, wenn keine Typen aktiviert sind
+    """
+    prompt_parts = []
+    # Erstelle dynamischen Prompt basierend auf den Nutzereinstellungen
+    enabled_types = enabled_types_from(preferences)
+    
+    if not enabled_types:
+        logger.info("Keine Anonymisierungsoptionen aktiviert")
+        return None
         
-        # Erstelle die Typenliste für den Prompt - NUR für aktivierte Typen
+    logger.info("Aktivierte Anonymisierungsoptionen:")
+    for type_id in enabled_types:
+        logger.info(f"  - {type_id}")
+    
+    # Erstelle die Typenliste für den Prompt - NUR für aktivierte Typen
 
-        # Filtere die Beschreibungen - NUR für aktivierte Typen
-        enabled_type_descriptions = {
-            t: TYPE_DESCRIPTIONS[t] 
-            for t in enabled_types 
-            if t in TYPE_DESCRIPTIONS
-        }
-        
-        # Generiere den angepassten System-Prompt
-        allowed_types_str = ', '.join(f"'{t}'" for t in enabled_types)
-
-        # Füge NUR die aktivierten Typenbeschreibungen hinzu
-
-        prompt_parts = [
-            "Als KI-Assistent für Dokumentenanalyse ist deine Aufgabe, sensible Informationen in dem folgenden Text zu identifizieren.",
-            "",
-            "Für jede gefundene sensible Information gibst du zurück:",
-            "- Den exakten Text",
-            f"- Den Typ der Information (nur folgende Typen sind erlaubt: {allowed_types_str})",
-            "- Die Position (Start-Index) im Text",
-            "- Eine Konfidenz-Bewertung (0-1)",
-            "- Eine kurze Begründung, warum es sich um diesen Typ handelt",
-            "",
-            "Du antwortest ausschließlich im JSON-Format:",
-            "{",
-            '    "document_type": "Dokumenttyp und kurze Begründung",',
-            '    "findings": [',
-            '        {',
-            '            "text": "gefundener Text",',
-            '            "type": "erlaubter_typ",',
-            '            "start_index": position,',
-            '            "confidence": konfidenz,',
-            '            "reason": "Kurze Begründung, warum es sich um diesen Typ handelt"',
-            '        }',
-            '    ]',
-            '}',
-            'Dies sind die Typen, die du analysieren sollst:',
-            ""
-        ]
+    # Filtere die Beschreibungen - NUR für aktivierte Typen
+    enabled_type_descriptions = {
+        t: TYPE_DESCRIPTIONS[t] 
+        for t in enabled_types 
+        if t in TYPE_DESCRIPTIONS
+    }
+    
+    # Generiere den angepassten System-Prompt
+    allowed_types_str = ', '.join(f"'{t}'" for t in enabled_types)
 
-        
-                
-        for type_id, description in enabled_type_descriptions.items():
-            prompt_parts.append(f"   - {description}")
+    # Füge NUR die aktivierten Typenbeschreibungen hinzu
+
+    prompt_parts = [
+        "Als KI-Assistent für Dokumentenanalyse ist deine Aufgabe, sensible Informationen in dem folgenden Text zu identifizieren.",
+        "",
+        "Für jede gefundene sensible Information gibst du zurück:",
+        "- Den exakten Text",
+        f"- Den Typ der Information (nur folgende Typen sind erlaubt: {allowed_types_str})",
+        "- Die Position (Start-Index) im Text",
+        "- Eine Konfidenz-Bewertung (0-1)",
+        "- Eine kurze Begründung, warum es sich um diesen Typ handelt",
+        "",
+        "Du antwortest ausschließlich im JSON-Format:",
+        "{",
+        '    "document_type": "Dokumenttyp und kurze Begründung",',
+        '    "findings": [',
+        '        {',
+        '            "text": "gefundener Text",',
+        '            "type": "erlaubter_typ",',
+        '            "start_index": position,',
+        '            "confidence": konfidenz,',
+        '            "reason": "Kurze Begründung, warum es sich um diesen Typ handelt"',
+        '        }',
+        '    ]',
+        '}',
+        'Dies sind die Typen, die du analysieren sollst:',
+        ""
+    ]
+
+    
             
-        system_prompt = "\n".join(prompt_parts)
-        
-        # Erstelle den User-Prompt
-        user_prompt = f"""Bitte analysiere folgenden Text: /n {text}"""
+    for type_id, description in enabled_type_descriptions.items():
+        prompt_parts.append(f"   - {description}")
         
-        # Log den kompletten Prompt
-        logger.info("=== SYSTEM PROMPT ===")
-        logger.info(system_prompt)
-        logger.info("=== USER PROMPT ===")
-        logger.info(user_prompt)
-        logger.info("=== ENDE PROMPTS ===")
-
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
+    system_prompt = "\n".join(prompt_parts)
+    
+    # Erstelle den User-Prompt
+    user_prompt = f"""Bitte analysiere folgenden Text: /n {text}"""
+    
+    # Log den kompletten Prompt
+    logger.info("=== SYSTEM PROMPT ===")
+    logger.info(system_prompt)
+    logger.info("=== USER PROMPT ===")
+    logger.info(user_prompt)
+    logger.info("=== ENDE PROMPTS ===")
+
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def schema_violations(findings_data):
+    """
+    Prüft eine Modellantwort gegen FINDING_SCHEMA.
+    
+    Returns:
+        tuple: (Fehler auf oberster Ebene oder None, Index -> Menge fehlerhafter Felder)
+    """
+    item_fields = {}
+    for error in finding_validator.iter_errors(findings_data):
+        path = list(error.absolute_path)
+        if len(path) < 2 or path[0] != 'findings':
+            return error.message, {}
+        if error.validator == 'required':
+            fields = {field for field in error.validator_value if field not in error.instance}
+        else:
+            fields = {path[2]} if len(path) > 2 else ESSENTIAL_FINDING_FIELDS
+        item_fields.setdefault(path[1], set()).update(fields)
+    return None, item_fields
+
+def parse_findings(response_content):
+    """
+    Liest die Findings aus der JSON-Antwort eines Chat-Modells.
+    
+    Die Antwort wird gegen FINDING_SCHEMA validiert. Findings mit fehlerhaftem
+    text, type oder confidence werden verworfen, ein ungültiger start_index
+    wird entfernt.
+    
+    Returns:
+        list: Findings mit text, type, confidence und ggf. start_index oberhalb
+        von CONFIDENCE_THRESHOLD
+    """
+    try:
+        findings_data = json.loads(response_content)
+    except json.JSONDecodeError as e:
+        logger.error(f"Invalid JSON in model response: {e}")
+        logger.error(f"Raw response: {response_content}")
+        metrics.incr("schema.invalid_responses")
+        return []
+    
+    response_error, item_errors = schema_violations(findings_data)
+    if response_error:
+        logger.error(f"Model response does not match FINDING_SCHEMA: {response_error}")
+        metrics.incr("schema.invalid_responses")
+        return []
+    
+    # Vereinfache die Findings auf das Wesentliche: Text, Typ, Konfidenz und Position
+    simplified_findings = []
+    rejected = 0
+    for index, finding in enumerate(findings_data.get("findings", [])):
+        bad_fields = item_errors.get(index, set())
+        if bad_fields & ESSENTIAL_FINDING_FIELDS:
+            logger.warning(f"Ignoring finding not matching FINDING_SCHEMA ({', '.join(sorted(bad_fields))}): {finding}")
+            rejected += 1
+            continue
+        if finding['confidence'] >= CONFIDENCE_THRESHOLD:
+            simplified = {
+                'text': finding['text'].strip(),
+                'type': finding['type'],
+                'confidence': finding['confidence']
+            }
+            if 'start_index' in finding and 'start_index' not in bad_fields:
+                # Position des gestrippten Texts
+                simplified['start_index'] = finding['start_index'] + len(finding['text']) - len(finding['text'].lstrip())
+            simplified_findings.append(simplified)
+    
+    if rejected:
+        metrics.incr("schema.invalid_findings", rejected)
+    logger.info(f"Extracted {len(simplified_findings)} findings with sufficient confidence")
+    return simplified_findings
+
+def analyze_text_with_mistral(text, preferences):
+    """Analyze text using Mistral API with improved error handling."""
+    logger.info("Analyzing text with Mistral API")
+    
+    try:
+        messages = build_messages(text, preferences)
+        if messages is None:
+            return []
         
         # Rufe Mistral mit Retry-Mechanismus auf
         chat_response = call_mistral_with_retry(
@@ -104,36 +210,39 @@ def analyze_text_with_mistral(text, preferences):
         )
         
         # Parse die Antwort
-        response_content = chat_response.choices[0].message.content
-        
-        try:
-            findings_data = json.loads(response_content)
-            
-            # Vereinfache die Findings auf das Wesentliche: Text und Typ
-            simplified_findings = []
-            for finding in findings_data.get("findings", []):
-                if finding.get('confidence', 0) >= CONFIDENCE_THRESHOLD:
-                    simplified_findings.append({
-                        'text': finding['text'].strip(),
-                        'type': finding['type']
-                    })
-            
-            logger.info(f"Extracted {len(simplified_findings)} findings with sufficient confidence")
-            return simplified_findings
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Invalid JSON in Mistral response: {e}")
-            logger.error(f"Raw response: {response_content}")
-            return []
+        return parse_findings(chat_response.choices[0].message.content)
         
     except Exception as e:
         logger.error(f"Fatal error in text analysis: {e}")
         return []
     
+def complete_chat(kind, **request):
+    """
+    Führt eine Chat-Anfrage aus, bei HEDGING_ENABLED mit Hedged Requests.
+    
+    Die Anzahl gleichzeitiger Anfragen begrenzt der adaptive Limiter des
+    Worker-Prozesses (concurrency.py).
+    
+    Args:
+        kind (str): 'text' oder 'vision', jeweils mit eigener Latenzstatistik
+        **request: Parameter für chat.complete
+    """
+    with tracing.span('llm.chat', backend='mistral', kind=kind, model=request.get('model')) as span:
+        with get_limiter().slot(kind):
+            if not HEDGING_ENABLED:
+                response = get_mistral_client().chat.complete(**request)
+            else:
+                response = hedged_call(kind, lambda: get_mistral_client().chat.complete_async(**request))
+        usage = getattr(response, 'usage', None)
+        if usage:
+            span.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+        return response
+
 def call_mistral_with_retry(messages, model):
     """Ruft die Mistral-API mit Retry-Mechanismus auf."""
     try:
-        return mistral_client.chat.complete(
+        return complete_chat(
+            'text',
             model=model,
             messages=messages,
             response_format={"type": "json_object"}, 
@@ -143,6 +252,24 @@ def call_mistral_with_retry(messages, model):
         logger.error(f"Mistral API error after {MAX_RETRIES} retries: {e}")
         raise
 
+def build_vision_messages(base64_image):
+    """Erstellt die Chat-Nachrichten für die Bildanalyse einer Seite."""
+    return [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": "Change this image to a json object."
+                },
+                {
+                    "type": "image_url",
+                    "image_url": f"data:image/png;base64,{base64_image}"
+                }
+            ]
+        }
+    ]
+
 def analyze_page_with_pixtral(page):
     """Analysiert eine PDF-Seite mit dem Pixtral Vision-Modell."""
     try:
@@ -152,24 +279,11 @@ def analyze_page_with_pixtral(page):
             return None
             
         # Erstelle Pixtral-Anfrage
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": "Change this image to a json object."
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": f"data:image/png;base64,{base64_image}"
-                    }
-                ]
-            }
-        ]
+        messages = build_vision_messages(base64_image)
         
         # Rufe Pixtral API auf
-        chat_response = mistral_client.chat.complete(
+        chat_response = complete_chat(
+            'vision',
             model=os.getenv('MISTRAL_VISION_MODEL'),
             messages=messages
         )
@@ -1,12 +1,59 @@
-import os
-import tempfile
+from config import *
+import functools
 import pytesseract
+import time
 from PIL import Image
-import fitz
 import logging
+from encoding_utils import get_page_pixmap
+import metrics
+import ocr_cache
+import tracing
 
 logger = logging.getLogger(__name__)
 
+# Render- und Tesseract-Einstellungen; gehen in den Cache-Schlüssel ein
+OCR_ZOOM = 2
+OCR_LANG = 'deu+eng'
+OCR_CONFIG = '--psm 1'
+
+@functools.lru_cache(maxsize=1)
+def ocr_settings():
+    """Einstellungen, von denen das OCR-Ergebnis abhängt, inkl. Tesseract-Version."""
+    return {
+        'zoom': OCR_ZOOM,
+        'lang': OCR_LANG,
+        'config': OCR_CONFIG,
+        'tesseract': str(pytesseract.get_tesseract_version())
+    }
+
+def run_tesseract(page):
+    """Rendert die Seite und liefert die Wortboxen von Tesseract."""
+    # Konvertiere Seite zu Bild mit höherer Auflösung; das Rendering wird
+    # für die Pixtral-Analyse wiederverwendet
+    pix = get_page_pixmap(page, OCR_ZOOM)
+    
+    # Bild direkt aus den Pixmap-Samples erzeugen, ohne temporäre PNG-Datei
+    image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+    
+    # OCR mit Tesseract für Text und Koordinaten
+    data = pytesseract.image_to_data(
+        image,
+        lang=OCR_LANG,
+        config=OCR_CONFIG,
+        output_type=pytesseract.Output.DICT
+    )
+    
+    return {
+        'words': data['text'],
+        'conf': data['conf'],
+        'left': data['left'],
+        'top': data['top'],
+        'width': data['width'],
+        'height': data['height'],
+        'zoom': OCR_ZOOM
+    }
+
+@tracing.traced('ocr')
 def perform_ocr_and_add_text_layer(page):
     """
     Führt OCR durch und fügt den erkannten Text als durchsuchbare Ebene ein.
@@ -18,36 +65,26 @@ def perform_ocr_and_add_text_layer(page):
         dict: Dictionary mit OCR-Text und Koordinaten oder None bei Fehler
     """
     try:
-        # Konvertiere Seite zu Bild mit höherer Auflösung
-        zoom = 2
-        mat = fitz.Matrix(zoom, zoom)
-        pix = page.get_pixmap(matrix=mat)
+        key = None
+        if OCR_CACHE_ENABLED:
+            key = ocr_cache.cache_key(page, ocr_settings())
+            cached = ocr_cache.load(key)
+            if cached:
+                page.ocr_data = cached['ocr_data']
+                tracing.annotate(page=page.number + 1, cache_hit=True)
+                logger.info("OCR-Ergebnis aus dem Cache übernommen")
+                return True
         
-        # Speichere temporär als PNG
-        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_file:
-            pix.save(tmp_file.name)
-            
-            # OCR mit Tesseract für Text und Koordinaten
-            data = pytesseract.image_to_data(
-                Image.open(tmp_file.name),
-                lang='deu+eng',
-                config='--psm 1',
-                output_type=pytesseract.Output.DICT
-            )
-        
-        # Lösche temporäre Datei
-        os.unlink(tmp_file.name)
+        started = time.perf_counter()
+        ocr_data = run_tesseract(page)
+        seconds = time.perf_counter() - started
+        metrics.incr('ocr.seconds', seconds)
         
         # Speichere OCR-Ergebnisse für spätere Koordinatensuche
-        page.ocr_data = {
-            'words': data['text'],
-            'conf': data['conf'],
-            'left': data['left'],
-            'top': data['top'],
-            'width': data['width'],
-            'height': data['height'],
-            'zoom': zoom
-        }
+        page.ocr_data = ocr_data
+        tracing.annotate(page=page.number + 1, cache_hit=False, seconds=round(seconds, 3))
+        if key:
+            ocr_cache.store(key, {'ocr_data': ocr_data, 'seconds': seconds})
         
         logger.info("OCR erfolgreich durchgeführt und Daten gespeichert")
         return True
@@ -55,4 +92,3 @@ def perform_ocr_and_add_text_layer(page):
     except Exception as e:
         logger.error(f"Fehler bei OCR: {e}")
         return False
-
@@ -0,0 +1,151 @@
+from config import *
+import fcntl
+import hashlib
+import logging
+import os
+import tempfile
+import zlib
+from typing import Any, Dict, Optional
+import msgpack
+import metrics
+
+logger = logging.getLogger(__name__)
+
+ENTRY_SUFFIX = '.ocr'
+# Running total of the entry sizes, shared by all processes using the directory
+SIZE_FILE = '.size'
+
+
+def cache_key(page, settings: Dict[str, Any]) -> str:
+    """
+    Identifies the OCR input of a page independent of the document around it.
+
+    Hashes the raw streams of all images on the page with their placement,
+    the page geometry, any text already on the page and the OCR settings,
+    so a re-sent scan hits the cache even inside a different PDF.
+    """
+    digest = hashlib.sha256()
+    digest.update(repr(sorted(settings.items())).encode())
+    digest.update(repr((tuple(page.rect), page.rotation)).encode())
+    digest.update(page.get_text("text").encode())
+
+    doc = page.parent
+    images = page.get_image_info(xrefs=True)
+    if any(not image['xref'] for image in images):
+        # Inline images have no stream of their own; fall back to PyMuPDF's pixel digest
+        images = page.get_image_info(hashes=True, xrefs=True)
+    for image in sorted(images, key=lambda i: tuple(i['bbox'])):
+        digest.update(repr(tuple(round(c, 1) for c in image['bbox'])).encode())
+        if image['xref']:
+            digest.update(hashlib.sha256(doc.xref_stream_raw(image['xref']) or b'').digest())
+        else:
+            digest.update(image['digest'])
+    return digest.hexdigest()
+
+
+def _path(key: str) -> Path:
+    return OCR_CACHE_DIR / f"{key}{ENTRY_SUFFIX}"
+
+
+def load(key: str) -> Optional[Dict[str, Any]]:
+    """Returns a cached OCR result and marks it as recently used, None on a miss."""
+    path = _path(key)
+    try:
+        with open(path, 'rb') as f:
+            entry = msgpack.unpackb(zlib.decompress(f.read()))
+        os.utime(path)
+    except FileNotFoundError:
+        metrics.incr('ocr_cache.misses')
+        return None
+    except Exception as e:
+        logger.warning(f"Discarding unreadable OCR cache entry {key}: {e}")
+        path.unlink(missing_ok=True)
+        metrics.incr('ocr_cache.misses')
+        return None
+
+    metrics.incr('ocr_cache.hits')
+    metrics.incr('ocr_cache.seconds_saved', entry.get('seconds', 0))
+    return entry
+
+
+def store(key: str, entry: Dict[str, Any]) -> None:
+    """Writes an OCR result atomically and evicts old entries above the size limit."""
+    try:
+        OCR_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        data = zlib.compress(msgpack.packb(entry), 6)
+        path = _path(key)
+        try:
+            replaced = path.stat().st_size
+        except FileNotFoundError:
+            replaced = 0
+        with tempfile.NamedTemporaryFile(dir=OCR_CACHE_DIR, suffix='.tmp', delete=False) as f:
+            f.write(data)
+        os.replace(f.name, path)
+
+        # Only the running total is updated per store; the directory is
+        # scanned when it exceeds the limit (or is not known yet)
+        total = _update_size(delta=len(data) - replaced)
+        if total is None or total > OCR_CACHE_MAX_BYTES:
+            evict()
+    except Exception as e:
+        logger.error(f"Error storing OCR cache entry {key}: {e}")
+
+
+def _update_size(delta: int = 0, total: Optional[int] = None) -> Optional[int]:
+    """
+    Adds delta to the running total in SIZE_FILE (or sets it to total)
+    under an exclusive lock.
+
+    Returns:
+        int: The new total, None if no total was recorded yet
+    """
+    with open(OCR_CACHE_DIR / SIZE_FILE, 'a+b') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        if total is None:
+            f.seek(0)
+            recorded = f.read().strip()
+            if not recorded.isdigit():
+                return None
+            total = max(int(recorded) + delta, 0)
+        f.seek(0)
+        f.truncate()
+        f.write(str(total).encode())
+        return total
+
+
+def evict(max_bytes: Optional[int] = None) -> int:
+    """
+    Removes the least recently used entries until the cache is below
+    max_bytes again (90% of it, so the next stores do not scan again).
+
+    Scans the whole directory, so store() only calls it when the running
+    total in SIZE_FILE exceeds the limit; the scan also corrects that total
+    for entries other processes removed or replaced in between.
+
+    Returns:
+        int: Number of removed entries
+    """
+    max_bytes = max_bytes or OCR_CACHE_MAX_BYTES
+    entries = []
+    total = 0
+    for entry in os.scandir(OCR_CACHE_DIR):
+        if entry.name.endswith(ENTRY_SUFFIX):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+    removed = 0
+    if total > max_bytes:
+        for _, size, path in sorted(entries):
+            if total <= max_bytes * 0.9:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+                removed += 1
+            except FileNotFoundError:
+                pass
+        metrics.incr('ocr_cache.evictions', removed)
+        logger.info(f"Evicted {removed} OCR cache entries, {total} bytes remain")
+    _update_size(total=total)
+    return removed
@@ -0,0 +1,164 @@
+from config import *
+import concurrent.futures
+import logging
+import time
+from detectors import get_detector
+from utils import extract_page_text, finish_page_analysis, locate_findings, redact_page
+import dedup
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Document pipeline shared by the Celery tasks (tasks.py) and the bulk CLI
+# (bulk.py); nothing here depends on Celery or Redis.
+
+def analyze_pages(doc, preferences, pages=None, progress=None):
+    """
+    Finds sensitive information on the given pages.
+    
+    The page texts (with OCR and the vision description) are extracted in the
+    page thread pool. As soon as DETECTOR_BATCH_PAGES texts are ready, or the
+    first waiting text is DETECTOR_BATCH_LINGER seconds old, they are handed
+    to the detector in one analyze_texts call while the extraction of the
+    remaining pages continues, so backends that batch requests
+    (OpenAICompatibleBackend) see several pages at once without waiting for
+    the slowest page of the document.
+    
+    Args:
+        doc: Open PyMuPDF document
+        preferences: Anonymization preferences
+        pages: Optional page numbers to analyze, defaults to all pages
+        progress: Optional callback(completed_pages, total_pages), called for
+            every extracted page
+        
+    Returns:
+        dict: page_num -> located findings for all pages that did not fail
+    """
+    total_pages = len(doc)
+    if pages is None:
+        pages = range(total_pages)
+    # doc[i] returns a new page object every time; OCR leaves its word boxes
+    # on the object it ran on (page.ocr_data), so the findings are located on
+    # the same objects the texts were extracted from
+    page_objects = {page_num: doc[page_num] for page_num in pages}
+    if not page_objects:
+        return {}
+    detector = get_detector()
+    
+    def extract(page_num):
+        with tracing.span('page.extract_page_text', page=page_num + 1):
+            return extract_page_text((page_objects[page_num], page_num, total_pages, preferences))
+    
+    def detect(batch):
+        batch_pages = [page_num for page_num, text in batch]
+        try:
+            with tracing.span('detect', backend=detector.name, pages=len(batch)):
+                batch_findings = detector.analyze_texts([text for page_num, text in batch], preferences)
+        except Exception as e:
+            logger.error(f"Error analyzing pages {', '.join(str(page_num + 1) for page_num in batch_pages)}: {str(e)}")
+            return {}
+        
+        located = {}
+        for (page_num, text), sensitive_data in zip(batch, batch_findings):
+            try:
+                located[page_num] = finish_page_analysis(page_objects[page_num], text, sensitive_data)
+            except Exception as e:
+                logger.error(f"Error processing page {page_num}: {str(e)}")
+        return located
+    
+    # The pools only bound the threads; concurrent LLM calls are limited by
+    # the adaptive limiter shared by all documents of this process (concurrency.py)
+    workers = min(CONCURRENCY_MAX, len(page_objects))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as extract_pool, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=workers) as detect_pool:
+        extracting = {extract_pool.submit(tracing.bind(extract), page_num): page_num for page_num in page_objects}
+        detecting = []
+        ready = []
+        ready_since = None
+        completed_pages = 0
+        
+        while extracting:
+            timeout = None if not ready else max(0.0, ready_since + DETECTOR_BATCH_LINGER - time.monotonic())
+            done, _ = concurrent.futures.wait(extracting, timeout=timeout,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                page_num = extracting.pop(future)
+                completed_pages += 1
+                if progress:
+                    progress(completed_pages, total_pages)
+                try:
+                    ready.append(future.result())
+                except Exception as e:
+                    logger.error(f"Error processing page {page_num}: {str(e)}")
+                    continue
+                if ready_since is None:
+                    ready_since = time.monotonic()
+            
+            while len(ready) >= DETECTOR_BATCH_PAGES:
+                detecting.append(detect_pool.submit(tracing.bind(detect), ready[:DETECTOR_BATCH_PAGES]))
+                ready = ready[DETECTOR_BATCH_PAGES:]
+                ready_since = time.monotonic() if ready else None
+            if ready and (not extracting or time.monotonic() - ready_since >= DETECTOR_BATCH_LINGER):
+                detecting.append(detect_pool.submit(tracing.bind(detect), ready))
+                ready = []
+                ready_since = None
+        
+        page_findings = {}
+        for future in detecting:
+            page_findings.update(future.result())
+    
+    return page_findings
+
+def analyze_document(doc, preferences, progress=None):
+    """
+    Finds sensitive information on all pages, analyzing repeated content once.
+    
+    With DEDUP_ENABLED, identical pages are analyzed only for their first
+    occurrence and text blocks repeated across pages (headers, footers,
+    disclaimers) in a single document-level Mistral call; see dedup.py.
+    
+    Args:
+        doc: Open PyMuPDF document
+        preferences: Anonymization preferences
+        progress: Optional callback(completed_pages, total_pages)
+    
+    Returns:
+        tuple: (page_num -> located findings, dedup statistics)
+    """
+    if not DEDUP_ENABLED:
+        return analyze_pages(doc, preferences, progress=progress), {}
+    
+    with tracing.span('dedup', pages=len(doc)) as span:
+        plan = dedup.plan_document(doc)
+        dedup.attach_page_contexts(doc, plan, dedup.analyze_repeated_blocks(plan, preferences))
+        span.set(duplicate_pages=len(plan['duplicate_of']), repeated_blocks=len(plan['repeated_blocks']))
+    
+    canonical_pages = [i for i in range(len(doc)) if i not in plan['duplicate_of']]
+    page_findings = analyze_pages(doc, preferences, canonical_pages, progress)
+    
+    # Identical pages reuse the findings of their first occurrence
+    for page_num, original in plan['duplicate_of'].items():
+        if original in page_findings:
+            findings = [{k: v for k, v in item.items() if k != 'rects'} for item in page_findings[original]]
+            page_findings[page_num] = locate_findings(doc[page_num], findings)
+    
+    stats = dedup.savings(doc, plan)
+    for name, value in stats.items():
+        metrics.incr(f"dedup.{name}", value)
+    return page_findings, stats
+
+
+def redact_findings(doc, page_findings):
+    """
+    Applies the located findings of every page as redactions.
+    
+    Returns:
+        int: Number of redacted rectangles
+    """
+    redactions = 0
+    for page_num, findings in page_findings.items():
+        rects = [rect for item in findings for rect in item['rects']]
+        with tracing.span('page.redact', page=page_num + 1, rects=len(rects)):
+            redactions += redact_page(doc[page_num], page_num, rects)
+    return redactions
@@ -0,0 +1,213 @@
+from config import *
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Optional
+import metrics
+import results
+
+logger = logging.getLogger(__name__)
+
+PROFILED_TASKS = {'pdf_api.tasks.process_pdf', 'pdf_api.tasks.analyze_pdf', 'pdf_api.tasks.redact_pdf'}
+MAX_STACKS = 500
+# A new allocation snapshot is taken whenever traced memory grew by this factor
+SNAPSHOT_GROWTH = 1.25
+MIN_SNAPSHOT_BYTES = 1024 * 1024
+
+# Innermost frames of threads that are only waiting for work (idle pool
+# threads, the hedging event loop, the task thread collecting page futures)
+IDLE_LEAVES = {('_worker', 'thread.py'), ('select', 'selectors.py'), ('wait', 'threading.py')}
+
+_active = {}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _is_idle(frame) -> bool:
+    return (frame.f_code.co_name, os.path.basename(frame.f_code.co_filename)) in IDLE_LEAVES
+
+
+class TaskProfiler:
+    """
+    Profiles one task run: a sampling profile of all threads plus tracemalloc.
+
+    cProfile only sees the thread that enables it, while process_pdf does its
+    work in page threads; sampling sys._current_frames() every
+    PROFILE_INTERVAL covers all of them at a fixed, low overhead. Samples are
+    wall-clock, so threads waiting on the LLM API show up as such.
+    """
+
+    def __init__(self, task_id: str, task_name: str, reason: str):
+        self.task_id = task_id
+        self.task_name = task_name
+        self.reason = reason
+        self.stacks = Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self.peak_snapshot = None
+        self.peak_snapshot_bytes = 0
+        self._owns_tracemalloc = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{task_id}", daemon=True)
+
+    def start(self) -> None:
+        self.started = time.time()
+        self.cpu_started = time.process_time()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+            self._owns_tracemalloc = True
+        tracemalloc.reset_peak()
+        self.memory_at_start = tracemalloc.get_traced_memory()[0]
+        self._thread.start()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(PROFILE_INTERVAL):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                self.samples += 1
+                if _is_idle(frame):
+                    self.idle_samples += 1
+                    continue
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(f"thread {names.get(thread_id, thread_id)}")
+                self.stacks[tuple(reversed(stack))] += 1
+
+            current = tracemalloc.get_traced_memory()[0]
+            if current > max(self.peak_snapshot_bytes * SNAPSHOT_GROWTH, MIN_SNAPSHOT_BYTES):
+                self.peak_snapshot = tracemalloc.take_snapshot()
+                self.peak_snapshot_bytes = current
+
+    def stop(self) -> Dict[str, Any]:
+        """Stops sampling and tracing and returns the report."""
+        self._stop.set()
+        self._thread.join()
+        wall_seconds = time.time() - self.started
+        cpu_seconds = time.process_time() - self.cpu_started
+        current, peak = tracemalloc.get_traced_memory()
+        end_snapshot = tracemalloc.take_snapshot()
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+
+        return {
+            "task_id": self.task_id,
+            "task": self.task_name,
+            "reason": self.reason,
+            "started_at": self.started,
+            "wall_seconds": round(wall_seconds, 3),
+            "cpu_seconds": round(cpu_seconds, 3),
+            "sample_interval": PROFILE_INTERVAL,
+            "samples": self.samples,
+            "idle_samples": self.idle_samples,
+            "top_functions": self._top_functions(),
+            "stacks": {
+                ';'.join(stack): count for stack, count in self.stacks.most_common(MAX_STACKS)
+            },
+            "memory": {
+                "at_start_bytes": self.memory_at_start,
+                "peak_bytes": peak,
+                "at_end_bytes": current,
+                "snapshot_bytes": self.peak_snapshot_bytes,
+                "top_allocations_at_peak": _top_allocations(self.peak_snapshot),
+                "top_allocations_at_end": _top_allocations(end_snapshot)
+            }
+        }
+
+    def _top_functions(self) -> List[Dict[str, Any]]:
+        busy = sum(self.stacks.values()) or 1
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for label in set(stack[1:]):
+                total[label] += count
+        return [
+            {
+                "function": label,
+                "self_samples": own[label],
+                "total_samples": count,
+                "self_percent": round(100 * own[label] / busy, 1),
+                "total_percent": round(100 * count / busy, 1)
+            }
+            for label, count in sorted(total.items(), key=lambda item: (own[item[0]], item[1]), reverse=True)
+            [:PROFILE_TOP]
+        ]
+
+
+def _top_allocations(snapshot) -> List[Dict[str, Any]]:
+    """Allocation sites holding the most memory in a snapshot, by line."""
+    if snapshot is None:
+        return []
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")
+    ))
+    return [
+        {
+            "where": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+            "size_bytes": stat.size,
+            "count": stat.count
+        }
+        for stat in snapshot.statistics('lineno')[:PROFILE_TOP]
+    ]
+
+
+def should_profile(task_name: str, options: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Returns why a task run is profiled ('requested' or 'sampled'), None if it is not."""
+    if task_name not in PROFILED_TASKS:
+        return None
+    if (options or {}).get('profile'):
+        return 'requested'
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return 'sampled'
+    return None
+
+
+def start_task(task_id: str, task_name: str, options: Optional[Dict[str, Any]]) -> None:
+    """Starts profiling a task run if it was requested or sampled (task_prerun)."""
+    reason = should_profile(task_name, options)
+    if reason is None:
+        return
+    try:
+        profiler = TaskProfiler(task_id, task_name, reason)
+        profiler.start()
+        _active[task_id] = profiler
+        logger.info(f"Profiling task {task_id} ({reason})")
+    except Exception as e:
+        logger.error(f"Error starting profiler for task {task_id}: {e}")
+
+
+def end_task(task_id: str) -> None:
+    """Stores the profile of a finished task next to its result (task_postrun)."""
+    profiler = _active.pop(task_id, None)
+    if profiler is None:
+        return
+    try:
+        report = profiler.stop()
+        results.store_profile(task_id, report)
+        metrics.incr('profiles.stored')
+        logger.info(f"Stored profile of task {task_id}: {report['samples']} samples, "
+                    f"peak {report['memory']['peak_bytes']} bytes traced")
+    except Exception as e:
+        logger.error(f"Error storing profile of task {task_id}: {e}")
+
+
+def collapsed_stacks(report: Dict[str, Any]) -> str:
+    """The sampled stacks in collapsed format, for flamegraph.pl or speedscope."""
+    return ''.join(f"{stack} {count}\n" for stack, count in report['stacks'].items())
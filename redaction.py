@@ -0,0 +1,85 @@
+from config import *
+import logging
+from typing import Iterable, List, Sequence
+import fitz
+
+logger = logging.getLogger(__name__)
+
+
+def _area(rect: fitz.Rect) -> float:
+    return rect.width * rect.height if not rect.is_empty else 0.0
+
+
+def _mergeable(a: fitz.Rect, b: fitz.Rect, gap: float) -> bool:
+    """
+    True if a and b overlap or touch within gap and their bounding box
+    covers at most REDACTION_MERGE_MAX_EXTRA more area than the two
+    rectangles themselves. The area check keeps e.g. the end of one line and
+    the start of the next apart, whose bounding box would black out the text
+    in between.
+    """
+    if a.x0 - gap > b.x1 or b.x0 - gap > a.x1 or a.y0 - gap > b.y1 or b.y0 - gap > a.y1:
+        return False
+    covered = _area(a) + _area(b) - _area(a & b)
+    return _area(a | b) <= covered * (1 + REDACTION_MERGE_MAX_EXTRA)
+
+
+def _merge_pass(rects: List[fitz.Rect], gap: float):
+    """One sweep over the rectangles sorted by x0, merging into active ones."""
+    rects.sort(key=lambda r: r.x0)
+    merged = []
+    active = []  # Indices into merged whose x1 still reaches the sweep line
+    changed = False
+
+    for rect in rects:
+        active = [i for i in active if merged[i].x1 + gap >= rect.x0]
+        for i in active:
+            if _mergeable(merged[i], rect, gap):
+                merged[i] = merged[i] | rect
+                changed = True
+                break
+        else:
+            merged.append(rect)
+            active.append(len(merged) - 1)
+
+    return merged, changed
+
+
+def plan_redactions(rects: Iterable[Sequence[float]], gap: float = REDACTION_MERGE_GAP) -> List[fitz.Rect]:
+    """
+    Unions overlapping and adjacent rectangles.
+
+    Duplicates and rectangles contained in others disappear, neighbouring
+    words of the same line become one rectangle. Passes repeat until nothing
+    merges, since a merged rectangle may reach further neighbours.
+
+    Args:
+        rects: Rectangles as [x0, y0, x1, y1]
+        gap: Distance in points up to which rectangles count as adjacent
+
+    Returns:
+        list: The merged rectangles
+    """
+    planned = [fitz.Rect(coords) for coords in rects]
+    planned = [rect for rect in planned if not rect.is_empty and rect.is_valid]
+    changed = True
+    while changed and len(planned) > 1:
+        planned, changed = _merge_pass(planned, gap)
+    return planned
+
+
+def image_mode(page, rects: List[fitz.Rect]) -> int:
+    """
+    Chooses the cheapest apply_redactions image mode that is still safe.
+
+    Images are only touched if a redaction overlaps one of them; then the
+    overlapped pixels are blanked (PDF_REDACT_IMAGE_PIXELS). Otherwise image
+    processing is skipped entirely (PDF_REDACT_IMAGE_NONE).
+    """
+    if not rects:
+        return fitz.PDF_REDACT_IMAGE_NONE
+    for image in page.get_image_info():
+        bbox = fitz.Rect(image['bbox'])
+        if any(rect.intersects(bbox) for rect in rects):
+            return fitz.PDF_REDACT_IMAGE_PIXELS
+    return fitz.PDF_REDACT_IMAGE_NONE
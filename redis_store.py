@@ -0,0 +1,23 @@
+from config import REDIS_URL, REDIS_TIMEOUT
+import redis
+
+KEY_PREFIX = 'pdf_api'
+
+_client = None
+
+
+def get_redis():
+    """Returns the shared Redis client for application state (not the Celery broker)."""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            REDIS_URL,
+            socket_timeout=REDIS_TIMEOUT,
+            socket_connect_timeout=REDIS_TIMEOUT
+        )
+    return _client
+
+
+def key(*parts) -> str:
+    """Builds a namespaced Redis key, e.g. key('admission', 'pending') -> 'pdf_api:admission:pending'."""
+    return ':'.join((KEY_PREFIX,) + tuple(str(part) for part in parts))
@@ -0,0 +1,146 @@
+from config import *
+import hashlib
+import json
+import logging
+import time
+import zlib
+from typing import Any, Dict, Optional
+from redis_store import get_redis, key
+
+try:
+    import zstandard
+except ImportError:  # Optional, deflate is always available
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+
+def _meta_key(task_id: str) -> str:
+    return key('result', task_id, 'meta')
+
+
+def _payload_key(task_id: str) -> str:
+    return key('result', task_id, 'payload')
+
+
+def _profile_key(task_id: str) -> str:
+    return key('result', task_id, 'profile')
+
+
+def _codec() -> str:
+    if RESULT_COMPRESSION == 'zstd' and zstandard is None:
+        logger.warning("zstandard is not installed, falling back to deflate for results")
+        return 'deflate'
+    return RESULT_COMPRESSION
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=RESULT_COMPRESSION_LEVEL).compress(data)
+    if codec == 'deflate':
+        return zlib.compress(data, RESULT_COMPRESSION_LEVEL)
+    return data
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == 'deflate':
+        return zlib.decompress(data)
+    return data
+
+
+def store_result(task_id: str, payload: bytes, content_type: str = 'application/pdf',
+                 **metadata) -> Dict[str, Any]:
+    """
+    Stores a finished result compressed and with an expiry.
+
+    The payload and a small metadata record are kept under separate keys,
+    so status polls can read the metadata without touching the document.
+
+    Returns:
+        dict: The stored metadata record
+    """
+    codec = _codec()
+    compressed = compress(payload, codec)
+    record = {
+        "status": "Completed",
+        "content_type": content_type,
+        "size": len(payload),
+        "stored_size": len(compressed),
+        "sha256": hashlib.sha256(payload).hexdigest(),
+        "codec": codec,
+        "completed_at": time.time(),
+        **metadata
+    }
+
+    pipe = get_redis().pipeline()
+    pipe.set(_payload_key(task_id), compressed, ex=RESULT_TTL_SECONDS)
+    pipe.hset(_meta_key(task_id), mapping=record)
+    pipe.expire(_meta_key(task_id), RESULT_TTL_SECONDS)
+    pipe.execute()
+
+    logger.info(f"Stored result for task {task_id}: {len(payload)} bytes, "
+                f"{len(compressed)} bytes {codec}-compressed")
+    return record
+
+
+def store_failure(task_id: str, message: str) -> Dict[str, Any]:
+    """Stores the metadata record of a failed task."""
+    record = {"status": "Failed", "message": message, "completed_at": time.time()}
+    pipe = get_redis().pipeline()
+    pipe.hset(_meta_key(task_id), mapping=record)
+    pipe.expire(_meta_key(task_id), RESULT_TTL_SECONDS)
+    pipe.execute()
+    return record
+
+
+def get_metadata(task_id: str) -> Optional[Dict[str, Any]]:
+    """Returns the metadata record of a finished task, or None if there is none."""
+    record = get_redis().hgetall(_meta_key(task_id))
+    if not record:
+        return None
+    metadata = {}
+    for name, value in record.items():
+        name, value = name.decode(), value.decode()
+        if name in ('size', 'stored_size', 'total_pages', 'findings', 'redactions'):
+            value = int(value)
+        elif name in ('completed_at', 'consumed_at'):
+            value = float(value)
+        metadata[name] = value
+    return metadata
+
+
+def load_payload(task_id: str, metadata: Dict[str, Any]) -> Optional[bytes]:
+    """Loads and decompresses a stored payload, None if it has expired."""
+    data = get_redis().get(_payload_key(task_id))
+    if data is None:
+        return None
+    return decompress(data, metadata['codec'])
+
+
+def mark_consumed(task_id: str) -> None:
+    """
+    Marks a result as downloaded and shortens its remaining lifetime to
+    RESULT_CONSUMED_TTL_SECONDS, leaving a short window for retried downloads.
+    """
+    client = get_redis()
+    if client.hsetnx(_meta_key(task_id), 'consumed_at', time.time()):
+        pipe = client.pipeline()
+        pipe.expire(_payload_key(task_id), RESULT_CONSUMED_TTL_SECONDS)
+        pipe.expire(_meta_key(task_id), RESULT_CONSUMED_TTL_SECONDS)
+        pipe.execute()
+
+
+def store_profile(task_id: str, report: Dict[str, Any]) -> None:
+    """Stores the profiling report of a task run with the lifetime of its result."""
+    data = zlib.compress(json.dumps(report).encode('utf-8'), RESULT_COMPRESSION_LEVEL)
+    get_redis().set(_profile_key(task_id), data, ex=RESULT_TTL_SECONDS)
+
+
+def get_profile(task_id: str) -> Optional[Dict[str, Any]]:
+    """Returns the profiling report of a task, None if it was not profiled or has expired."""
+    data = get_redis().get(_profile_key(task_id))
+    if data is None:
+        return None
+    return json.loads(zlib.decompress(data))
@@ -0,0 +1,70 @@
+from config import *
+import logging
+from typing import Any, Dict
+from kombu.exceptions import ChannelError
+
+logger = logging.getLogger(__name__)
+
+LANES = {
+    'fast': FAST_QUEUE,
+    'heavy': HEAVY_QUEUE
+}
+
+
+def page_needs_ocr(page) -> bool:
+    """Cheap OCR estimate using the same criteria as utils.needs_ocr."""
+    try:
+        has_embedded_fonts = any(font[3] for font in page.get_fonts())
+        extractable_text = len(page.get_text().strip()) > 10
+        return not (has_embedded_fonts and extractable_text)
+    except Exception as e:
+        logger.error(f"Error checking page for OCR: {e}")
+        return True
+
+
+def classify_document(doc) -> Dict[str, Any]:
+    """
+    Estimates the processing cost of a document and picks its lane.
+
+    Every page costs one point for the text and vision calls; pages that will
+    go through OCR cost OCR_PAGE_COST instead. Documents up to
+    FAST_LANE_MAX_COST points are routed to the fast lane.
+
+    Args:
+        doc: Open PyMuPDF document
+
+    Returns:
+        dict: page_count, ocr_pages, estimated_cost, lane and queue
+    """
+    page_count = len(doc)
+    ocr_pages = sum(1 for page in doc if page_needs_ocr(page))
+    estimated_cost = (page_count - ocr_pages) + ocr_pages * OCR_PAGE_COST
+    lane = 'fast' if estimated_cost <= FAST_LANE_MAX_COST else 'heavy'
+
+    logger.info(f"Classified document: {page_count} pages, {ocr_pages} need OCR, "
+                f"cost {estimated_cost:.1f} -> {lane} lane")
+    return {
+        "page_count": page_count,
+        "ocr_pages": ocr_pages,
+        "estimated_cost": estimated_cost,
+        "lane": lane,
+        "queue": LANES[lane]
+    }
+
+
+def queue_depths(celery) -> Dict[str, Dict[str, Any]]:
+    """Returns the number of waiting messages per lane from the broker."""
+    depths = {}
+    with celery.connection_for_read() as conn:
+        channel = conn.default_channel
+        for lane, queue in LANES.items():
+            try:
+                depth = channel.queue_declare(queue=queue, passive=True).message_count
+            except ChannelError:
+                # Queue was never used or has been drained completely
+                depth = 0
+            except Exception as e:
+                logger.error(f"Error reading depth of queue {queue}: {e}")
+                depth = None
+            depths[lane] = {"queue": queue, "depth": depth}
+    return depths
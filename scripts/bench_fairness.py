@@ -0,0 +1,128 @@
+"""
+Fairness benchmark: FIFO dispatch (Celery queues alone) versus the per-client
+fair queue, under a simulated mixed load.
+
+One backfill client submits a large batch of long documents at once, while
+interactive clients keep sending short documents. Workers are simulated on a
+virtual clock (service time proportional to document cost), so the run takes
+seconds. The fair queue itself runs for real against the Redis from
+REDIS_URL, under a separate key prefix.
+
+Reported per client: finished documents within the horizon, mean and p95 wait
+between upload and start of processing.
+
+Example:
+    python scripts/bench_fairness.py --workers 4 --backfill 500
+    CLIENT_WEIGHTS=interactive-1=2 python scripts/bench_fairness.py
+"""
+import argparse
+import heapq
+import itertools
+import os
+import random
+import statistics
+import sys
+import uuid
+from collections import defaultdict, deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import redis_store
+redis_store.KEY_PREFIX = 'pdf_api_bench'
+import fair_queue
+
+SECONDS_PER_COST = 2.0
+
+
+def workload(args):
+    """List of (arrival, client_id, cost), sorted by arrival."""
+    rng = random.Random(args.seed)
+    jobs = [(0.0, 'backfill', args.backfill_cost) for _ in range(args.backfill)]
+    for n in range(args.interactive):
+        t = rng.expovariate(1 / args.interval)
+        while t < args.horizon:
+            jobs.append((t, f"interactive-{n + 1}", rng.choice((1, 1, 2, 3))))
+            t += rng.expovariate(1 / args.interval)
+    return sorted(jobs)
+
+
+def simulate(jobs, workers, fair, horizon):
+    """
+    Runs the workload on a virtual clock.
+
+    Returns:
+        dict: client_id -> list of (wait, finished_within_horizon)
+    """
+    if fair:
+        fair_queue.reset()
+    broker = deque()  # Celery's FIFO queue
+    busy = 0
+    now = 0.0
+    events = []  # (time, order, kind, job)
+    order = itertools.count()
+    outcome = defaultdict(list)
+    for arrival, client_id, cost in jobs:
+        job = {"task_id": str(uuid.uuid4()), "client_id": client_id, "cost": cost, "arrival": arrival}
+        heapq.heappush(events, (arrival, next(order), 'arrive', job))
+    pending = {}
+
+    def send(dispatched):
+        broker.append(pending.pop(dispatched['task_id']))
+
+    def start_workers():
+        nonlocal busy
+        while busy < workers and broker:
+            job = broker.popleft()
+            busy += 1
+            finish = now + job['cost'] * SECONDS_PER_COST
+            outcome[job['client_id']].append((now - job['arrival'], finish <= horizon))
+            heapq.heappush(events, (finish, next(order), 'finish', job))
+
+    while events:
+        now, _, kind, job = heapq.heappop(events)
+        if kind == 'arrive':
+            if fair:
+                pending[job['task_id']] = job
+                fair_queue.enqueue(job['task_id'], 'bench', (), {}, job['client_id'],
+                                   'heavy', 'heavy', job['cost'])
+                fair_queue.dispatch('heavy', send)
+            else:
+                broker.append(job)
+        else:
+            busy -= 1
+            if fair:
+                fair_queue.complete(job['task_id'], send)
+        start_workers()
+    return outcome
+
+
+def report(title, outcome):
+    print(f"\n{title}")
+    print(f"{'client':<16}{'finished':>10}{'mean wait':>12}{'p95 wait':>12}")
+    for client_id in sorted(outcome):
+        waits = sorted(wait for wait, _ in outcome[client_id])
+        finished = sum(1 for _, done in outcome[client_id] if done)
+        p95 = waits[min(len(waits) - 1, int(len(waits) * 0.95))]
+        print(f"{client_id:<16}{finished:>10}{statistics.mean(waits):>11.1f}s{p95:>11.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4, help='Simulated worker processes (= dispatch window)')
+    parser.add_argument('--backfill', type=int, default=300, help='Documents in the backfill batch')
+    parser.add_argument('--backfill-cost', type=float, default=10, help='Cost of one backfill document')
+    parser.add_argument('--interactive', type=int, default=3, help='Number of interactive clients')
+    parser.add_argument('--interval', type=float, default=20, help='Mean seconds between interactive uploads')
+    parser.add_argument('--horizon', type=float, default=1800, help='Simulated seconds of interactive traffic')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    fair_queue.FAIR_DISPATCH_WINDOW = args.workers
+    jobs = workload(args)
+    print(f"{len(jobs)} documents, {args.workers} workers, {args.horizon:.0f}s horizon")
+    report("FIFO (Celery queue only)", simulate(jobs, args.workers, False, args.horizon))
+    report("Fair queue", simulate(jobs, args.workers, True, args.horizon))
+    fair_queue.reset()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Redaction benchmark: one annotation per rectangle with default image handling
+versus the redaction planner (merged rectangles, images only when touched).
+
+Without --corpus a synthetic document with dense text pages is generated;
+every second page carries a full-width image in its lower half, so both the
+image-free and the image-touching path are measured. Rectangles per page are
+the words of the first lines plus the line boxes around them, which is how
+multi-word findings overlap in practice.
+
+Example:
+    python scripts/bench_redaction.py --pages 20 --lines 30
+    python scripts/bench_redaction.py --corpus samples/
+"""
+import argparse
+import os
+import sys
+import time
+import fitz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import REDACTION_FILL_COLOR
+from redaction import plan_redactions, image_mode
+
+
+def synthetic_document(pages):
+    doc = fitz.open()
+    pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 600, 300), 0)
+    pixmap.set_rect(pixmap.irect, (200, 220, 240))
+    for page_num in range(pages):
+        page = doc.new_page()
+        text = " ".join(f"Wort{page_num}_{i}" for i in range(500))
+        page.insert_textbox(fitz.Rect(40, 40, 560, 800), text, fontsize=9)
+        if page_num % 2:
+            page.insert_image(fitz.Rect(40, 480, 560, 780), pixmap=pixmap)
+    return doc.tobytes()
+
+
+def page_rects(page, lines):
+    words = page.get_text('words')
+    line_keys = sorted({(w[5], w[6]) for w in words})[:lines]
+    rects = []
+    for key in line_keys:
+        line_words = [w for w in words if (w[5], w[6]) == key]
+        rects.extend(list(w[:4]) for w in line_words)
+        rects.append(list(fitz.Rect(line_words[0][:4]) | fitz.Rect(line_words[-1][:4])))
+    return rects
+
+
+def redact_baseline(page, rects):
+    applied = set()
+    for coords in rects:
+        coord_key = f"{coords[0]:.1f},{coords[1]:.1f},{coords[2]:.1f},{coords[3]:.1f}"
+        if coord_key not in applied:
+            page.add_redact_annot(fitz.Rect(coords), fill=REDACTION_FILL_COLOR)
+            applied.add(coord_key)
+    page.apply_redactions()
+    return len(applied)
+
+
+def redact_planned(page, rects):
+    planned = plan_redactions(rects)
+    for rect in planned:
+        page.add_redact_annot(rect, fill=REDACTION_FILL_COLOR)
+    page.apply_redactions(images=image_mode(page, planned))
+    return len(planned)
+
+
+def run(pdf_data, lines, method):
+    doc = fitz.open(stream=pdf_data, filetype='pdf')
+    rects = [page_rects(page, lines) for page in doc]
+    started = time.perf_counter()
+    annotations = sum(method(page, page_rect) for page, page_rect in zip(doc, rects))
+    elapsed = time.perf_counter() - started
+    remaining = sum(len(page.get_text('words')) for page in doc)
+    doc.close()
+    return elapsed, annotations, remaining
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help='Directory with sample PDFs instead of a synthetic document')
+    parser.add_argument('--pages', type=int, default=20, help='Pages of the synthetic document')
+    parser.add_argument('--lines', type=int, default=30, help='Redacted lines per page')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.corpus:
+        documents = []
+        for name in sorted(os.listdir(args.corpus)):
+            if name.lower().endswith('.pdf'):
+                with open(os.path.join(args.corpus, name), 'rb') as f:
+                    documents.append((name, f.read()))
+    else:
+        documents = [(f'synthetic ({args.pages} pages)', synthetic_document(args.pages))]
+
+    print(f"{'document':<32} {'method':<9} {'ms':>9} {'annots':>7} {'words left':>11}")
+    for name, pdf_data in documents:
+        for label, method in (('baseline', redact_baseline), ('planner', redact_planned)):
+            best = None
+            for _ in range(args.repeat):
+                elapsed, annotations, remaining = run(pdf_data, args.lines, method)
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"{name[:32]:<32} {label:<9} {best * 1000:>9.1f} {annotations:>7} {remaining:>11}")
+
+
+if __name__ == '__main__':
+    main()
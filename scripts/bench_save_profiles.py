@@ -0,0 +1,74 @@
+"""
+Save profile benchmark: save time versus output size per profile.
+
+Every PDF in the corpus directory is redacted the way process_pdf leaves it
+(redaction annotations over the first words of each page, then
+apply_redactions) and saved once with each profile from PDF_SAVE_PROFILES.
+
+Example:
+    python scripts/bench_save_profiles.py --corpus samples/ --words 20
+"""
+import argparse
+import io
+import os
+import sys
+import time
+import fitz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import PDF_SAVE_PROFILES
+
+
+def redacted_copy(pdf_data, words_per_page):
+    doc = fitz.open(stream=pdf_data, filetype='pdf')
+    for page in doc:
+        for word in page.get_text('words')[:words_per_page]:
+            page.add_redact_annot(fitz.Rect(word[:4]), fill=(0, 0, 0))
+        page.apply_redactions()
+    return doc
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', required=True, help='Directory with sample PDFs')
+    parser.add_argument('--words', type=int, default=20, help='Words redacted per page')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    paths = sorted(
+        os.path.join(args.corpus, name) for name in os.listdir(args.corpus) if name.lower().endswith('.pdf')
+    )
+    totals = {name: {'seconds': 0.0, 'bytes': 0} for name in PDF_SAVE_PROFILES}
+    input_bytes = 0
+
+    print(f"{'document':<40} {'profile':<8} {'save ms':>9} {'bytes':>10} {'vs input':>9}")
+    for path in paths:
+        with open(path, 'rb') as f:
+            pdf_data = f.read()
+        input_bytes += len(pdf_data)
+
+        for name, save_options in PDF_SAVE_PROFILES.items():
+            best = None
+            for _ in range(args.repeat):
+                doc = redacted_copy(pdf_data, args.words)
+                buffer = io.BytesIO()
+                started = time.perf_counter()
+                doc.save(buffer, **save_options)
+                elapsed = time.perf_counter() - started
+                doc.close()
+                best = elapsed if best is None else min(best, elapsed)
+
+            size = len(buffer.getvalue())
+            totals[name]['seconds'] += best
+            totals[name]['bytes'] += size
+            print(f"{os.path.basename(path)[:40]:<40} {name:<8} {best * 1000:>9.1f} {size:>10} "
+                  f"{size / len(pdf_data):>8.0%}")
+
+    print(f"\nCorpus: {len(paths)} documents, {input_bytes} bytes")
+    for name, total in totals.items():
+        print(f"  {name:<8} {total['seconds']:.2f}s total save time, {total['bytes']} bytes "
+              f"({total['bytes'] / max(input_bytes, 1):.0%} of input)")
+
+
+if __name__ == '__main__':
+    main()
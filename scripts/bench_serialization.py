@@ -0,0 +1,81 @@
+"""
+Serializer benchmark for process_pdf task messages and results.
+
+Compares pickle with the msgpack-bin serializer on the message body Celery
+sends for process_pdf (args, kwargs, embed) and on the task result. Broker
+bytes include the base64 body encoding the Redis transport applies.
+
+Without --file, synthetic text PDFs of 1, 5 and 10 pages are generated.
+
+Example:
+    python scripts/bench_serialization.py --file sample.pdf --file scan.pdf
+"""
+import argparse
+import base64
+import os
+import sys
+import timeit
+import fitz
+from kombu.serialization import dumps, loads
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from serialization import SERIALIZER_NAME, register_serializer
+from config import DEFAULT_MINIMUM_OPTIONS
+
+SERIALIZERS = ['pickle', SERIALIZER_NAME]
+
+
+def synthetic_pdf(pages):
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        for line in range(50):
+            page.insert_text((50, 50 + line * 14),
+                             f"Seite {page_num + 1}, Zeile {line + 1}: Max Mustermann, max@example.com, +49 30 1234567")
+    data = doc.tobytes(deflate=True)
+    doc.close()
+    return f"synthetic {pages}p", data
+
+
+def bench(label, body, repeat):
+    print(f"\n{label}")
+    print(f"  {'serializer':<12} {'dumps ms':>10} {'loads ms':>10} {'body bytes':>12} {'broker bytes':>13}")
+    for serializer in SERIALIZERS:
+        content_type, content_encoding, payload = dumps(body, serializer=serializer)
+        dump_time = timeit.timeit(lambda: dumps(body, serializer=serializer), number=repeat) / repeat
+        load_time = timeit.timeit(
+            lambda: loads(payload, content_type, content_encoding, accept={content_type}), number=repeat
+        ) / repeat
+        payload_bytes = payload if isinstance(payload, bytes) else payload.encode()
+        print(f"  {serializer:<12} {dump_time * 1000:>10.3f} {load_time * 1000:>10.3f} "
+              f"{len(payload_bytes):>12} {len(base64.b64encode(payload_bytes)):>13}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--file', action='append', default=[], help='PDF to use as payload, repeatable')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    register_serializer()
+
+    documents = []
+    for path in args.file:
+        with open(path, 'rb') as f:
+            documents.append((os.path.basename(path), f.read()))
+    if not documents:
+        documents = [synthetic_pdf(pages) for pages in (1, 5, 10)]
+
+    for name, pdf_data in documents:
+        message = ((pdf_data, dict(DEFAULT_MINIMUM_OPTIONS)), {}, {'callbacks': None, 'errbacks': None,
+                                                                   'chain': None, 'chord': None})
+        bench(f"Task message, {name} ({len(pdf_data)} bytes PDF)", message, args.repeat)
+
+    result = {"status": "SUCCESS", "result": {"status": "Completed", "message": "PDF processed successfully",
+                                               "total_pages": 10, "size": 123456, "sha256": "0" * 64},
+              "traceback": None, "children": [], "date_done": "2024-12-15T12:00:00", "task_id": "0" * 36}
+    bench("Task result (metadata only)", result, args.repeat * 10)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Concurrent upload benchmark for the Flask and the async server.
+
+Fires uploads of one PDF at an /upload endpoint with a fixed number of
+concurrent clients. Slow clients can be simulated with --client-kbps, which
+trickles the request body at the given rate.
+
+Example:
+    python scripts/bench_uploads.py --url http://localhost:5001/upload \
+        --file sample.pdf --concurrency 50 --requests 500 --client-kbps 256
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import API_TOKEN
+
+
+async def trickle(data, chunk_size, delay):
+    for offset in range(0, len(data), chunk_size):
+        yield data[offset:offset + chunk_size]
+        if delay:
+            await asyncio.sleep(delay)
+
+
+async def upload_once(session, args, pdf_data):
+    form = aiohttp.FormData()
+    if args.client_kbps:
+        chunk_size = 16 * 1024
+        delay = chunk_size / (args.client_kbps * 1024)
+        body = trickle(pdf_data, chunk_size, delay)
+    else:
+        body = pdf_data
+    form.add_field('file', body, filename=os.path.basename(args.file), content_type='application/pdf')
+    form.add_field('preferences', '{}')
+
+    started = time.perf_counter()
+    async with session.post(args.url, data=form, headers={'Authorization': f'Bearer {args.token}'}) as response:
+        await response.read()
+        return response.status, time.perf_counter() - started
+
+
+async def run(args):
+    with open(args.file, 'rb') as f:
+        pdf_data = f.read()
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        async def bounded():
+            async with semaphore:
+                try:
+                    return await upload_once(session, args, pdf_data)
+                except Exception as e:
+                    return type(e).__name__, None
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(bounded() for _ in range(args.requests)))
+        elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for status, latency in results if status == 200)
+    errors = {}
+    for status, _ in results:
+        if status != 200:
+            errors[status] = errors.get(status, 0) + 1
+
+    print(f"Requests:       {args.requests} ({args.concurrency} concurrent)")
+    print(f"Payload:        {len(pdf_data)} bytes")
+    print(f"Wall time:      {elapsed:.2f}s")
+    print(f"Throughput:     {len(latencies) / elapsed:.1f} uploads/s")
+    if latencies:
+        print(f"Latency p50:    {statistics.median(latencies) * 1000:.0f} ms")
+        print(f"Latency p95:    {latencies[int(len(latencies) * 0.95) - 1] * 1000:.0f} ms")
+        print(f"Latency max:    {latencies[-1] * 1000:.0f} ms")
+    if errors:
+        print(f"Errors:         {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:5001/upload')
+    parser.add_argument('--file', required=True, help='PDF to upload')
+    parser.add_argument('--token', default=API_TOKEN)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--client-kbps', type=float, default=0, help='Simulated client upload rate, 0 = unthrottled')
+    parser.add_argument('--timeout', type=float, default=300)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Startup benchmark: import time, peak RSS and loaded heavy modules of the API
+and worker entry points, each measured in a fresh interpreter.
+
+The API processes should only need Flask/aiohttp, Celery's client side and
+PyMuPDF for validation; Mistral, Tesseract, PIL and thefuzz belong to the
+workers.
+
+Example:
+    python scripts/measure_startup.py --runs 5
+    python scripts/measure_startup.py --module app --module tasks
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = ('app', 'async_app', 'celery_worker')
+HEAVY_MODULES = ('mistralai', 'pytesseract', 'PIL', 'thefuzz', 'jsonschema', 'tasks', 'utils', 'ocr')
+
+PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    "seconds": elapsed,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "modules": len(sys.modules),
+    "heavy": [name for name in {heavy!r} if name in sys.modules]
+}}))
+"""
+
+
+def measure(module, runs):
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        "seconds": statistics.median(s['seconds'] for s in samples),
+        "rss_mb": statistics.median(s['rss_mb'] for s in samples),
+        "modules": samples[-1]['modules'],
+        "heavy": samples[-1]['heavy']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', action='append', help='Module to import (repeatable)')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters per module; the median is reported')
+    args = parser.parse_args()
+
+    print(f"{'module':<16}{'import':>10}{'peak RSS':>12}{'modules':>9}  heavy modules loaded")
+    for module in args.module or DEFAULT_MODULES:
+        result = measure(module, args.runs)
+        print(f"{module:<16}{result['seconds']:>9.2f}s{result['rss_mb']:>9.0f} MB{result['modules']:>9}  "
+              f"{', '.join(result['heavy']) or '-'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Offline analysis of traces exported with TRACE_EXPORTER=file.
+
+Prints the slowest traces with their span tree and the critical path: the
+spans that determined the end-to-end time, found by walking backwards from
+the end of the trace and always following the span that finished last.
+Spans may outlive their parent (the upload request ends before its task
+runs), so a span's extent includes its descendants. Each span on the path
+is shown with the time attributed to it.
+
+Example:
+    python scripts/trace_report.py traces/spans.jsonl --slowest 3
+    python scripts/trace_report.py traces/spans.jsonl --trace 4bf92f3577b34da6a3ce929d0e0e4736
+"""
+import argparse
+import json
+from collections import defaultdict
+
+
+def load_traces(path):
+    traces = defaultdict(list)
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                span = json.loads(line)
+                traces[span['trace_id']].append(span)
+    return traces
+
+
+def build_tree(spans):
+    """Returns (roots, parent span_id -> children sorted by start)."""
+    ids = {span['span_id'] for span in spans}
+    children = defaultdict(list)
+    roots = []
+    for span in spans:
+        if span['parent_id'] in ids:
+            children[span['parent_id']].append(span)
+        else:
+            roots.append(span)
+    for siblings in children.values():
+        siblings.sort(key=lambda s: s['start'])
+    return sorted(roots, key=lambda s: s['start']), children
+
+
+def subtree_end(span, children, cache):
+    if span['span_id'] not in cache:
+        cache[span['span_id']] = max(
+            [span['end']] + [subtree_end(child, children, cache) for child in children.get(span['span_id'], [])]
+        )
+    return cache[span['span_id']]
+
+
+def critical_path(span, children, cache, until=None):
+    """
+    Returns [(span, attributed seconds)] in chronological order.
+
+    Starting at the end of the span's extent, the child that finished last
+    before the cursor is followed recursively and the cursor moves to its
+    start; gaps between such children are attributed to the span itself.
+    """
+    cursor = min(subtree_end(span, children, cache), until or float('inf'))
+    own = 0.0
+    path = []
+    candidates = sorted(children.get(span['span_id'], []), key=lambda s: subtree_end(s, children, cache), reverse=True)
+    for child in candidates:
+        child_end = subtree_end(child, children, cache)
+        # Children still running at the cursor ran in parallel to the path
+        if child['start'] >= cursor or child_end > cursor:
+            continue
+        own += cursor - child_end
+        path = critical_path(child, children, cache, child_end) + path
+        cursor = child['start']
+    own += max(cursor - span['start'], 0)
+    return [(span, own)] + path
+
+
+def describe(span):
+    attributes = {k: v for k, v in span['attributes'].items() if k != 'task_id'}
+    details = ' '.join(f"{k}={v}" for k, v in attributes.items() if v is not None)
+    error = f"  ERROR {span['error']}" if span.get('error') else ''
+    return f"{span['name']} {span['duration_ms']:.1f} ms {details}{error}".rstrip()
+
+
+def print_tree(span, children, trace_start, depth=0, max_depth=6):
+    offset = (span['start'] - trace_start) * 1000
+    print(f"{'  ' * depth}+{offset:>9.1f} ms  {describe(span)}")
+    if depth < max_depth:
+        for child in children.get(span['span_id'], []):
+            print_tree(child, children, trace_start, depth + 1, max_depth)
+
+
+def report(trace_id, spans, tree=True):
+    roots, children = build_tree(spans)
+    start = min(s['start'] for s in spans)
+    end = max(s['end'] for s in spans)
+    print(f"\ntrace {trace_id}: {(end - start) * 1000:.1f} ms, {len(spans)} spans")
+
+    tokens = sum((s['attributes'].get('prompt_tokens') or 0) + (s['attributes'].get('completion_tokens') or 0)
+                 for s in spans)
+    llm_calls = sum(1 for s in spans if s['name'] == 'llm.chat')
+    if llm_calls:
+        print(f"  {llm_calls} LLM calls, {tokens} tokens")
+
+    if tree:
+        for root in roots:
+            print_tree(root, children, start)
+
+    print("  critical path:")
+    cache = {}
+    for root in roots:
+        for span, seconds in sorted(critical_path(root, children, cache), key=lambda item: item[0]['start']):
+            if seconds > 0:
+                print(f"    {seconds * 1000:>9.1f} ms  {describe(span)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('file', help='JSON Lines file written by the file exporter')
+    parser.add_argument('--trace', help='Only report this trace ID')
+    parser.add_argument('--slowest', type=int, default=5, help='Number of slowest traces to report')
+    parser.add_argument('--no-tree', action='store_true', help='Only print the critical path')
+    args = parser.parse_args()
+
+    traces = load_traces(args.file)
+    if args.trace:
+        selected = [args.trace]
+    else:
+        selected = sorted(
+            traces,
+            key=lambda t: max(s['end'] for s in traces[t]) - min(s['start'] for s in traces[t]),
+            reverse=True
+        )[:args.slowest]
+    for trace_id in selected:
+        report(trace_id, traces[trace_id], tree=not args.no_tree)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Minimal webhook receiver for local testing of completion callbacks.
+
+Verifies X-Webhook-Signature with WEBHOOK_SECRET and prints every delivery.
+With --fail N the first N requests are answered with 503, to watch retries
+and backoff. API and workers need the same WEBHOOK_SECRET and
+WEBHOOK_ALLOWED_HOSTS=localhost, since loopback callbacks are refused
+otherwise.
+
+Example:
+    python scripts/webhook_receiver.py --port 9000 --fail 2
+    curl -H "Authorization: Bearer $API_TOKEN" -F file=@sample.pdf \\
+         -F callback_url=http://localhost:9000/hook http://localhost:5001/upload
+"""
+import argparse
+import json
+import os
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from webhooks import verify
+
+
+def make_handler(fail_first):
+    state = {'requests': 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            state['requests'] += 1
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            attempt = self.headers.get('X-Webhook-Attempt')
+
+            if state['requests'] <= fail_first:
+                print(f"attempt {attempt}: answering 503 ({state['requests']}/{fail_first} forced failures)")
+                self.send_response(503)
+                self.end_headers()
+                return
+
+            valid = verify(body, self.headers.get('X-Webhook-Timestamp', '0'),
+                           self.headers.get('X-Webhook-Signature', ''))
+            print(f"attempt {attempt}: signature {'valid' if valid else 'INVALID'}")
+            print(json.dumps(json.loads(body), indent=2, ensure_ascii=False))
+            self.send_response(204 if valid else 401)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--fail', type=int, default=0, help='Answer the first N requests with 503')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.fail))
+    print(f"Listening on http://{args.host}:{args.port}/")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,14 @@
-from flask import request, jsonify
+from flask import request, jsonify, g
 from functools import wraps
-from config import API_TOKEN
+from auth import authenticate, is_admin
+
 def require_token(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = request.headers.get('Authorization')
-        if not token:
-            return jsonify({"error": "Authentication required."}), 401
-        
-        if token != f"Bearer {API_TOKEN}":
-            return jsonify({"error": "Invalid token."}), 401
-            
+        client_id, error = authenticate(request.headers.get('Authorization'))
+        if error:
+            return jsonify({"error": error}), 401
+
+        g.client_id = client_id
         return f(*args, **kwargs)
-    return decorated
\ No newline at end of file
+    return decorated
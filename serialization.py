@@ -0,0 +1,48 @@
+import msgpack
+from datetime import datetime
+from kombu.serialization import register
+
+SERIALIZER_NAME = 'msgpack-bin'
+CONTENT_TYPE = 'application/x-msgpack-bin'
+
+# msgpack extension type codes
+EXT_DATETIME = 1
+
+
+def _default(obj):
+    if isinstance(obj, datetime):
+        return msgpack.ExtType(EXT_DATETIME, obj.isoformat().encode())
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Cannot serialize object of type {type(obj).__name__}")
+
+
+def _ext_hook(code, data):
+    if code == EXT_DATETIME:
+        return datetime.fromisoformat(data.decode())
+    return msgpack.ExtType(code, data)
+
+
+def dumps(obj) -> bytes:
+    """
+    Packs task arguments and results with msgpack.
+
+    bytes values (the PDF payloads) are written as msgpack bin type, so they
+    travel as raw bytes instead of being escaped or base64-encoded.
+    """
+    return msgpack.packb(obj, use_bin_type=True, default=_default)
+
+
+def loads(data):
+    return msgpack.unpackb(data, raw=False, ext_hook=_ext_hook, strict_map_key=False)
+
+
+def register_serializer() -> None:
+    """Registers the serializer with kombu under SERIALIZER_NAME."""
+    register(
+        SERIALIZER_NAME,
+        dumps,
+        loads,
+        content_type=CONTENT_TYPE,
+        content_encoding='binary'
+    )
@@ -0,0 +1,14 @@
+from celery_app import celery
+
+# Client side of the worker tasks for the API processes. Tasks are addressed
+# by name, so enqueueing and polling does not import tasks.py and with it
+# Mistral, Tesseract, PIL and thefuzz; only workers (celery_worker) load the
+# implementations.
+process_pdf = celery.signature('pdf_api.tasks.process_pdf')
+analyze_pdf = celery.signature('pdf_api.tasks.analyze_pdf')
+redact_pdf = celery.signature('pdf_api.tasks.redact_pdf')
+
+
+def get_result(task_id: str):
+    """AsyncResult of a processing task, for status and metadata lookups."""
+    return celery.AsyncResult(task_id)
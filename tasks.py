@@ -1,34 +1,124 @@
 from celery_app import celery, signals
 from config import *
+import json
 import logging
 import tempfile
-import io
-from utils import process_single_page
+from utils import redact_page, find_text_coordinates_pymupdf, save_pdf
+from pipeline import analyze_document, redact_findings
 import fitz
-import concurrent.futures
+import time
+import admission
+import coalescing
+import fair_queue
+import httpx
+import metrics
+import profiling
+import results
+import tracing
+import webhooks
+import workers
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-@celery.task(name='app.purge_queue')
-def purge_queue():
-    """Leert die Celery Queue beim Worker-Start."""
+# Startzeiten laufender Tasks für die Admission-Control-Messung
+_task_started = {}
+
+@signals.task_prerun.connect
+def record_task_start(task_id=None, **kwargs):
+    _task_started[task_id] = time.monotonic()
+
+@signals.task_prerun.connect
+def record_worker_task(task_id=None, task=None, **kwargs):
+    """Remembers the worker running the task, so the task is released if the worker dies."""
+    if task.request.hostname:
+        workers.task_started(task.request.hostname, task_id)
+
+@signals.task_prerun.connect
+def start_task_span(task_id=None, task=None, **kwargs):
+    """Continues the trace of the upload that queued this task."""
+    tracing.start_task(task_id, task.name, task.request)
+
+@signals.task_prerun.connect
+def start_task_profile(task_id=None, task=None, kwargs=None, **signal_kwargs):
+    """Profiles the run if the upload asked for it or it was sampled (PROFILE_SAMPLE_RATE)."""
+    profiling.start_task(task_id, task.name, (kwargs or {}).get('options'))
+
+@signals.task_postrun.connect
+def end_task_profile(task_id=None, **kwargs):
+    profiling.end_task(task_id)
+
+@signals.task_postrun.connect
+def end_task_span(task_id=None, retval=None, state=None, **kwargs):
+    status = retval.get('status') if isinstance(retval, dict) else None
+    tracing.end_task(task_id, state=state, status=status)
+
+@signals.task_postrun.connect
+def release_admission(task_id=None, **kwargs):
+    """Gibt den Task in der Admission Control frei und misst die Seitenzeit."""
+    started = _task_started.pop(task_id, None)
+    admission.release(task_id, time.monotonic() - started if started is not None else None)
+
+@signals.task_postrun.connect
+def release_inflight_job(task_id=None, **kwargs):
+    """Lets the next identical upload start a new task."""
+    coalescing.release(task_id)
+
+@signals.task_postrun.connect
+def dispatch_fair_queue(task_id=None, **kwargs):
+    """Hands the freed dispatch slot to the next job in the fair queue."""
+    fair_queue.complete(task_id)
+
+@signals.task_postrun.connect
+def forget_worker_task(task_id=None, task=None, **kwargs):
+    if task.request.hostname:
+        workers.task_finished(task.request.hostname, task_id)
+
+def report_progress(task):
+    """Progress callback for the pipeline that updates the task state."""
+    def progress(current_page, total_pages):
+        task.update_state(state='PROGRESS',
+                          meta={'current_page': current_page,
+                                'total_pages': total_pages})
+    return progress
+
+def schedule_webhook(task_id, options):
+    """Queues the completion callback if the upload asked for one."""
+    callback_url = (options or {}).get('callback_url')
+    if not callback_url:
+        return
     try:
-        celery.control.purge()
-        logger.info("Successfully purged Celery queue")
+        deliver_webhook.apply_async(args=(task_id, callback_url), queue=FAST_QUEUE)
     except Exception as e:
-        logger.error(f"Error purging Celery queue: {e}")
+        # The result is stored either way; the caller can still poll /status
+        logger.error(f"Error scheduling webhook for task {task_id}: {e}")
 
-# Worker Signals für Queue-Bereinigung
-@signals.worker_ready.connect
-def clean_at_start(sender=None, conf=None, **kwargs):
-    """Wird ausgeführt, wenn der Worker startet."""
-    purge_queue.delay()
+def store_task_failure(task_id, error, options=None):
+    """Logs a failed task, records it in the result store and notifies the caller."""
+    logger.error(f"Error processing PDF for task {task_id}: {str(error)}")
+    logger.exception("Full traceback:")
+    try:
+        results.store_failure(task_id, str(error))
+    except Exception as store_error:
+        logger.error(f"Error storing failure for task {task_id}: {store_error}")
+    schedule_webhook(task_id, options)
+    return {
+        "status": "Failed",
+        "message": str(error)
+    }
 
 @celery.task(name='pdf_api.tasks.process_pdf', bind=True)
-def process_pdf(self, pdf_data, preferences):
-    """Process PDF and anonymize sensitive information."""
+def process_pdf(self, pdf_data, preferences, options=None):
+    """
+    Process PDF and anonymize sensitive information.
+    
+    Args:
+        pdf_data: PDF bytes
+        preferences: Anonymization preferences
+        options: Optional processing options, e.g. {'save_profile': 'web'}
+    """
     task_id = self.request.id
+    options = options or {}
     logger.info(f"Starting PDF processing task {task_id}")
     
     try:
@@ -38,9 +128,6 @@ def process_pdf(self, pdf_data, preferences):
             input_path = temp_input.name
             logger.info(f"Saved temporary input file: {input_path}")
 
-        # Create a BytesIO object to store the processed PDF
-        output_buffer = io.BytesIO()
-
         # Open the PDF with PyMuPDF
         doc = fitz.open(input_path)
         total_pages = len(doc)
@@ -49,51 +136,177 @@ def process_pdf(self, pdf_data, preferences):
         has_embedded_fonts = any(font[3] for font in doc.get_page_fonts(0))
         logger.info(f"PDF contains embedded fonts: {has_embedded_fonts}")
         
-        # Create arguments list for parallel processing
-        page_args = [(doc[i], i, total_pages, preferences) for i in range(total_pages)]
-        
-        # Process pages in parallel
-        processed_pages = {}
-        with concurrent.futures.ThreadPoolExecutor(max_workers=min(os.cpu_count(), total_pages)) as executor:
-            # Start parallel processing
-            future_to_page = {executor.submit(process_single_page, args): args[1] for args in page_args}
-            
-            # Collect results and update progress
-            completed_pages = 0
-            for future in concurrent.futures.as_completed(future_to_page):
-                completed_pages += 1
-                self.update_state(state='PROGRESS',
-                                meta={'current_page': completed_pages,
-                                     'total_pages': total_pages})
-                
-                try:
-                    page_num, processed_page = future.result()
-                    processed_pages[page_num] = processed_page
-                except Exception as e:
-                    logger.error(f"Error processing page {future_to_page[future]}: {str(e)}")
+        page_findings, dedup_stats = analyze_document(doc, preferences, report_progress(self))
+        if dedup_stats:
+            logger.info(f"Dedup for task {task_id}: {dedup_stats}")
+        redact_findings(doc, page_findings)
         
         # Save the redacted PDF
-        doc.save(output_buffer)
+        pdf_bytes = save_pdf(doc, options.get('save_profile'))
         doc.close()
         
         # Clean up temporary input file
         os.unlink(input_path)
         
-        # Get the PDF data from the buffer
-        pdf_bytes = output_buffer.getvalue()
+        # Store the document outside the result backend; the task result only
+        # carries the small metadata record
+        metadata = results.store_result(task_id, pdf_bytes, total_pages=total_pages)
         
+        schedule_webhook(task_id, options)
         logger.info(f"PDF processing completed successfully for task {task_id}")
         return {
             "status": "Completed",
             "message": "PDF processed successfully",
-            "pdf_data": pdf_bytes,
-            "total_pages": total_pages
+            "total_pages": total_pages,
+            "size": metadata['size'],
+            "sha256": metadata['sha256'],
+            "dedup": dedup_stats
+        }
+    
+    except Exception as e:
+        return store_task_failure(task_id, e, options)
+
+@celery.task(name='pdf_api.tasks.analyze_pdf', bind=True)
+def analyze_pdf(self, pdf_data, preferences, options=None):
+    """
+    Find sensitive information and return its coordinates without redacting.
+    
+    Runs the same detection as process_pdf but skips apply_redactions and
+    saving the document. The result is a JSON document with the findings
+    (text, type, confidence, rects) per page.
+    
+    Args:
+        pdf_data: PDF bytes
+        preferences: Anonymization preferences
+        options: Optional processing options, e.g. {'callback_url': 'https://...'}
+    """
+    task_id = self.request.id
+    logger.info(f"Starting PDF analysis task {task_id}")
+    
+    try:
+        doc = fitz.open(stream=pdf_data, filetype='pdf')
+        total_pages = len(doc)
+        
+        page_findings, dedup_stats = analyze_document(doc, preferences, report_progress(self))
+        if dedup_stats:
+            logger.info(f"Dedup for task {task_id}: {dedup_stats}")
+        doc.close()
+        
+        report = {
+            "total_pages": total_pages,
+            "pages": [
+                {
+                    "page": page_num + 1,
+                    "findings": page_findings.get(page_num, []),
+                    "analyzed": page_num in page_findings
+                }
+                for page_num in range(total_pages)
+            ]
+        }
+        findings_count = sum(len(page['findings']) for page in report['pages'])
+        
+        metadata = results.store_result(
+            task_id,
+            json.dumps(report, ensure_ascii=False).encode('utf-8'),
+            content_type='application/json',
+            total_pages=total_pages,
+            findings=findings_count
+        )
+        
+        schedule_webhook(task_id, options)
+        logger.info(f"PDF analysis completed for task {task_id}: {findings_count} findings")
+        return {
+            "status": "Completed",
+            "message": "PDF analyzed successfully",
+            "total_pages": total_pages,
+            "findings": findings_count,
+            "size": metadata['size'],
+            "sha256": metadata['sha256'],
+            "dedup": dedup_stats
         }
     
     except Exception as e:
-        logger.error(f"Error processing PDF for task {task_id}: {str(e)}")
-        logger.exception("Full traceback:")
+        return store_task_failure(task_id, e, options)
+
+@celery.task(name='pdf_api.tasks.redact_pdf', bind=True)
+def redact_pdf(self, pdf_data, terms, rectangles, options=None):
+    """
+    Redact caller-supplied terms and rectangles without any LLM calls.
+    
+    Terms are searched in the text layer of every page; pages without a
+    text layer are only redacted through rectangles.
+    
+    Args:
+        pdf_data: PDF bytes
+        terms: List of texts to redact wherever they occur
+        rectangles: Page index (as string, 0-based) -> list of [x0, y0, x1, y1]
+        options: Optional processing options, e.g. {'save_profile': 'web'}
+    """
+    task_id = self.request.id
+    options = options or {}
+    logger.info(f"Starting PDF redaction task {task_id}: {len(terms)} terms, "
+                f"rectangles on {len(rectangles)} pages")
+    
+    try:
+        doc = fitz.open(stream=pdf_data, filetype='pdf')
+        total_pages = len(doc)
+        
+        redactions = 0
+        for page_num, page in enumerate(doc):
+            rects = list(rectangles.get(str(page_num), []))
+            for term in terms:
+                rects.extend(find_text_coordinates_pymupdf(page, term))
+            with tracing.span('page.redact', page=page_num + 1, rects=len(rects)):
+                redactions += redact_page(page, page_num, rects)
+        
+        pdf_bytes = save_pdf(doc, options.get('save_profile'))
+        doc.close()
+        
+        metadata = results.store_result(task_id, pdf_bytes, total_pages=total_pages, redactions=redactions)
+        
+        schedule_webhook(task_id, options)
+        logger.info(f"PDF redaction completed for task {task_id}: {redactions} redactions")
         return {
-            "status": "Failed",
-            "message": str(e)
-        } 
\ No newline at end of file
+            "status": "Completed",
+            "message": "PDF redacted successfully",
+            "total_pages": total_pages,
+            "redactions": redactions,
+            "size": metadata['size'],
+            "sha256": metadata['sha256']
+        }
+    
+    except Exception as e:
+        return store_task_failure(task_id, e, options)
+
+@celery.task(name='pdf_api.tasks.deliver_webhook', bind=True, max_retries=WEBHOOK_MAX_ATTEMPTS - 1)
+def deliver_webhook(self, task_id, callback_url):
+    """
+    POSTs the result metadata of a finished task to the caller's callback URL.
+    
+    Connection errors, timeouts, 408, 429 and 5xx responses are retried with
+    exponential backoff; other client errors and exhausted retries end up in
+    the dead-letter list.
+    """
+    attempt = self.request.retries + 1
+    payload = webhooks.build_payload(task_id)
+    # Checked again at delivery time: DNS may have changed since the upload.
+    # The delivery connects to the checked address, not to a new lookup.
+    address, error = webhooks.resolve_callback(callback_url)
+    if error:
+        webhooks.dead_letter(task_id, callback_url, payload, error)
+        return {"status": "Failed", "attempts": attempt}
+    try:
+        webhooks.deliver(callback_url, payload, attempt, address)
+    except httpx.HTTPError as e:
+        status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+        retryable = status is None or status in (408, 429) or status >= 500
+        metrics.incr('webhooks.failed_attempts')
+        logger.warning(f"Webhook attempt {attempt} for task {task_id} failed: {e}")
+        if retryable and attempt < WEBHOOK_MAX_ATTEMPTS:
+            raise self.retry(exc=e, countdown=webhooks.backoff(attempt))
+        webhooks.dead_letter(task_id, callback_url, payload, str(e))
+        return {"status": "Failed", "attempts": attempt}
+    
+    metrics.incr('webhooks.delivered')
+    logger.info(f"Webhook for task {task_id} delivered to {callback_url} on attempt {attempt}")
+    return {"status": "Delivered", "attempts": attempt}
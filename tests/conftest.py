@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def local_metrics(monkeypatch):
+    """Keeps metrics in memory for the test instead of Redis."""
+    import metrics
+    monkeypatch.setattr(metrics, '_local', {})
+    return metrics
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """Points the shared Redis client (redis_store) at an in-memory fake."""
+    fakeredis = pytest.importorskip('fakeredis')
+    import redis_store
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(redis_store, '_client', client)
+    return client
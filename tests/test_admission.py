@@ -0,0 +1,33 @@
+import pytest
+
+import admission
+import workers
+
+
+@pytest.fixture
+def admission_on(fake_redis, local_metrics, monkeypatch):
+    monkeypatch.setattr(admission, 'ADMISSION_CONTROL_ENABLED', True)
+    monkeypatch.setattr(admission, 'ADMISSION_WORKER_SLOTS', 0)
+    monkeypatch.setattr(admission, 'ADMISSION_DEFAULT_SECONDS_PER_PAGE', 10)
+    return fake_redis
+
+
+def test_reset_clears_client_quota(admission_on, monkeypatch):
+    monkeypatch.setattr(admission, 'MAX_INFLIGHT_PER_CLIENT', 1)
+    admission.register('task-1', 'acme', 2)
+    assert admission.check('acme', 1)['reason'] == 'quota'
+
+    admission.reset()
+
+    assert admission.check('acme', 1)['admitted']
+    assert admission.pending_pages() == 0
+
+
+def test_wait_is_divided_by_live_worker_slots(admission_on):
+    admission.register('task-1', 'acme', 12)
+    assert admission.estimate_wait() == 120
+
+    workers.register('fast@h', ['pdf_fast'], 2)
+    workers.register('heavy@h', ['pdf_heavy'], 4)
+
+    assert admission.estimate_wait() == 20
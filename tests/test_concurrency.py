@@ -0,0 +1,32 @@
+import concurrency
+import metrics
+
+
+class Child:
+    def __init__(self, index):
+        self.index = index
+
+
+def test_each_pool_slot_publishes_its_own_limit(monkeypatch, local_metrics):
+    monkeypatch.setattr(concurrency.socket, 'gethostname', lambda: 'host')
+    for index, latency in ((0, 1.0), (1, 100.0)):
+        monkeypatch.setattr(concurrency, 'current_process', lambda index=index: Child(index))
+        limiter = concurrency.AdaptiveLimiter(initial=10)
+        for call in range(12):
+            limiter.acquire()
+            limiter.release('text', 1.0 if call == 0 else latency)
+
+    values = metrics.snapshot()
+    assert values['concurrency.limit.host.0'] > 10
+    assert values['concurrency.limit.host.1'] < 10
+    assert 'concurrency.limit' not in values
+
+
+def test_recycled_child_resumes_from_its_slot(monkeypatch, local_metrics):
+    monkeypatch.setattr(concurrency.socket, 'gethostname', lambda: 'host')
+    monkeypatch.setattr(concurrency, 'current_process', lambda: Child(1))
+    monkeypatch.setattr(concurrency, '_limiter', None)
+    metrics.set_gauge('concurrency.limit.host.0', 3)
+    metrics.set_gauge('concurrency.limit.host.1', 7)
+
+    assert concurrency.get_limiter().limit == 7
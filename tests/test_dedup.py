@@ -0,0 +1,60 @@
+import fitz
+import pytest
+
+import dedup
+import detectors
+import utils
+
+FOOTER = "Muster GmbH, Musterstrasse 1, 12345 Musterstadt\nHRB 12345, info@muster.de"
+
+
+@pytest.fixture
+def detector(monkeypatch, local_metrics):
+    backend = detectors.RulesBackend()
+    monkeypatch.setattr(detectors, '_detector', backend)
+    monkeypatch.setattr(dedup, 'DEDUP_MIN_BLOCK_CHARS', 20)
+    monkeypatch.setattr(dedup, 'DEDUP_MIN_BLOCK_PAGES', 2)
+    return backend
+
+
+def make_doc(bodies):
+    doc = fitz.open()
+    for body in bodies:
+        page = doc.new_page()
+        page.insert_text((72, 72), body)
+        page.insert_text((72, 780), FOOTER)
+    return doc
+
+
+def test_repeated_footer_is_left_out_of_page_text(detector):
+    doc = make_doc(["Erste Seite, Tel. 030 1234567", "Zweite Seite, Tel. 040 7654321"])
+    plan = dedup.plan_document(doc)
+    dedup.attach_page_contexts(doc, plan, [])
+
+    text = utils.format_page_text(doc[0])
+
+    assert "Erste Seite" in text
+    assert "Musterstrasse" not in text
+    assert "Musterstrasse" in doc.dedup_contexts[0]['removed_text']
+
+
+def test_rules_backend_saves_no_calls(detector):
+    doc = make_doc(["Gleiche Seite", "Gleiche Seite", "Andere Seite"])
+    plan = dedup.plan_document(doc)
+
+    stats = dedup.savings(doc, plan)
+
+    assert stats['duplicate_pages'] == 1
+    assert stats['calls_saved'] == 0
+    assert stats['tokens_saved'] == 0
+
+
+def test_calls_saved_counts_skipped_requests(detector, monkeypatch):
+    monkeypatch.setattr(detector, 'requests_per_text', 1)
+    monkeypatch.setattr(detector, 'supports_vision', True)
+    doc = make_doc(["Gleiche Seite", "Gleiche Seite", "Gleiche Seite", "Andere Seite"])
+    plan = dedup.plan_document(doc)
+
+    # Two duplicates skip a text and a vision request each; the repeated
+    # footer costs one text request
+    assert dedup.savings(doc, plan)['calls_saved'] == 3
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import fitz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from encoding_utils import get_page_pixmap
+
+
+def make_page():
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), "Max Mustermann, Tel. 030 1234567")
+    return doc, page
+
+
+def test_derived_pixmap_is_rgb_without_alpha():
+    doc, page = make_page()
+    rendered = get_page_pixmap(page, zoom=4)
+    derived = get_page_pixmap(page, zoom=1)
+
+    assert derived is not rendered
+    assert (derived.n, derived.alpha) == (3, 0)
+    assert (derived.width, derived.height) == (rendered.width // 4, rendered.height // 4)
+
+
+def test_derived_pixmap_matches_rgb_size():
+    doc, page = make_page()
+    get_page_pixmap(page, zoom=2)
+    derived = get_page_pixmap(page, zoom=1)
+
+    # ocr.py reads the samples with Image.frombytes("RGB", ...)
+    assert len(derived.samples) == derived.width * derived.height * 3
@@ -0,0 +1,68 @@
+import contextlib
+
+import pytest
+
+import admission
+import celery_app
+import fair_queue
+import workers
+
+
+@pytest.fixture
+def lanes(fake_redis, local_metrics, monkeypatch):
+    monkeypatch.setattr(fair_queue, 'FAIR_DISPATCH_WINDOW', 0)
+    monkeypatch.setattr(fair_queue, 'FAIR_MAX_RUNNING_PER_CLIENT', 0)
+    workers.register('fast@h', ['pdf_fast', 'pdf_tasks'], 1)
+    workers.register('heavy@h', ['pdf_heavy'], 1)
+    return fake_redis
+
+
+def enqueue(task_id, client_id, lane='heavy', cost=1.0):
+    fair_queue.enqueue(task_id, 'pdf_api.tasks.process_pdf', (), {}, client_id, lane, f"pdf_{lane}", cost)
+
+
+def test_backfill_does_not_hold_up_other_client(lanes):
+    sent = []
+    send = lambda job: sent.append(job['task_id'])
+    for i in range(5):
+        enqueue(f"backfill-{i}", 'batch', cost=10)
+    enqueue('interactive', 'web', cost=1)
+
+    fair_queue.dispatch('heavy', send)
+    fair_queue.complete(sent[-1], send)
+    fair_queue.complete(sent[-1], send)
+
+    # One slot: the interactive upload arrived last but is tagged ahead of
+    # the backfill's later jobs
+    assert sent == ['interactive', 'backfill-0', 'backfill-1']
+
+
+def test_worker_start_keeps_other_lanes(lanes, monkeypatch):
+    purged = []
+
+    class Channel:
+        def queue_purge(self, queue):
+            purged.append(queue)
+
+    @contextlib.contextmanager
+    def connection_for_write():
+        yield type('Connection', (), {'default_channel': Channel()})()
+
+    monkeypatch.setattr(celery_app.celery, 'connection_for_write', connection_for_write)
+    sent = []
+    send = lambda job: sent.append(job['task_id'])
+    enqueue('heavy-running', 'web')
+    fair_queue.dispatch('heavy', send)
+    enqueue('fast-lost', 'web', lane='fast')
+    fair_queue.dispatch('fast', send)
+    workers.task_started('fast@h', 'fast-lost')
+    admission.register('heavy-running', 'web', 3)
+
+    celery_app.purge_queue('fast@h', ['pdf_fast', 'pdf_tasks'])
+
+    assert purged == ['pdf_fast', 'pdf_tasks']
+    state = fair_queue.state()
+    assert state['lanes']['fast']['running'] == 0
+    assert state['lanes']['heavy']['running'] == 1
+    assert state['running_per_client'] == {'web': 1}
+    assert admission.pending_pages() == 3
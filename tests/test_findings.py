@@ -0,0 +1,50 @@
+import json
+
+import metrics
+import mistral
+import utils
+
+
+def response(*findings, **fields):
+    return json.dumps({"document_type": "letter", "findings": list(findings), **fields})
+
+
+def finding(**overrides):
+    item = {"text": " Jane Doe", "type": "names", "start_index": 10,
+            "confidence": 0.95, "reason": "Name of the addressee"}
+    item.update(overrides)
+    return {name: value for name, value in item.items() if value is not None}
+
+
+def test_parse_findings_drops_findings_violating_the_schema(local_metrics):
+    findings = mistral.parse_findings(response(
+        finding(),
+        finding(confidence="high"),
+        finding(text=None),
+        finding(start_index=-1),
+        finding(confidence=0.5),
+    ))
+
+    assert findings == [
+        {"text": "Jane Doe", "type": "names", "confidence": 0.95, "start_index": 11},
+        {"text": "Jane Doe", "type": "names", "confidence": 0.95},
+    ]
+    assert metrics.snapshot()["schema.invalid_findings"] == 2
+
+
+def test_parse_findings_rejects_malformed_responses(local_metrics):
+    assert mistral.parse_findings("not json") == []
+    assert mistral.parse_findings(response(findings={"text": "Jane Doe"})) == []
+    assert mistral.parse_findings(json.dumps(["Jane Doe"])) == []
+    assert metrics.snapshot()["schema.invalid_responses"] == 3
+
+
+def test_matches_near_offset():
+    text = "x" * 200 + " Contact: Jane Doe, Main Street 1 " + "y" * 200
+    start = text.index("Jane Doe")
+
+    assert utils.matches_near_offset({"text": "Jane Doe", "start_index": start}, text)
+    assert utils.matches_near_offset({"text": "Jane  doe", "start_index": start - 20}, text)
+    assert not utils.matches_near_offset({"text": "Jane Doe", "start_index": 0}, text)
+    assert not utils.matches_near_offset({"text": "Jane Doe", "start_index": len(text)}, text)
+    assert not utils.matches_near_offset({"text": "Jane Doe"}, text)
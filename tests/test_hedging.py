@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+import concurrency
+import hedging
+
+
+@pytest.fixture
+def hedge_setup(monkeypatch, local_metrics):
+    monkeypatch.setattr(hedging, '_trackers', {})
+    monkeypatch.setattr(hedging, '_budget', hedging.HedgeBudget(ratio=1.0))
+    monkeypatch.setattr(hedging, 'HEDGE_MIN_DELAY', 0.05)
+    tracker = hedging.get_tracker('text')
+    for _ in range(hedging.HEDGE_MIN_SAMPLES):
+        tracker.record(0.01)
+    return tracker
+
+
+def slow_then_fast():
+    attempts = []
+
+    def call():
+        attempts.append(len(attempts))
+
+        async def request(attempt=len(attempts) - 1):
+            await asyncio.sleep(2 if attempt == 0 else 0)
+            return f"attempt {attempt}"
+        return request()
+    return call, attempts
+
+
+def test_backup_runs_in_its_own_limiter_slot(monkeypatch, hedge_setup):
+    limiter = concurrency.AdaptiveLimiter(initial=2)
+    monkeypatch.setattr(concurrency, '_limiter', limiter)
+    call, attempts = slow_then_fast()
+
+    # The caller holds the slot of the primary request, as complete_chat does
+    limiter.acquire()
+    assert hedging.hedged_call('text', call) == "attempt 1"
+    limiter.discard()
+
+    assert len(attempts) == 2
+    assert limiter.inflight == 0
+
+
+def test_no_hedge_without_free_slot(monkeypatch, hedge_setup, local_metrics):
+    limiter = concurrency.AdaptiveLimiter(initial=1)
+    monkeypatch.setattr(concurrency, '_limiter', limiter)
+    monkeypatch.setattr(hedging, 'HEDGE_MIN_DELAY', 0.01)
+    attempts = []
+
+    def call():
+        attempts.append(1)
+        return asyncio.sleep(0.1, result="primary")
+
+    limiter.acquire()
+    assert hedging.hedged_call('text', call) == "primary"
+    limiter.discard()
+
+    assert len(attempts) == 1
+    assert local_metrics.get_value('hedge.text.no_slot') == 1
+    assert limiter.inflight == 0
+
+
+def test_abandoned_primary_is_recorded_as_censored_sample(monkeypatch, hedge_setup):
+    monkeypatch.setattr(concurrency, '_limiter', concurrency.AdaptiveLimiter(initial=4))
+    call, attempts = slow_then_fast()
+
+    hedging.hedged_call('text', call)
+
+    # Besides the backup's own latency the primary counts with at least the hedge delay
+    assert hedge_setup.count() == hedging.HEDGE_MIN_SAMPLES + 2
+    assert hedge_setup.percentile(100) >= 0.05
@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+import ocr_cache
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch, local_metrics):
+    monkeypatch.setattr(ocr_cache, 'OCR_CACHE_DIR', tmp_path)
+    scans = []
+    scandir = os.scandir
+    monkeypatch.setattr(os, 'scandir', lambda path: scans.append(path) or scandir(path))
+    return scans
+
+
+def entry(i):
+    # Incompressible, so every entry has about the same size on disk
+    return {'ocr_data': {'words': [os.urandom(1000)]}, 'seconds': i}
+
+
+def test_store_scans_only_when_limit_is_crossed(cache_dir, monkeypatch):
+    ocr_cache.store('first', entry(0))
+    size = (ocr_cache.OCR_CACHE_DIR / f"first{ocr_cache.ENTRY_SUFFIX}").stat().st_size
+    monkeypatch.setattr(ocr_cache, 'OCR_CACHE_MAX_BYTES', size * 5 + 10)
+    # The first store had no recorded total yet
+    assert len(cache_dir) == 1
+
+    for i in range(1, 5):
+        ocr_cache.store(f"entry-{i}", entry(i))
+    assert len(cache_dir) == 1
+
+    ocr_cache.store('overflow', entry(5))
+    assert len(cache_dir) == 2
+    assert ocr_cache.load('first') is None
+    assert ocr_cache.load('overflow')['seconds'] == 5
+
+
+def test_replacing_an_entry_keeps_the_total(cache_dir):
+    ocr_cache.store('key', entry(0))
+    ocr_cache.store('key', entry(1))
+
+    files = [path for path in ocr_cache.OCR_CACHE_DIR.iterdir() if path.name.endswith(ocr_cache.ENTRY_SUFFIX)]
+    recorded = int((ocr_cache.OCR_CACHE_DIR / ocr_cache.SIZE_FILE).read_text())
+    assert recorded == sum(path.stat().st_size for path in files)
@@ -0,0 +1,64 @@
+import threading
+
+import fitz
+import pytest
+
+import detectors
+import ocr
+import pipeline
+
+
+@pytest.fixture
+def rules_detector(monkeypatch, local_metrics):
+    detector = detectors.RulesBackend()
+    monkeypatch.setattr(detectors, '_detector', detector)
+    monkeypatch.setattr(pipeline, 'DEDUP_ENABLED', False)
+    return detector
+
+
+def test_ocr_page_is_located_in_batched_path(monkeypatch, rules_detector):
+    # Scanned page without text layer: Tesseract finds the word at
+    # (200, 100) in the zoom 2 rendering, Pixtral reads it from the image
+    monkeypatch.setattr(ocr, 'OCR_CACHE_ENABLED', False)
+    monkeypatch.setattr(ocr, 'run_tesseract', lambda page: {
+        'words': ['max@example.com'], 'conf': [90],
+        'left': [200], 'top': [100], 'width': [200], 'height': [20], 'zoom': 2
+    })
+    monkeypatch.setattr(rules_detector, 'describe_page', lambda page: "Kontakt: max@example.com")
+    doc = fitz.open()
+    doc.new_page()
+
+    page_findings, _ = pipeline.analyze_document(doc, {'emails': True})
+
+    assert [item['rects'] for item in page_findings[0]] == [[[100.0, 50.0, 200.0, 60.0]]]
+
+
+def test_batches_start_before_all_pages_are_extracted(monkeypatch, rules_detector):
+    monkeypatch.setattr(pipeline, 'DETECTOR_BATCH_PAGES', 2)
+    first_batch_sent = threading.Event()
+    batches = []
+
+    def extract_page_text(args):
+        page, page_num, total_pages, preferences = args
+        if page_num == 3:
+            # The last page only finishes once the first batch is analyzed
+            assert first_batch_sent.wait(5)
+        return page_num, f"Seite {page_num}: user{page_num}@example.com"
+
+    def analyze_texts(texts, preferences):
+        batches.append(len(texts))
+        first_batch_sent.set()
+        return detectors.RulesBackend.analyze_texts(rules_detector, texts, preferences)
+
+    monkeypatch.setattr(pipeline, 'extract_page_text', extract_page_text)
+    monkeypatch.setattr(rules_detector, 'analyze_texts', analyze_texts)
+    doc = fitz.open()
+    for _ in range(4):
+        doc.new_page()
+    progress = []
+
+    page_findings = pipeline.analyze_pages(doc, {'emails': True}, progress=lambda done, total: progress.append(done))
+
+    assert sorted(page_findings) == [0, 1, 2, 3]
+    assert sum(batches) == 4 and batches[0] == 2
+    assert progress == [1, 2, 3, 4]
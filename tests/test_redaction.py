@@ -0,0 +1,35 @@
+import fitz
+
+import redaction
+
+
+def coords(rects):
+    return sorted(tuple(round(value, 2) for value in rect) for rect in rects)
+
+
+def test_words_of_a_line_merge_into_one_rectangle():
+    planned = redaction.plan_redactions([
+        [100, 50, 130, 60], [130.5, 50, 170, 60], [171, 50, 200, 60],
+        [100, 50, 130, 60],   # duplicate
+        [110, 52, 120, 58],   # contained in the first word
+    ])
+    assert coords(planned) == [(100, 50, 200, 60)]
+
+
+def test_merges_chain_through_later_neighbours():
+    # The first two only become adjacent to the third once they are merged
+    planned = redaction.plan_redactions([[100, 50, 150, 60], [200, 50, 250, 60], [149, 50, 201, 60]])
+    assert coords(planned) == [(100, 50, 250, 60)]
+
+
+def test_distant_and_diagonal_rectangles_stay_apart():
+    planned = redaction.plan_redactions([
+        [100, 50, 150, 60], [160, 50, 200, 60],   # 10 points apart on one line
+        [400, 50, 500, 60], [50, 61, 150, 71],    # end of one line, start of the next
+    ])
+    assert coords(planned) == [(50, 61, 150, 71), (100, 50, 150, 60), (160, 50, 200, 60), (400, 50, 500, 60)]
+
+
+def test_empty_rectangles_are_dropped():
+    planned = redaction.plan_redactions([[100, 50, 100, 60], [200, 60, 150, 50], [10, 10, 20, 20]])
+    assert planned == [fitz.Rect(10, 10, 20, 20)]
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from kombu.serialization import dumps as kombu_dumps, loads as kombu_loads
+
+import serialization
+
+
+def test_round_trip_keeps_datetimes_and_bytes():
+    payload = {
+        'file': b'%PDF-1.7\x00\xff',
+        'submitted': datetime(2024, 5, 1, 12, 30, 15, 250000),
+        'eta': datetime(2024, 5, 1, 12, 30, tzinfo=timezone(timedelta(hours=2))),
+        'pages': {0: [[100.0, 50.0, 200.0, 60.0]]},
+        'types': {'emails'},
+    }
+
+    restored = serialization.loads(serialization.dumps(payload))
+
+    assert restored['file'] == payload['file']
+    assert restored['submitted'] == payload['submitted']
+    assert restored['eta'] == payload['eta'] and restored['eta'].utcoffset() == timedelta(hours=2)
+    assert restored['pages'] == payload['pages']
+    assert restored['types'] == ['emails']
+
+
+def test_registered_with_kombu():
+    serialization.register_serializer()
+    content_type, encoding, data = kombu_dumps({'at': datetime(2024, 1, 1)}, serializer=serialization.SERIALIZER_NAME)
+
+    assert content_type == serialization.CONTENT_TYPE
+    assert kombu_loads(data, content_type, encoding) == {'at': datetime(2024, 1, 1)}
+
+
+def test_unsupported_types_are_refused():
+    with pytest.raises(TypeError):
+        serialization.dumps({'value': object()})
@@ -0,0 +1,108 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import tasks
+import webhooks
+
+SECRET = 'test-secret'
+
+
+@pytest.fixture
+def receiver():
+    """Local receiver answering with the queued status codes, then 200."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers['Content-Length']))
+            server.deliveries.append((dict(self.headers), body))
+            self.send_response(server.statuses.pop(0) if server.statuses else 200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.deliveries = []
+    server.statuses = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def webhook_config(monkeypatch, fake_redis, local_metrics):
+    monkeypatch.setattr(webhooks, 'WEBHOOK_SECRET', SECRET)
+    monkeypatch.setattr(webhooks, 'WEBHOOK_ALLOWED_HOSTS', ['127.0.0.1'])
+    monkeypatch.setattr(tasks, 'WEBHOOK_MAX_ATTEMPTS', 3)
+    backoffs = []
+    monkeypatch.setattr(webhooks, 'backoff', lambda attempt: backoffs.append(attempt) or 0)
+    return backoffs
+
+
+def test_signature_verifies_and_rejects_tampering():
+    body = b'{"task_id": "t1"}'
+    timestamp = str(int(time.time()))
+    signature = webhooks.sign(body, timestamp, SECRET)
+
+    assert webhooks.verify(body, timestamp, signature, SECRET)
+    assert not webhooks.verify(body + b' ', timestamp, signature, SECRET)
+    assert not webhooks.verify(body, timestamp, signature, 'other-secret')
+    old = str(int(time.time()) - 3600)
+    assert not webhooks.verify(body, old, webhooks.sign(body, old, SECRET), SECRET)
+
+
+def test_private_address_is_refused(monkeypatch):
+    monkeypatch.setattr(webhooks, 'WEBHOOK_SECRET', SECRET)
+    monkeypatch.setattr(webhooks, 'WEBHOOK_ALLOWED_HOSTS', [])
+    monkeypatch.setattr(webhooks, 'WEBHOOK_ALLOW_PRIVATE', False)
+
+    assert webhooks.resolve_callback('http://127.0.0.1/hook')[1]
+    assert webhooks.resolve_callback('http://93.184.216.34/hook') == ('93.184.216.34', None)
+
+
+def test_delivery_connects_to_checked_address(receiver, webhook_config):
+    port = receiver.server_address[1]
+    payload = {"task_id": "t1", "event": "task.completed"}
+
+    # The host name does not resolve: the delivery must use the pinned address
+    webhooks.deliver(f"http://hooks.invalid:{port}/hook", payload, 1, address='127.0.0.1')
+
+    headers, body = receiver.deliveries[0]
+    assert headers['Host'] == f"hooks.invalid:{port}"
+    assert webhooks.verify(body, headers['X-Webhook-Timestamp'], headers['X-Webhook-Signature'], SECRET)
+    assert json.loads(body) == payload
+
+
+def test_failed_attempts_are_retried_with_backoff(receiver, webhook_config):
+    receiver.statuses = [503, 500]
+    url = f"http://127.0.0.1:{receiver.server_address[1]}/hook"
+
+    result = tasks.deliver_webhook.apply(args=('t1', url)).get()
+
+    assert result == {"status": "Delivered", "attempts": 3}
+    assert webhook_config == [1, 2]
+    assert [headers['X-Webhook-Attempt'] for headers, _ in receiver.deliveries] == ['1', '2', '3']
+    assert webhooks.dead_letters() == []
+
+
+def test_exhausted_attempts_are_dead_lettered(receiver, webhook_config):
+    receiver.statuses = [500, 500, 500]
+    url = f"http://127.0.0.1:{receiver.server_address[1]}/hook"
+
+    result = tasks.deliver_webhook.apply(args=('t1', url)).get()
+
+    assert result == {"status": "Failed", "attempts": 3}
+    assert [entry['task_id'] for entry in webhooks.dead_letters()] == ['t1']
+
+
+def test_client_errors_are_not_retried(receiver, webhook_config):
+    receiver.statuses = [404]
+    url = f"http://127.0.0.1:{receiver.server_address[1]}/hook"
+
+    result = tasks.deliver_webhook.apply(args=('t1', url)).get()
+
+    assert result == {"status": "Failed", "attempts": 1}
+    assert len(webhooks.dead_letters()) == 1
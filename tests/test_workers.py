@@ -0,0 +1,25 @@
+import workers
+
+
+def test_expired_heartbeat_drops_capacity(fake_redis):
+    assert workers.register('fast@h', ['pdf_fast'], 4)
+    assert not workers.register('fast@h', ['pdf_fast'], 4)
+    workers.register('heavy@h', ['pdf_heavy'], 2)
+    assert workers.capacity(['pdf_fast']) == 4
+    assert workers.capacity(['pdf_fast', 'pdf_heavy']) == 6
+
+    fake_redis.delete(workers._heartbeat_key('fast@h'))
+
+    assert workers.capacity(['pdf_fast']) == 0
+    assert list(workers.live()) == ['heavy@h']
+
+
+def test_dead_worker_is_reaped_once(fake_redis):
+    workers.register('fast@h', ['pdf_fast'], 1)
+    workers.task_started('fast@h', 'task-1')
+    workers.task_started('fast@h', 'task-2')
+    workers.task_finished('fast@h', 'task-2')
+    fake_redis.delete(workers._heartbeat_key('fast@h'))
+
+    assert workers.reap() == {'fast@h': ['task-1']}
+    assert workers.reap() == {}
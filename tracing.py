@@ -0,0 +1,331 @@
+from config import *
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import socket
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Trace position received from another process (W3C traceparent)
+SpanContext = namedtuple('SpanContext', 'trace_id span_id sampled')
+
+HOST = socket.gethostname()
+FLUSH_SIZE = 512
+
+_current = contextvars.ContextVar('current_span', default=None)
+_buffer: List[Dict[str, Any]] = []
+_buffer_lock = threading.Lock()
+_task_spans = {}
+# Batches waiting for the background exporter thread, see flush()
+_export_queue = None
+_exporter_pid = None
+_exporter_lock = threading.Lock()
+
+
+class Span:
+    """One timed operation of a trace. Unsampled spans only carry the IDs on."""
+
+    def __init__(self, name: str, parent=None, start: Optional[float] = None,
+                 flush_on_finish: bool = False, **attributes):
+        if parent is None:
+            self.trace_id = f"{random.getrandbits(128):032x}"
+            self.parent_id = None
+            self.sampled = random.random() < TRACE_SAMPLE_RATE
+        else:
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+            self.sampled = parent.sampled
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.name = name
+        self.start = start if start is not None else time.time()
+        self.end = None
+        self.attributes = attributes
+        self.error = None
+        # Local roots (request, task) export the spans collected below them
+        self.flush_on_finish = flush_on_finish or parent is None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def finish(self, end: Optional[float] = None) -> None:
+        self.end = end if end is not None else time.time()
+        if self.sampled:
+            _record(self)
+        if self.flush_on_finish:
+            flush()
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "end": self.end,
+            "duration_ms": round((self.end - self.start) * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+            "service": TRACE_SERVICE_NAME,
+            "host": HOST,
+            "pid": os.getpid()
+        }
+
+
+class _NoopSpan:
+    def set(self, **attributes) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Times a block as a child of the current span.
+
+    Without a current span a new trace is started. Exceptions are recorded on
+    the span and re-raised.
+    """
+    if not TRACING_ENABLED:
+        yield NOOP_SPAN
+        return
+    current = Span(name, parent=_current.get(), **attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        current.finish()
+
+
+def traced(name: str):
+    """Decorator form of span() for plain and async functions."""
+    def decorator(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def annotate(**attributes) -> None:
+    """Adds attributes to the current span, e.g. token counts once a response is in."""
+    current = _current.get()
+    if isinstance(current, Span):
+        current.set(**attributes)
+
+
+def bind(function: Callable) -> Callable:
+    """
+    Carries the current trace into another thread, e.g. for executor.submit.
+
+    contextvars are not inherited by pool threads; every call runs in its own
+    copy of the caller's context, so the result may be used concurrently.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(function, *args, **kwargs)
+    return run
+
+
+def inject() -> Dict[str, Any]:
+    """Task headers that continue the current trace in a worker."""
+    current = _current.get()
+    if not TRACING_ENABLED or current is None:
+        return {}
+    return {"traceparent": current.traceparent(), "trace_enqueued_at": time.time()}
+
+
+def extract(traceparent: Optional[str]) -> Optional[SpanContext]:
+    """Parses a W3C traceparent header, None if missing or malformed."""
+    try:
+        version, trace_id, span_id, flags = traceparent.split('-')
+        if len(trace_id) != 32 or len(span_id) != 16:
+            return None
+        return SpanContext(trace_id, span_id, int(flags, 16) & 1 == 1)
+    except (AttributeError, ValueError):
+        return None
+
+
+def start_task(task_id: str, task_name: str, request) -> None:
+    """
+    Opens the span of a Celery task in the worker (task_prerun).
+
+    The time between publishing and start is recorded as a queue.wait span.
+    Publisher and worker clocks may differ by their NTP offset.
+    """
+    if not TRACING_ENABLED:
+        return
+    # Custom message headers show up as attributes of the task request
+    parent = extract(getattr(request, 'traceparent', None))
+    now = time.time()
+    enqueued_at = getattr(request, 'trace_enqueued_at', None)
+    if parent is not None and enqueued_at:
+        Span('queue.wait', parent=parent, start=float(enqueued_at)).finish(end=now)
+    task_span = Span(f"task {task_name}", parent=parent, start=now, flush_on_finish=True, task_id=task_id)
+    _task_spans[task_id] = (task_span, _current.set(task_span))
+
+
+def end_task(task_id: str, **attributes) -> None:
+    """Closes and exports the span of a finished Celery task (task_postrun)."""
+    entry = _task_spans.pop(task_id, None)
+    if entry is None:
+        return
+    task_span, token = entry
+    task_span.set(**attributes)
+    try:
+        _current.reset(token)
+    except ValueError:
+        _current.set(None)
+    # Exported in the task's thread: the worker process may exit right after
+    task_span.flush_on_finish = False
+    task_span.finish()
+    flush(wait=True)
+
+
+def _record(finished: Span) -> None:
+    with _buffer_lock:
+        _buffer.append(finished.to_dict())
+        full = len(_buffer) >= FLUSH_SIZE
+    if full:
+        flush()
+
+
+def flush(wait: bool = False) -> None:
+    """
+    Exports the finished spans of this process. Export errors drop the spans.
+
+    By default the batch goes to a background thread, so request handlers and
+    the aiohttp event loop never wait for the file or the collector. With
+    wait=True everything pending is exported in the calling thread, e.g. at
+    the end of a worker task.
+    """
+    global _buffer
+    with _buffer_lock:
+        spans, _buffer = _buffer, []
+    if wait:
+        while _export_queue is not None and _exporter_pid == os.getpid():
+            try:
+                spans = _export_queue.get_nowait() + spans
+            except queue.Empty:
+                break
+        _export(spans)
+        return
+    if not spans:
+        return
+    try:
+        _exporter_queue().put_nowait(spans)
+    except queue.Full:
+        logger.warning(f"Dropping {len(spans)} spans, export queue is full")
+
+
+def _exporter_queue() -> queue.Queue:
+    """The export queue of this process, starting its thread on first use (also after a fork)."""
+    global _export_queue, _exporter_pid
+    with _exporter_lock:
+        if _exporter_pid != os.getpid():
+            _export_queue = queue.Queue(maxsize=TRACE_EXPORT_QUEUE)
+            _exporter_pid = os.getpid()
+            threading.Thread(target=_run_exporter, args=(_export_queue,), name='trace-exporter', daemon=True).start()
+        return _export_queue
+
+
+def _run_exporter(batches: queue.Queue) -> None:
+    while True:
+        _export(batches.get())
+
+
+def _export(spans: List[Dict[str, Any]]) -> None:
+    if not spans:
+        return
+    try:
+        if TRACE_EXPORTER == 'otlp':
+            _export_otlp(spans)
+        else:
+            _export_file(spans)
+    except Exception as e:
+        logger.warning(f"Dropping {len(spans)} spans, export failed: {e}")
+
+
+# Spans still queued when the process ends are exported before it exits
+atexit.register(flush, wait=True)
+
+
+def _export_file(spans: List[Dict[str, Any]]) -> None:
+    TRACE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    lines = ''.join(json.dumps(item, ensure_ascii=False, default=str) + '\n' for item in spans)
+    # One append per batch, so workers writing the same file do not interleave lines
+    with open(TRACE_FILE, 'a', encoding='utf-8') as f:
+        f.write(lines)
+
+
+def _otlp_value(value) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": name, "value": _otlp_value(value)} for name, value in attributes.items() if value is not None]
+
+
+def _export_otlp(spans: List[Dict[str, Any]]) -> None:
+    import httpx
+    body = {
+        "resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({
+                "service.name": TRACE_SERVICE_NAME,
+                "host.name": HOST,
+                "process.pid": os.getpid()
+            })},
+            "scopeSpans": [{
+                "scope": {"name": "pdf_api.tracing"},
+                "spans": [
+                    {
+                        "traceId": item['trace_id'],
+                        "spanId": item['span_id'],
+                        "parentSpanId": item['parent_id'] or "",
+                        "name": item['name'],
+                        "kind": 1,
+                        "startTimeUnixNano": str(int(item['start'] * 1e9)),
+                        "endTimeUnixNano": str(int(item['end'] * 1e9)),
+                        "attributes": _otlp_attributes(item['attributes']),
+                        "status": {"code": 2, "message": item['error']} if item['error'] else {"code": 1}
+                    }
+                    for item in spans
+                ]
+            }]
+        }]
+    }
+    httpx.post(TRACE_COLLECTOR_URL, json=body, timeout=TRACE_EXPORT_TIMEOUT).raise_for_status()
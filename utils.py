@@ -1,13 +1,19 @@
-from typing import Tuple, Dict, Any
+from typing import Tuple, Dict, Any, List
 from config import *
 import fitz
+import io
 import logging
 import os
 import re
+import time
 from collections import defaultdict
 from thefuzz import fuzz
-from mistral import analyze_text_with_mistral, analyze_page_with_pixtral
+from detectors import get_detector
 from ocr import perform_ocr_and_add_text_layer
+from encoding_utils import clear_render_cache
+import metrics
+from redaction import plan_redactions, image_mode
+import tracing
 
 logger = logging.getLogger(__name__)
 
@@ -24,83 +30,274 @@ def process_single_page(args: Tuple[fitz.Page, int, int, Dict[str, Any]]) -> Tup
         Tuple containing (page_num, processed_page)
     """
     page, page_num, total_pages, preferences = args
+    page_num, findings = analyze_single_page(args)
+    
+    # Wende alle gefundenen Stellen als Schwärzungen an
+    redact_page(page, page_num, [rect for finding in findings for rect in finding['rects']])
+    
+    return page_num, page
+
+def analyze_single_page(args: Tuple[fitz.Page, int, int, Dict[str, Any]]) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    Analysiert eine einzelne PDF-Seite, ohne sie zu verändern.
+    
+    Für ganze Dokumente übergibt pipeline.analyze_pages die Seitentexte
+    stattdessen gebündelt an das Detector-Backend.
+    
+    Args:
+        args: Tuple containing (page, page_num, total_pages, preferences)
+        
+    Returns:
+        Tuple containing (page_num, findings). Jedes Finding enthält text, type,
+        confidence und rects (Liste von [x0, y0, x1, y1] in PDF-Koordinaten).
+    """
+    page, page_num, total_pages, preferences = args
+    page_num, text = extract_page_text(args)
+    
+    # Analyze text for sensitive information
+    sensitive_data = get_detector().analyze_text(text, preferences)
+    return page_num, finish_page_analysis(page, text, sensitive_data)
+
+def extract_page_text(args: Tuple[fitz.Page, int, int, Dict[str, Any]]) -> Tuple[int, str]:
+    """
+    Extrahiert den an das Detector-Backend übergebenen Text einer Seite
+    (mit OCR und Bildbeschreibung, ohne dokumentweit analysierte Blöcke).
+    
+    Args:
+        args: Tuple containing (page, page_num, total_pages, preferences)
+        
+    Returns:
+        Tuple containing (page_num, text)
+    """
+    page, page_num, total_pages, preferences = args
     logger.info(f"Processing page {page_num+1}/{total_pages}")
     
     # Extract text using PyMuPDF
     text = format_page_text(page)
+    clear_render_cache(page)
     logger.debug(f"Extracted text from page {page_num+1}")
+    return page_num, text
+
+def finish_page_analysis(page, text: str, sensitive_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Konsolidiert, validiert und lokalisiert die Findings des Backends für eine Seite.
     
-    # Analyze text for sensitive information
-    sensitive_data = analyze_text_with_mistral(text, preferences)
+    Args:
+        page: PyMuPDF-Seite
+        text (str): Der mit extract_page_text ermittelte und analysierte Text
+        sensitive_data (list): Findings des Detector-Backends für diesen Text
+        
+    Returns:
+        list: Findings mit text, type, confidence und rects
+    """
+    page_num = page.number
     logger.info(f"Found {len(sensitive_data)} potential sensitive items on page {page_num+1}")
     
+    # Findings aus seitenübergreifend wiederholten Blöcken (Kopf-/Fußzeilen)
+    # wurden einmal für das ganze Dokument ermittelt
+    dedup_context = get_dedup_context(page)
+    if dedup_context:
+        sensitive_data = sensitive_data + dedup_context['shared_findings']
+    
     # Konsolidiere die Findings
     consolidated_data = consolidate_findings(sensitive_data)
     logger.info(f"Consolidated to {len(consolidated_data)} unique items")
     
     # Validate sensitive data exists in text
-    validated_sensitive_data = []
-    for item in consolidated_data:
-        normalized_text = normalize_text(item['text'])
-        normalized_page_text = normalize_text(text)
+    validation_text = text + "\n" + dedup_context['removed_text'] if dedup_context else text
+    validated_sensitive_data = validate_findings(consolidated_data, validation_text)
+    
+    logger.info(f"Validated {len(validated_sensitive_data)} of {len(consolidated_data)} sensitive items on page {page_num+1}")
+    
+    return locate_findings(page, validated_sensitive_data)
+
+def get_dedup_context(page):
+    """Liefert den von dedup.attach_page_contexts am Dokument hinterlegten Kontext der Seite."""
+    return getattr(page.parent, 'dedup_contexts', {}).get(page.number)
+
+def matches_near_offset(item, text):
+    """
+    Prüft ein Finding nur im Textfenster um seinen start_index.
+    
+    Das Fenster ist um VERIFY_OFFSET_SLACK Zeichen (mindestens die Länge des
+    Findings) größer als der Text, da Modelle Positionen oft nur ungefähr
+    angeben. Der Aufwand ist damit O(len(item['text'])) statt O(len(text)).
+    """
+    start = item.get('start_index')
+    if start is None or start >= len(text):
+        return False
+    slack = max(VERIFY_OFFSET_SLACK, len(item['text']))
+    window = text[max(0, start - slack):start + len(item['text']) + slack]
+    return fuzz.partial_ratio(normalize_text(item['text']), normalize_text(window)) > 85
+
+def matches_anywhere(normalized_text, normalized_page_text):
+    """Unscharfe Suche über den gesamten Text (Fallback ohne gültigen Offset)."""
+    return any(
+        fuzz.ratio(normalized_text, normalized_page_text[i:i+len(normalized_text)]) > 85
+        for i in range(len(normalized_page_text)-len(normalized_text)+1)
+    )
+
+def validate_findings(items, text):
+    """
+    Verwirft Findings, deren Text nicht (unscharf) im analysierten Text vorkommt.
+    
+    Findings mit start_index werden zuerst im Fenster um diese Position
+    geprüft; erst wenn sie dort nicht vorkommen, wird der gesamte Text
+    durchsucht. Trefferquoten und Laufzeiten landen in den verify.*-Metriken.
+    
+    Args:
+        items (list): Findings mit text, type und optional start_index
+        text (str): Der an das Modell übergebene Text
+        
+    Returns:
+        list: Die validierten Findings
+    """
+    validated = []
+    normalized_page_text = None
+    stats = defaultdict(float)
+    
+    for item in items:
+        started = time.perf_counter()
+        if matches_near_offset(item, text):
+            stats['offset_hits'] += 1
+            stats['offset_seconds'] += time.perf_counter() - started
+            validated.append(item)
+            logger.info(f"Validated sensitive text at offset {item['start_index']}: '{item['text']}'")
+            continue
+        stats['offset_misses' if 'start_index' in item else 'no_offset'] += 1
+        
+        # Fuzzy Matching über den gesamten Text
+        if normalized_page_text is None:
+            normalized_page_text = normalize_text(text)
+        found = matches_anywhere(normalize_text(item['text']), normalized_page_text)
+        stats['fullscan_count'] += 1
+        stats['fullscan_seconds'] += time.perf_counter() - started
         
-        # Fuzzy Matching für die Validierung
-        if any(ratio > 85 for ratio in [
-            fuzz.ratio(normalized_text, substr) 
-            for substr in [normalized_page_text[i:i+len(normalized_text)] 
-                         for i in range(len(normalized_page_text)-len(normalized_text)+1)]
-        ]):
-            validated_sensitive_data.append(item)
+        if found:
+            validated.append(item)
             logger.info(f"Validated sensitive text: '{item['text']}'")
         else:
             logger.warning(f"Ignoring hallucinated text not found in document: '{item['text']}'")
     
-    logger.info(f"Validated {len(validated_sensitive_data)} of {len(consolidated_data)} sensitive items on page {page_num+1}")
+    record_verification_stats(stats)
+    return validated
+
+def record_verification_stats(stats):
+    """
+    Schreibt die Statistik einer Validierung in die verify.*-Metriken.
     
-    # Process each validated sensitive item
-    applied_redactions = set()  # Verhindere doppelte Schwärzungen
-    redactions_added = False  # Flag für Redactions auf dieser Seite
+    Die eingesparte Zeit wird geschätzt: Jeder Offset-Treffer hätte sonst
+    einen vollständigen Scan gekostet, dessen Dauer dem bisherigen
+    Durchschnitt entspricht.
+    """
+    if not stats:
+        return
+    for name, value in stats.items():
+        metrics.incr(f"verify.{name}", value)
     
-    for item in validated_sensitive_data:
+    if stats['offset_hits']:
+        fullscan_count = metrics.get_value('verify.fullscan_count')
+        if fullscan_count:
+            mean_fullscan = metrics.get_value('verify.fullscan_seconds') / fullscan_count
+            saved = stats['offset_hits'] * mean_fullscan - stats['offset_seconds']
+            metrics.incr('verify.seconds_saved', max(0.0, saved))
+
+def locate_findings(page, items):
+    """
+    Sucht die Koordinaten aller Vorkommen der Findings auf der Seite.
+    
+    Args:
+        page: PyMuPDF-Seite
+        items (list): Findings mit text und type
+        
+    Returns:
+        list: Findings mit zusätzlicher Liste rects; Findings ohne Fundstelle entfallen
+    """
+    is_ocr_text = needs_ocr(page)
+    located = []
+    
+    for item in items:
         try:
             # Finde alle Vorkommen des Texts
             coords_list = find_text_coordinates_pymupdf(
                 page, 
                 item['text'],
-                is_ocr_text=needs_ocr(page)
+                is_ocr_text=is_ocr_text
             )
             
             if coords_list:
-                for coords in coords_list:
-                    coord_key = f"{coords[0]:.1f},{coords[1]:.1f},{coords[2]:.1f},{coords[3]:.1f}"
-                    
-                    if coord_key not in applied_redactions:
-                        # Create redaction annotation
-                        page.add_redact_annot(
-                            fitz.Rect(coords),
-                            fill=REDACTION_FILL_COLOR
-                        )
-                        applied_redactions.add(coord_key)
-                        redactions_added = True
-                        
-                        logger.info(f"Added redactionat {coord_key}")
+                # start_index bezieht sich auf den Prompt-Text, nicht auf die Seite
+                located.append({
+                    **{k: v for k, v in item.items() if k != 'start_index'},
+                    'rects': [[round(float(c), 2) for c in coords] for coords in coords_list]
+                })
             else:
-            
                 logger.warning(f"No valid coordinates found")
                 
         except Exception as e:
             logger.error(f"Error processing sensitive item: {str(e)}")
             continue
     
+    return located
+
+def redact_page(page, page_num, rects):
+    """
+    Schwärzt die angegebenen Rechtecke auf einer Seite.
+    
+    Überlappende und benachbarte Rechtecke werden vorher vereinigt
+    (redaction.plan_redactions); Bilder werden nur bearbeitet, wenn eine
+    Schwärzung sie berührt.
+    
+    Args:
+        page: PyMuPDF-Seite
+        page_num (int): Seitenindex (0-basiert), nur für das Logging
+        rects (list): Rechtecke als [x0, y0, x1, y1]
+        
+    Returns:
+        int: Anzahl der angelegten Schwärzungen
+    """
+    planned = plan_redactions(rects)
+    
+    for rect in planned:
+        # Create redaction annotation
+        page.add_redact_annot(rect, fill=REDACTION_FILL_COLOR)
+        logger.debug(f"Added redaction at {rect}")
+    
     # Wende alle Redactions auf der Seite an
-    if redactions_added:
+    if planned:
+        images = image_mode(page, planned)
         try:
-            page.apply_redactions()
-            logger.info(f"Applied all redactions on page {page_num+1}")
+            page.apply_redactions(images=images)
+            logger.info(f"Applied {len(planned)} redactions (merged from {len(rects)}) on page {page_num+1}"
+                        f"{'' if images == fitz.PDF_REDACT_IMAGE_NONE else ', including image pixels'}")
         except Exception as e:
             logger.error(f"Error applying redactions on page {page_num+1}: {str(e)}")
     
-    return page_num, page
+    return len(planned)
+
+@tracing.traced('pdf.save')
+def save_pdf(doc, profile_name=None):
+    """
+    Speichert ein Dokument mit einem Save-Profil aus PDF_SAVE_PROFILES.
+    
+    Args:
+        doc: PyMuPDF-Dokument
+        profile_name: Name des Profils, None für PDF_SAVE_PROFILE
+        
+    Returns:
+        bytes: Das gespeicherte PDF
+    """
+    profile_name = profile_name or PDF_SAVE_PROFILE
+    save_options = PDF_SAVE_PROFILES[profile_name]
+    
+    output_buffer = io.BytesIO()
+    started = time.perf_counter()
+    doc.save(output_buffer, **save_options)
+    pdf_bytes = output_buffer.getvalue()
+    tracing.annotate(profile=profile_name, bytes=len(pdf_bytes))
+    logger.info(f"Saved PDF with profile '{profile_name}': {len(pdf_bytes)} bytes "
+                f"in {time.perf_counter() - started:.3f}s")
+    return pdf_bytes
 
 def format_page_text(page):
     """Formatiert den Text einer PDF-Seite in verschiedenen Formaten."""
@@ -117,8 +314,19 @@ def format_page_text(page):
         else:
             text = page.get_text("text").strip()
         
-        # Hole Pixtral-Analyse
-        pixtral_analysis = analyze_page_with_pixtral(page)
+        # Lasse wiederholte Blöcke weg, die bereits dokumentweit analysiert
+        # wurden. Sie werden über ihre Position in derselben Blockextraktion
+        # wie in dedup.plan_document gewählt, da ihr Text nicht zeichengenau
+        # mit get_text("text") übereinstimmen muss.
+        dedup_context = get_dedup_context(page)
+        if dedup_context:
+            text = "".join(
+                block[4] for index, block in enumerate(page.get_text("blocks"))
+                if block[6] == 0 and index not in dedup_context['block_indexes']
+            ).strip()
+        
+        # Hole Bildanalyse (z.B. Pixtral), sofern das Backend sie unterstützt
+        pixtral_analysis = get_detector().describe_page(page)
         
         # Kombiniere die Formate
         combined_text = (
@@ -0,0 +1,170 @@
+from config import *
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import socket
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlparse
+import metrics
+import results
+from redis_store import get_redis, key
+
+logger = logging.getLogger(__name__)
+
+DEAD_LETTER_KEY = key('webhooks', 'dead')
+
+# Metadata fields passed on to the receiver
+PAYLOAD_FIELDS = ('content_type', 'size', 'sha256', 'total_pages', 'findings', 'redactions', 'message')
+
+
+def resolve_callback(url: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Checks a callback URL and picks the address deliveries connect to.
+
+    Callbacks need a WEBHOOK_SECRET to be signed with. Hosts resolving to
+    private, loopback or link-local addresses are refused, so API clients
+    cannot make the workers POST into the internal network, unless the host
+    is listed in WEBHOOK_ALLOWED_HOSTS or WEBHOOK_ALLOW_PRIVATE is set.
+
+    Returns:
+        Tuple of (address, error): the checked IP address to connect to
+        (None where the host is trusted and resolved as usual), and an
+        error message for an unusable URL
+    """
+    if not WEBHOOK_SECRET:
+        return None, "Callbacks are disabled on this server (no WEBHOOK_SECRET configured)."
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        return None, "The callback URL must be an absolute http or https URL."
+    if WEBHOOK_ALLOWED_HOSTS:
+        if parsed.hostname not in WEBHOOK_ALLOWED_HOSTS:
+            return None, f"The host '{parsed.hostname}' is not allowed for callbacks."
+        return None, None
+    if WEBHOOK_ALLOW_PRIVATE:
+        return None, None
+    try:
+        infos = socket.getaddrinfo(parsed.hostname, parsed.port or (443 if parsed.scheme == 'https' else 80),
+                                   proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError):
+        return None, f"The host '{parsed.hostname}' cannot be resolved."
+    addresses = list(dict.fromkeys(info[4][0].split('%')[0] for info in infos))
+    for address in addresses:
+        if not ipaddress.ip_address(address).is_global:
+            return None, f"The host '{parsed.hostname}' resolves to a non-public address."
+    return addresses[0], None
+
+
+def check_callback_url(url: str) -> Optional[str]:
+    """Returns an error message for an unusable callback URL, None if it is fine."""
+    return resolve_callback(url)[1]
+
+
+def pin_request(url: str, address: str) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+    """
+    Rewrites a request to connect to an already checked address.
+
+    A second DNS lookup by the HTTP client could return an internal address
+    (DNS rebinding), so the URL carries the IP; the original host goes into
+    the Host header and, for https, the TLS server name, against which the
+    certificate is still verified.
+
+    Returns:
+        Tuple of (url, headers, httpx extensions)
+    """
+    parsed = urlparse(url)
+    host = f"[{address}]" if ':' in address else address
+    netloc = host if parsed.port is None else f"{host}:{parsed.port}"
+    extensions = {'sni_hostname': parsed.hostname} if parsed.scheme == 'https' else {}
+    return parsed._replace(netloc=netloc).geturl(), {'Host': parsed.netloc.rsplit('@', 1)[-1]}, extensions
+
+
+def build_payload(task_id: str) -> Dict[str, Any]:
+    """Describes the finished task from its result metadata, with a download link."""
+    metadata = results.get_metadata(task_id) or {"status": "Failed", "message": "Result not found"}
+    payload = {
+        "event": "task.completed" if metadata['status'] == 'Completed' else "task.failed",
+        "task_id": task_id,
+        "status": metadata['status'],
+        **{name: metadata[name] for name in PAYLOAD_FIELDS if name in metadata}
+    }
+    if metadata['status'] == 'Completed':
+        payload['download_url'] = f"{PUBLIC_BASE_URL}/status/{task_id}"
+        payload['expires_at'] = metadata['completed_at'] + RESULT_TTL_SECONDS
+    return payload
+
+
+def sign(body: bytes, timestamp: str, secret: Optional[str] = None) -> str:
+    """HMAC-SHA256 over '<timestamp>.<body>', as sent in X-Webhook-Signature (WEBHOOK_SECRET by default)."""
+    secret = secret or WEBHOOK_SECRET
+    message = timestamp.encode() + b'.' + body
+    return 'sha256=' + hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def verify(body: bytes, timestamp: str, signature: str, secret: Optional[str] = None,
+           max_age: float = 300) -> bool:
+    """Receiver-side check of a delivery, rejecting replays older than max_age seconds."""
+    if abs(time.time() - float(timestamp)) > max_age:
+        return False
+    return hmac.compare_digest(sign(body, timestamp, secret), signature)
+
+
+def deliver(callback_url: str, payload: Dict[str, Any], attempt: int, address: Optional[str] = None) -> None:
+    """
+    POSTs one signed delivery.
+
+    Args:
+        address: IP address checked by resolve_callback to connect to, None
+            to resolve the host as usual
+
+    Raises:
+        httpx.HTTPError: On connection errors, timeouts and non-2xx responses
+    """
+    # Only workers deliver; keeps httpx out of the API processes
+    import httpx
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    timestamp = str(int(time.time()))
+    headers = {
+        'Content-Type': 'application/json',
+        'X-Webhook-Id': payload['task_id'],
+        'X-Webhook-Event': payload['event'],
+        'X-Webhook-Attempt': str(attempt),
+        'X-Webhook-Timestamp': timestamp,
+        'X-Webhook-Signature': sign(body, timestamp)
+    }
+    url, extensions = callback_url, {}
+    if address:
+        url, host_header, extensions = pin_request(callback_url, address)
+        headers.update(host_header)
+    with httpx.Client(timeout=WEBHOOK_TIMEOUT) as client:
+        response = client.post(url, content=body, headers=headers, extensions=extensions)
+    response.raise_for_status()
+
+
+def backoff(attempt: int) -> float:
+    """Delay before the next attempt: WEBHOOK_BACKOFF_BASE doubled per attempt."""
+    return min(WEBHOOK_BACKOFF_BASE * 2 ** (attempt - 1), WEBHOOK_BACKOFF_MAX)
+
+
+def dead_letter(task_id: str, callback_url: str, payload: Dict[str, Any], error: str) -> None:
+    """Keeps a delivery that exhausted its attempts for inspection or manual replay."""
+    entry = json.dumps({
+        "task_id": task_id,
+        "callback_url": callback_url,
+        "payload": payload,
+        "error": error,
+        "failed_at": time.time()
+    })
+    pipe = get_redis().pipeline()
+    pipe.lpush(DEAD_LETTER_KEY, entry)
+    pipe.ltrim(DEAD_LETTER_KEY, 0, WEBHOOK_DEAD_LETTER_MAX - 1)
+    pipe.execute()
+    metrics.incr('webhooks.dead_lettered')
+    logger.error(f"Webhook for task {task_id} to {callback_url} moved to the dead-letter list: {error}")
+
+
+def dead_letters(limit: int = 100):
+    """Returns the most recent dead-lettered deliveries."""
+    return [json.loads(entry) for entry in get_redis().lrange(DEAD_LETTER_KEY, 0, limit - 1)]
@@ -0,0 +1,126 @@
+from config import *
+import json
+import logging
+from typing import Any, Dict, Iterable, List
+import redis
+from redis_store import get_redis, key
+
+logger = logging.getLogger(__name__)
+
+# Registry of the Celery workers: their concurrency and queues, a heartbeat
+# key that expires unless the worker renews it (celery_app), and the tasks
+# each worker is running, so the state of a worker that stopped can be
+# released without touching the other workers.
+
+WORKERS_KEY = key('workers')
+
+
+def _heartbeat_key(hostname: str) -> str:
+    return key('workers', 'heartbeat', hostname)
+
+
+def _tasks_key(hostname: str) -> str:
+    return key('workers', 'tasks', hostname)
+
+
+def register(hostname: str, queues: Iterable[str], concurrency: int) -> bool:
+    """
+    Registers a worker or renews its heartbeat for WORKER_HEARTBEAT_TTL seconds.
+
+    Returns:
+        bool: True if the worker was not live before (started, or its
+        heartbeat had expired), so its capacity is new to the dispatchers
+    """
+    try:
+        pipe = get_redis().pipeline()
+        pipe.exists(_heartbeat_key(hostname))
+        pipe.set(_heartbeat_key(hostname), 1, ex=WORKER_HEARTBEAT_TTL)
+        pipe.hset(WORKERS_KEY, hostname, json.dumps({"concurrency": concurrency, "queues": sorted(queues)}))
+        was_live, *_ = pipe.execute()
+    except redis.RedisError as e:
+        logger.error(f"Error registering worker {hostname}: {e}")
+        return False
+    if not was_live:
+        logger.info(f"Worker {hostname} is live with {concurrency} slots on {', '.join(sorted(queues))}")
+    return not was_live
+
+
+def unregister(hostname: str) -> None:
+    """Removes a stopping worker; the tasks it ran are released by whoever reaps it."""
+    try:
+        pipe = get_redis().pipeline()
+        pipe.delete(_heartbeat_key(hostname))
+        pipe.hdel(WORKERS_KEY, hostname)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.error(f"Error unregistering worker {hostname}: {e}")
+
+
+def live(client=None) -> Dict[str, Dict[str, Any]]:
+    """Registered workers whose heartbeat has not expired: hostname -> {concurrency, queues}."""
+    client = client or get_redis()
+    registered = client.hgetall(WORKERS_KEY)
+    if not registered:
+        return {}
+    hostnames = list(registered)
+    beats = client.mget([_heartbeat_key(hostname.decode()) for hostname in hostnames])
+    return {
+        hostname.decode(): json.loads(registered[hostname])
+        for hostname, beat in zip(hostnames, beats)
+        if beat is not None
+    }
+
+
+def capacity(queues: Iterable[str], client=None) -> int:
+    """Summed concurrency of the live workers consuming any of the queues."""
+    queues = set(queues)
+    return sum(
+        worker['concurrency']
+        for worker in live(client).values()
+        if queues.intersection(worker['queues'])
+    )
+
+
+def task_started(hostname: str, task_id: str) -> None:
+    try:
+        get_redis().sadd(_tasks_key(hostname), task_id)
+    except redis.RedisError as e:
+        logger.error(f"Error recording task {task_id} on worker {hostname}: {e}")
+
+
+def task_finished(hostname: str, task_id: str) -> None:
+    try:
+        get_redis().srem(_tasks_key(hostname), task_id)
+    except redis.RedisError as e:
+        logger.error(f"Error recording end of task {task_id} on worker {hostname}: {e}")
+
+
+def take_tasks(hostname: str) -> List[str]:
+    """Returns and forgets the tasks recorded as running on a worker, atomically."""
+    pipe = get_redis().pipeline()
+    pipe.smembers(_tasks_key(hostname))
+    pipe.delete(_tasks_key(hostname))
+    task_ids, _ = pipe.execute()
+    return sorted(task_id.decode() for task_id in task_ids)
+
+
+def reap() -> Dict[str, List[str]]:
+    """
+    Unregisters workers whose heartbeat expired (killed without a clean
+    shutdown) and returns the tasks they were running, hostname -> task IDs.
+
+    Several live workers may reap at the same time; each dead worker is
+    returned by exactly one of them.
+    """
+    client = get_redis()
+    registered = client.hkeys(WORKERS_KEY)
+    if not registered:
+        return {}
+    hostnames = [hostname.decode() for hostname in registered]
+    beats = client.mget([_heartbeat_key(hostname) for hostname in hostnames])
+    reaped = {}
+    for hostname, beat in zip(hostnames, beats):
+        if beat is None and client.hdel(WORKERS_KEY, hostname):
+            reaped[hostname] = take_tasks(hostname)
+            logger.warning(f"Worker {hostname} missed its heartbeat, releasing {len(reaped[hostname])} tasks")
+    return reaped